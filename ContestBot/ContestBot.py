@@ -1,13 +1,48 @@
+import atexit
+import gzip
+import os
+import queue
 import random
+import shutil
 import time
 import tweepy
 import logging
+import logging.handlers
 import sys
 
 import config
+import metrics
+from archive import ArchiveWriter
+from caches import LRUCache
+from classifier import ContestClassifier
+from fingerprint import FingerprintIndex, simhash
+from journal import ActionJournal
+from matcher import KeywordMatcher
+from ratelimit import ScheduledAPI
+from records import TweetRecord
+from settings import Settings
+from storage import FollowingCache, RunState, SearchCheckpoints, SeenIndex
+
+ACTIONS = ("retweet", "like", "follow", "comment", "tag", "dm")
+STATUS_LOOKUP_BATCH_SIZE = 100  # max ids per statuses/lookup request
+SEARCH_PAGE_SIZE = 100  # max tweets per search/tweets request
+USER_LOOKUP_BATCH_SIZE = 100  # max ids per users/lookup request
+USER_CACHE_SIZE = 5000  # user id -> screen name pairs kept by lookup_users()
+REPLAYED = "replayed"  # perform_actions() result of an action an earlier run already did, see _journaled()
+
+_default_matcher = None
+_screen_names = LRUCache(USER_CACHE_SIZE)
+_log_listener = None
 
 
 def initialize_logger():
+    """
+    Creates the logger. Records are formatted on the logging thread and handed to a queue, a background thread writes
+    them and rotates the log files, so console and SD card writes never block the bot. File logs rotate at
+    config.log_max_bytes and old files are gzip compressed.
+    Calling it again replaces the handlers of the previous call.
+    """
+    global _log_listener
     try:
         # get logger level
         levels = {0: logging.NOTSET, 1: logging.DEBUG, 2: logging.INFO, 3: logging.WARNING, 4: logging.ERROR,
@@ -20,12 +55,24 @@ def initialize_logger():
         # console logs
         console_handler = logging.StreamHandler(sys.stdout)
         console_handler.setFormatter(formatter)
-        logger.addHandler(console_handler)
+        handlers = [console_handler]
         # file logs
         if config.file_logs:
-            file_handler = logging.FileHandler('ContestBot.log')
+            file_handler = logging.handlers.RotatingFileHandler('ContestBot.log', maxBytes=config.log_max_bytes,
+                                                                backupCount=config.log_backup_count)
+            file_handler.namer = _gzip_log_name
+            file_handler.rotator = _gzip_log
             file_handler.setFormatter(formatter)
-            logger.addHandler(file_handler)
+            handlers.append(file_handler)
+        # stop the previous listener so handlers are not added twice
+        if _log_listener is not None:
+            _log_listener.stop()
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+        log_queue = queue.Queue(-1)
+        logger.addHandler(logging.handlers.QueueHandler(log_queue))
+        _log_listener = logging.handlers.QueueListener(log_queue, *handlers)
+        _log_listener.start()
         # set logger level
         logger.setLevel(level)
         logger.debug("Logger initialized.")
@@ -35,123 +82,253 @@ def initialize_logger():
         raise Exception("Logger error. Fix logger.")
 
 
-def check_config(logger):
+def stop_logger():
+    """
+    Writes out all queued log records and stops the background logging thread.
+    """
+    global _log_listener
+    if _log_listener is not None:
+        _log_listener.stop()
+        _log_listener = None
+
+
+# flush queued log records when the program exits
+atexit.register(stop_logger)
+
+
+def check_config(logger, module=config):
     """
     Checks if the config.py file exists and all variables are provided and valid depending what features are turned on.
     Call this function first in your main function so the program fails early if config.py is invalid.
     Warning: This is not an exhaustive check and edge cases could not be caught by this function.
 
-    :return: raises Exception is errors detected.
+    :param logger: logger instance.
+    :param module: config module to check, defaults to the imported config.py. ex: settings.load_module() of an edited
+    config.py.
+    :return: settings.Settings object with the validated settings and their compiled keyword matcher. Raises Exception
+    if errors detected.
     """
     valid = True
     try:
         # check authentication settings
-        if config.follow and not config.username:
+        if module.follow and not module.username:
             valid = False
             logger.error("config.follow feature ON requires you to supply a config.username.")
-        authentication_settings = [config.consumer_key, config.consumer_secret, config.token, config.token_secret]
-        if any(not setting for setting in authentication_settings):
+        authentication_settings = [module.consumer_key, module.consumer_secret, module.token, module.token_secret]
+        if not module.fake_api and any(not setting for setting in authentication_settings):
             valid = False
             logger.error("Missing authentication setting(s) in config.py.")
 
         # check toggle feature settings
-        toggle_settings = [config.retweet, config.like, config.follow, config.comment, config.dm]
+        toggle_settings = [module.retweet, module.like, module.follow, module.comment, module.dm]
         if any(type(setting) != bool for setting in toggle_settings):
             valid = False
             logger.error("Missing toggle feature setting(s) in config.py.")
 
         # check action settings
-        if config.retweet and not config.retweet_keywords:
+        if module.retweet and not module.retweet_keywords:
             valid = False
             logger.error("config.retweet feature ON requires you to supply config.retweet_keywords.")
-        if config.like and not config.like_keywords:
+        if module.like and not module.like_keywords:
             valid = False
             logger.error("config.like feature ON requires you to supply config.like_keywords.")
-        if config.follow and not config.follow_keywords:
+        if module.follow and not module.follow_keywords:
             valid = False
             logger.error("config.follow feature ON requires you to supply config.follow_keywords.")
-        if config.comment and not all([config.comment_keywords, config.tag_keywords]):
+        if module.comment and not all([module.comment_keywords, module.tag_keywords]):
             valid = False
             logger.error("config.comment feature ON requires you to supply config.comment_keywords and "
                          "config.tag_keywords.")
-        if config.dm and not config.dm_keywords:
+        if module.dm and not module.dm_keywords:
             valid = False
             logger.error("config.dm feature ON requires you to supply config.dm_keywords.")
 
         # check sleep settings
-        if (config.sleep_per_tweet[0] < 0) or (config.sleep_per_tweet[0] > config.sleep_per_tweet[1]) or (
-                config.sleep_per_tweet[1] < 0):
+        if (module.sleep_per_tweet[0] < 0) or (module.sleep_per_tweet[0] > module.sleep_per_tweet[1]) or (
+                module.sleep_per_tweet[1] < 0):
             valid = False
             logger.error(
                 "Invalid config.sleep_per_tweet setting. Each value must be 0 or greater and second value cannot be "
                 "larger than first.")
-        if (config.sleep_per_action[0] < 0) or (config.sleep_per_action[0] > config.sleep_per_action[1]) or (
-                config.sleep_per_action[1] < 0):
+        if (module.sleep_per_action[0] < 0) or (module.sleep_per_action[0] > module.sleep_per_action[1]) or (
+                module.sleep_per_action[1] < 0):
             valid = False
             logger.error(
                 "Invalid config.sleep_per_action setting. Each value must be 0 or greater and second value cannot be "
                 "larger than first.")
-        if config.follow and (
-                (config.sleep_per_unfollow[0] < 0) or (config.sleep_per_unfollow[0] > config.sleep_per_unfollow[1]) or (
-                config.sleep_per_unfollow[1] < 0)):
+        if module.follow and (
+                (module.sleep_per_unfollow[0] < 0) or (module.sleep_per_unfollow[0] > module.sleep_per_unfollow[1]) or (
+                module.sleep_per_unfollow[1] < 0)):
             valid = False
             logger.error(
                 "Invalid config.sleep_per_unfollow setting. Each value must be 0 or greater and second value cannot be "
                 "larger than first.")
-        if config.follow and ((config.sleep_unfollow_mode[0] < 0) or (
-                config.sleep_unfollow_mode[0] > config.sleep_unfollow_mode[1]) or (
-                                      config.sleep_unfollow_mode[1] < 0)):
+        if module.follow and ((module.sleep_unfollow_mode[0] < 0) or (
+                module.sleep_unfollow_mode[0] > module.sleep_unfollow_mode[1]) or (
+                                      module.sleep_unfollow_mode[1] < 0)):
             valid = False
             logger.error(
                 "Invalid config.sleep_unfollow_mode setting. Each value must be 0 or greater and second value cannot be "
                 "larger than first.")
 
         # check search settings
-        if config.count <= 0:
+        if module.count <= 0:
             valid = False
             logger.error("Invalid config.count setting. Must be greater than 0.")
-        if config.search_type not in ("mixed", "recent", "popular"):
+        if module.search_type not in ("mixed", "recent", "popular"):
             valid = False
             logger.error(f'config.search_type must be "mixed", "recent", or "popular".')
-        if not config.search_keywords:
+        if not module.search_keywords:
             valid = False
             logger.error("Missing config.search_keywords.")
-        if not type(config.include_retweets) == bool:
+        if not type(module.include_retweets) == bool:
             valid = False
             logger.error("config.include_retweets must be True or False.")
-        if not type(config.include_replies) == bool:
+        if not type(module.include_replies) == bool:
             valid = False
             logger.error("config.include_replies must be True or False.")
+        if not type(module.near_duplicate_distance) == int or not -1 <= module.near_duplicate_distance <= 7:
+            valid = False
+            logger.error("config.near_duplicate_distance must be between 0 and 7, or -1 to turn it off.")
+        if not type(module.async_search) == bool:
+            valid = False
+            logger.error("config.async_search must be True or False.")
 
         # check follow/unfollow settings
-        if config.follow and (config.max_following[0] > config.max_following[1] or config.max_following[0] < 0 or
-                              config.max_following[1] > 2000 or config.max_following[1]) < 0:
+        if module.follow and (module.max_following[0] > module.max_following[1] or module.max_following[0] < 0 or
+                              module.max_following[1] > 2000 or module.max_following[1]) < 0:
             valid = False
             logger.error("config.follow feature ON requires you to supply config.max_following. Min must be > 0, "
                          "Max must be < 2000 and > Min.")
-        if config.follow and (config.unfollow_range[0] > config.unfollow_range[1] or config.unfollow_range[0] < 0 or
-                              config.unfollow_range[1] < 0):
+        if module.follow and module.following_cache_ttl < 0:
+            valid = False
+            logger.error("config.following_cache_ttl must be 0 or greater.")
+        if module.follow and (module.unfollow_range[0] > module.unfollow_range[1] or module.unfollow_range[0] < 0 or
+                              module.unfollow_range[1] < 0):
             valid = False
             logger.error(
                 "config.follow feature ON requires you to supply config.unfollow_range greater than 0. Min should be "
                 "< Max and both should be > 0.")
 
         # check comment settings
-        if not type(config.include_hashtags) == bool:
+        if not type(module.include_hashtags) == bool:
             valid = False
             logger.error("config.include_hashtags must be True or False.")
-        if config.comment and not all([config.tag_friends, config.comments, config.comment_punctuation]):
+        if module.comment and not all([module.tag_friends, module.comments, module.comment_punctuation]):
             valid = False
             logger.error("config.comment feature ON requires you to supply config.tag_friends, config.comments, "
                          "and config.comment_punctuation.")
 
         # check logging settings
-        if 1 > config.level > 5:
+        if 1 > module.level > 5:
             valid = False
             logger.error("config.level must be a value between 1 and 5")
-        if not type(config.file_logs) == bool:
+        if not type(module.file_logs) == bool:
             valid = False
             logger.error("config.file_logs must be True or False.")
+        if not type(module.log_max_bytes) == int or module.log_max_bytes < 0:
+            valid = False
+            logger.error("config.log_max_bytes must be 0 or greater.")
+        if not type(module.log_backup_count) == int or module.log_backup_count < 0:
+            valid = False
+            logger.error("config.log_backup_count must be 0 or greater.")
+
+        # check testing settings
+        if not type(module.fake_api) == str:
+            valid = False
+            logger.error('config.fake_api must be "", "synthetic" or a file path.')
+        if module.fake_api and (module.fake_api_latency[0] < 0 or
+                                module.fake_api_latency[0] > module.fake_api_latency[1]):
+            valid = False
+            logger.error("Invalid config.fake_api_latency setting. Each value must be 0 or greater and second value "
+                         "cannot be larger than first.")
+
+        # check state settings
+        if not type(module.seen_tweets_file) == str:
+            valid = False
+            logger.error('config.seen_tweets_file must be a file path or "".')
+        if not type(module.search_checkpoints_file) == str:
+            valid = False
+            logger.error('config.search_checkpoints_file must be a file path or "".')
+        if not type(module.fingerprints_file) == str:
+            valid = False
+            logger.error('config.fingerprints_file must be a file path or "".')
+        if not type(module.following_cache_file) == str:
+            valid = False
+            logger.error('config.following_cache_file must be a file path or "".')
+        if not type(module.run_state_file) == str:
+            valid = False
+            logger.error('config.run_state_file must be a file path or "".')
+        if module.run_state_interval < 0:
+            valid = False
+            logger.error("config.run_state_interval must be 0 or greater.")
+        if not type(module.action_journal_file) == str:
+            valid = False
+            logger.error('config.action_journal_file must be a file path or "".')
+        if module.action_journal_interval <= 0:
+            valid = False
+            logger.error("config.action_journal_interval must be greater than 0.")
+        if not type(module.archive_dir) == str:
+            valid = False
+            logger.error('config.archive_dir must be a folder path or "".')
+        if not type(module.watch_config) == bool:
+            valid = False
+            logger.error("config.watch_config must be True or False.")
+
+        # check ranking settings
+        if not type(module.rank_contests) == bool:
+            valid = False
+            logger.error("config.rank_contests must be True or False.")
+        if not type(module.rank_queue_size) == int or module.rank_queue_size < 1:
+            valid = False
+            logger.error("config.rank_queue_size must be 1 or greater.")
+        if module.rank_max_age_hours <= 0:
+            valid = False
+            logger.error("config.rank_max_age_hours must be greater than 0.")
+        if not type(module.rank_weights) == dict or not set(module.rank_weights) <= {"actions", "followers",
+                                                                                     "engagement", "age", "deadline"}:
+            valid = False
+            logger.error('config.rank_weights must be a dict with "actions", "followers", "engagement", "age" and '
+                         '"deadline" keys.')
+
+        # check classifier settings
+        if not type(module.classifier_model) == str:
+            valid = False
+            logger.error('config.classifier_model must be a file path or "".')
+        if not 0 <= module.classifier_threshold <= 1:
+            valid = False
+            logger.error("config.classifier_threshold must be between 0 and 1.")
+        if not type(module.classification_cache_size) == int or module.classification_cache_size < 0:
+            valid = False
+            logger.error("config.classification_cache_size must be 0 or greater.")
+        if module.classification_cache_ttl <= 0:
+            valid = False
+            logger.error("config.classification_cache_ttl must be greater than 0.")
+        if not type(module.classifier_batch_size) == int or module.classifier_batch_size < 1:
+            valid = False
+            logger.error("config.classifier_batch_size must be 1 or greater.")
+
+        # check profiling settings
+        if not type(module.profile_cycles) == bool:
+            valid = False
+            logger.error("config.profile_cycles must be True or False.")
+        if not type(module.profile_dir) == str or not module.profile_dir:
+            valid = False
+            logger.error("config.profile_dir must be a folder path.")
+        if module.profile_interval <= 0:
+            valid = False
+            logger.error("config.profile_interval must be greater than 0.")
+
+        # check metrics settings
+        if not type(module.metrics_file) == str:
+            valid = False
+            logger.error('config.metrics_file must be a file path or "".')
+        if module.metrics_file and module.metrics_interval <= 0:
+            valid = False
+            logger.error("config.metrics_interval must be greater than 0.")
+        if not type(module.metrics_port) == int or not 0 <= module.metrics_port <= 65535:
+            valid = False
+            logger.error("config.metrics_port must be 0 or a port number.")
 
     except Exception as e:
         valid = False
@@ -163,21 +340,26 @@ def check_config(logger):
 
     logger.info("Config file passed check.")
     logger.info('------------Settings------------')
-    logger.info(f'retweet: {config.retweet}')
-    logger.info(f'like: {config.like}')
-    logger.info(f'follow: {config.follow}')
-    logger.info(f'comment: {config.comment}')
-    logger.info(f'dm: {config.dm}')
+    logger.info(f'retweet: {module.retweet}')
+    logger.info(f'like: {module.like}')
+    logger.info(f'follow: {module.follow}')
+    logger.info(f'comment: {module.comment}')
+    logger.info(f'dm: {module.dm}')
     logger.info('--------------------------------')
-    return True
+    return Settings.from_module(module, build_matcher(logger, module), load_classifier(logger, module))
 
 
 def authenticate(logger):
     try:
+        if config.fake_api:
+            return _authenticate_fake_api(logger)
         auth = tweepy.OAuthHandler(config.consumer_key, config.consumer_secret)
         auth.set_access_token(config.token, config.token_secret)
         logger.info("Authentication successful.")
-        return tweepy.API(auth, wait_on_rate_limit=True, wait_on_rate_limit_notify=True)
+        # the api's scheduler is shared by every thread and coroutine so read calls are paced inside each endpoint's
+        # 15 minute window instead of blocking in wait_on_rate_limit after the window is used up, which is only kept as
+        # a fallback
+        return ScheduledAPI(auth, wait_on_rate_limit=True, wait_on_rate_limit_notify=True)
     except tweepy.TweepError as e:
         _tweepy_error_handler(logger, e)
     except Exception as e:
@@ -185,42 +367,256 @@ def authenticate(logger):
     raise Exception("Authentication unsuccessful.")
 
 
-def get_tweets(logger, api, search_type=config.search_type):
+def build_matcher(logger, settings=None):
+    """
+    Compiles all keyword settings in config.py into a single matcher. Build it once at startup and pass it to
+    check_tweet() and find_actions() so every tweet is classified in one scan of its text.
+    Relevant settings in config.py: retweet_keywords, like_keywords, follow_keywords, comment_keywords, tag_keywords,
+    dm_keywords, banned_tweet_words, banned_username_words, the toggle feature settings and classification_cache_size,
+    classification_cache_ttl.
+    :param logger: logger instance.
+    :param settings: optional settings.Settings or config module, defaults to config.py.
+    :return: matcher.KeywordMatcher instance.
+    """
+    settings = _get_settings(settings)
+    keywords = {"banned_word": settings.banned_tweet_words}
+    word_keywords = {}
+    # disabled features are left out of the matcher entirely
+    if settings.retweet:
+        # special case for "rt" since it was returning false positives, only match it as a whole word
+        keywords["retweet"] = [keyword for keyword in settings.retweet_keywords if keyword.lower() != "rt"]
+        word_keywords["retweet"] = [keyword for keyword in settings.retweet_keywords if keyword.lower() == "rt"]
+    if settings.like:
+        keywords["like"] = settings.like_keywords
+    if settings.follow:
+        keywords["follow"] = settings.follow_keywords
+    if settings.comment:
+        keywords["comment"] = settings.comment_keywords
+        keywords["tag"] = settings.tag_keywords
+    if settings.dm:
+        keywords["dm"] = settings.dm_keywords
+    matcher = KeywordMatcher(keywords, word_keywords, {"banned_user": settings.banned_username_words},
+                             settings.classification_cache_size, settings.classification_cache_ttl)
+    logger.debug("Keyword matcher built.")
+    return matcher
+
+
+def load_classifier(logger, settings=None):
+    """
+    Loads the optional contest classifier model. Relevant settings in config.py: classifier_model, classifier_threshold
+    :param logger: logger instance.
+    :param settings: optional settings.Settings or config module, defaults to config.py.
+    :return: classifier.ContestClassifier instance, or None to fall back to the keyword rules when no model is set or
+    it cannot be loaded.
+    """
+    settings = _get_settings(settings)
+    if not settings.classifier_model:
+        return None
+    try:
+        classifier = ContestClassifier.load(settings.classifier_model, settings.classifier_threshold)
+        logger.info(f'Contest classifier loaded from {settings.classifier_model}.')
+        return classifier
+    except Exception as e:
+        logger.error(f'load_classifier error: {e}')
+        logger.warning("Falling back to the keyword rules.")
+        return None
+
+
+def _authenticate_fake_api(logger):
+    # only imported when config.fake_api is set, a real run never loads the fake api
+    from fake_api import SYNTHETIC, FakeTwitterAPI, generate_statuses, load_statuses
+
+    statuses = generate_statuses(2000) if config.fake_api == SYNTHETIC else load_statuses(config.fake_api)
+    logger.warning(f'Using the offline fake twitter api with {len(statuses)} tweets. Nothing is sent to twitter.')
+    return FakeTwitterAPI(statuses, config.fake_api_latency, username=config.username)
+
+
+def open_seen_index(logger):
+    """
+    Opens the index of already processed tweets. Relevant settings in config.py: seen_tweets_file
+    :param logger: logger instance.
+    :return: storage.SeenIndex instance.
+    """
+    seen_index = SeenIndex(config.seen_tweets_file)
+    logger.info(f'Seen tweet index loaded with {len(seen_index)} tweet ids.')
+    return seen_index
+
+
+def open_search_checkpoints(logger):
+    """
+    Opens the newest tweet id found for each search keyword and search type. Relevant settings in config.py:
+    search_checkpoints_file
+    :param logger: logger instance.
+    :return: storage.SearchCheckpoints instance.
+    """
+    checkpoints = SearchCheckpoints(config.search_checkpoints_file)
+    logger.debug("Search checkpoints loaded.")
+    return checkpoints
+
+
+def open_fingerprint_index(logger):
+    """
+    Opens the text fingerprints of already processed tweets. Relevant settings in config.py: fingerprints_file,
+    near_duplicate_distance
+    :param logger: logger instance.
+    :return: fingerprint.FingerprintIndex instance, or None when near duplicate detection is turned off.
+    """
+    if config.near_duplicate_distance < 0:
+        return None
+    fingerprints = FingerprintIndex(config.fingerprints_file, config.near_duplicate_distance)
+    logger.info(f'Fingerprint index loaded with {len(fingerprints)} fingerprints.')
+    return fingerprints
+
+
+def open_following_cache(logger):
+    """
+    Opens the saved list of user ids the bot account follows. Relevant settings in config.py: following_cache_file,
+    following_cache_ttl
+    :param logger: logger instance.
+    :return: storage.FollowingCache instance.
+    """
+    following_cache = FollowingCache(config.following_cache_file, config.following_cache_ttl)
+    logger.debug(f'Following cache loaded with {len(following_cache)} user ids.')
+    return following_cache
+
+
+def open_run_state(logger):
+    """
+    Opens the main loop's work state saved by the last run. Relevant settings in config.py: run_state_file,
+    run_state_interval
+    :param logger: logger instance.
+    :return: storage.RunState instance.
+    """
+    run_state = RunState(config.run_state_file, config.run_state_interval)
+    if run_state.pending or run_state.unfollow:
+        logger.info(f'Resuming previous run with {len(run_state.pending)} pending contests'
+                    f'{" and an unfinished unfollow mode" if run_state.unfollow else ""}.')
+    return run_state
+
+
+def open_action_journal(logger):
+    """
+    Opens the journal of actions performed by earlier runs. Relevant settings in config.py: action_journal_file,
+    action_journal_interval
+    :param logger: logger instance.
+    :return: journal.ActionJournal instance, close it to write the last actions to disk.
+    """
+    journal = ActionJournal(config.action_journal_file, config.action_journal_interval)
+    in_doubt = journal.in_doubt()
+    if in_doubt:
+        # the api call may or may not have gone through, these actions are tried again
+        logger.warning(f'{len(in_doubt)} action(s) were interrupted by the last run: '
+                       f'{", ".join(f"{action} {target}" for action, target in in_doubt)}')
+    logger.debug(f'Action journal loaded with {len(journal)} actions.')
+    return journal
+
+
+def open_archive(logger):
+    """
+    Opens the archive processed tweets are appended to. Relevant settings in config.py: archive_dir
+    :param logger: logger instance.
+    :return: archive.ArchiveWriter instance, or None when archiving is turned off.
+    """
+    if not config.archive_dir:
+        return None
+    archive = ArchiveWriter(config.archive_dir)
+    logger.debug(f'Archive opened with {len(archive)} tweets.')
+    return archive
+
+
+def resume_unfollow_mode(logger, api, run_state, following_cache=None, settings=None, journal=None):
+    """
+    Finishes an unfollow mode that was interrupted by a crash or restart.
+    :param logger: logger instance.
+    :param api: tweepy api instance.
+    :param run_state: storage.RunState instance.
+    :param journal: optional journal.ActionJournal instance, users it shows as unfollowed are not unfollowed again.
+    :return: number of users unfollowed, or False if there was no unfollow mode to resume.
+    """
+    if not run_state.unfollow:
+        return False
+    logger.info(f'Resuming unfollow mode with {run_state.unfollow["unfollowed"]} of {run_state.unfollow["total"]} '
+                f'users already unfollowed.')
+    return _unfollow_mode(logger, api, None, following_cache, settings, run_state, journal)
+
+
+def start_metrics(logger):
+    """
+    Starts exporting metrics in the prometheus text format. Relevant settings in config.py: metrics_file,
+    metrics_interval, metrics_port
+    :param logger: logger instance.
+    :return: (metrics.TextfileWriter or None, http server or None), stop them with stop() and shutdown().
+    """
+    writer = server = None
+    if config.metrics_file:
+        writer = metrics.TextfileWriter(config.metrics_file, config.metrics_interval)
+        writer.start()
+        logger.info(f'Writing metrics to {config.metrics_file} every {config.metrics_interval}s.')
+    if config.metrics_port:
+        server = metrics.start_http_server(config.metrics_port)
+        logger.info(f'Serving metrics at http://127.0.0.1:{config.metrics_port}/metrics')
+    return writer, server
+
+
+def mark_seen(logger, seen_index, tweet, outcome, original=True):
+    """
+    Records a processed tweet in the seen index so it is dropped from future get_tweets() results.
+    :param logger: logger instance.
+    :param seen_index: storage.SeenIndex instance or None.
+    :param tweet: tweepy status object.
+    :param outcome: short single word describing what happened to the tweet, ex: "acted" or "skipped".
+    :param original: False to only mark this status and not the original tweet of a retweet, for outcomes that depend on
+    the retweeter.
+    """
+    metrics.TWEETS.inc(outcome=outcome)
+    if seen_index is not None:
+        seen_index.add(_get_tweet_ids(logger, tweet) if original else (tweet.id,), outcome)
+
+
+def mark_skipped(logger, seen_index, tweet, reason):
+    """
+    Marks a tweet check_tweet() rejected as seen, keyed by what the rejection depends on.
+    :param logger: logger instance.
+    :param seen_index: storage.SeenIndex instance or None.
+    :param tweet: tweepy status object.
+    :param reason: reason from _check_tweet(). A retweeter with a banned username only skips that retweet, so the
+    contest can still be entered through another retweet, and tweets that could not be checked because of an api error
+    are not marked at all so a later search tries them again.
+    """
+    if reason == "error":
+        metrics.TWEETS.inc(outcome="error")
+    else:
+        mark_seen(logger, seen_index, tweet, "skipped", original=reason != "banned_user")
+
+
+def get_tweets(logger, api, search_type=config.search_type, seen_index=None, checkpoints=None, settings=None,
+               fingerprints=None, journal=None):
     """
     Searches tweets on twitter. Relevant settings in config.py: contest_keywords, count, search_type
     You can use the return from ContestBot.get_next_search_type() to iterate through search types and pass it to the
     search_type parameter in this function call.
+    Duplicate tweets (the same original tweet found again through a retweet or another keyword) and tweets already in
+    seen_index are dropped from the results. With checkpoints, each search only returns tweets newer than the newest
+    tweet found by the previous search for the same keyword and search type. With fingerprints, near duplicate copies
+    of a giveaway already found are dropped too, pass each returned tweet to ContestBot.settle_fingerprint() once it
+    was checked so its fingerprint is saved for later runs, and check the copies it returns for tweets not kept. With a
+    journal, tweets it shows were already retweeted or liked are dropped without asking the api.
+    Use pipeline.TweetPipeline instead to stream tweets to the actions as they are found.
     :param logger: logger instance.
     :param api: tweepy api instance.
     :param search_type: Valid: "mixed", "recent", "popular". Defaults to the value set in config.search_type. Can use
     ContestBot.get_next_search_type() to iterate through search types.
-    :return: list that contains all status(tweets) objects scraped from twitter search.
+    :param seen_index: optional storage.SeenIndex instance from ContestBot.open_seen_index().
+    :param checkpoints: optional storage.SearchCheckpoints instance from ContestBot.open_search_checkpoints().
+    :param settings: optional settings.Settings object from ContestBot.check_config(), defaults to config.py.
+    :param fingerprints: optional fingerprint.FingerprintIndex instance from ContestBot.open_fingerprint_index().
+    :param journal: optional journal.ActionJournal instance from ContestBot.open_action_journal().
+    :return: list that contains a records.TweetRecord for each status(tweet) scraped from twitter search.
     """
+    settings = _get_settings(settings)
     try:
-        all_tweets = []
-        logger.info("Searching for tweets...")
-        logger.info(f'Search type: {search_type}')
-        for keyword in config.search_keywords:
-            search_keyword = keyword.lower()
-            if not config.include_retweets and not config.include_replies:
-                logger.debug("Not including retweets or replies.")
-                search_keyword = f'{search_keyword} -filter:retweets AND -filter:replies'
-            elif not config.include_retweets and config.include_replies:
-                logger.debug("Not including retweets.")
-                search_keyword = f'{search_keyword} -filter:retweets'
-            elif not config.include_replies and config.include_retweets:
-                logger.debug("Not including replies.")
-                search_keyword = f'{search_keyword} -filter:replies'
-            else:
-                logger.debug("No retweet or reply filters added to search keyword.")
-            logger.info(f'Gathering {config.count} tweets with "{search_keyword}" keyword.')
-            for status in tweepy.Cursor(api.search, lang="en", result_type=search_type,
-                                        tweet_mode="extended", q=search_keyword).items(config.count):
-                all_tweets.append(status)
-            logger.info("Done.")
-            logger.debug(
-                f'Finished finding tweets for "{search_keyword}". Tweet list now contains {len(all_tweets)} tweets.')
-            _random_sleep(logger, config.sleep_per_action[0], config.sleep_per_action[1])
+        search_results = iter_search_results(logger, api, search_type, checkpoints, settings)
+        all_tweets = list(iter_unseen_tweets(logger, search_results, seen_index, fingerprints, journal))
         logger.info(f'Scraped {len(all_tweets)} total tweets.')
         return all_tweets
     except tweepy.TweepError as e:
@@ -230,85 +626,198 @@ def get_tweets(logger, api, search_type=config.search_type):
         return False
 
 
-def check_tweet(logger, api, tweet):
-    try:
-        lowercase_tweet_text = _get_tweet_text(logger, tweet)
-        # check if username has any banned user words in it (set in config.banned_user_words)
-        if config.banned_username_words:
-            if any(banned_user_word.lower() in tweet.user.screen_name.lower() for banned_user_word in
-                   config.banned_username_words):
+def iter_search_results(logger, api, search_type=config.search_type, checkpoints=None, settings=None,
+                        on_finished=None):
+    """
+    Generator version of the search in ContestBot.get_tweets(). Yields a records.TweetRecord for each status(tweet) as
+    soon as its search page arrives instead of waiting for every keyword to finish. Errors are raised to the caller.
+    A keyword's checkpoint only moves when the next status is asked for after its last one, so closing the generator
+    part way through a keyword leaves its checkpoint and the next search finds the rest of its statuses again.
+    :param logger: logger instance.
+    :param api: tweepy api instance.
+    :param search_type: Valid: "mixed", "recent", "popular". Defaults to the value set in config.search_type.
+    :param checkpoints: optional storage.SearchCheckpoints instance from ContestBot.open_search_checkpoints().
+    :param settings: optional settings.Settings object from ContestBot.check_config(), defaults to config.py.
+    :param on_finished: optional callback run with (search keyword, newest id) after a keyword's last status was
+    taken, in place of updating checkpoints, ex: to move the checkpoint only once its statuses were processed.
+    """
+    settings = _get_settings(settings)
+    logger.info("Searching for tweets...")
+    logger.info(f'Search type: {search_type}')
+    for keyword in settings.search_keywords:
+        search_keyword = _build_search_query(logger, keyword, settings)
+        since_id = checkpoints.get(search_keyword, search_type) if checkpoints else None
+        newest_id = since_id
+        num_found = 0
+        logger.info(f'Gathering {settings.count} tweets with "{search_keyword}" keyword.')
+        if since_id:
+            logger.debug(f'Only gathering tweets newer than {since_id}.')
+        pages = _search_pages(logger, api, search_keyword, search_type, since_id)
+        while num_found < settings.count:
+            _wait_for_rate_limit(logger, api, "search/tweets")
+            with metrics.STAGE_SECONDS.time(stage="search_page"):
+                page = next(pages, None)
+            if not page:
+                break
+            statuses, done = _new_statuses(page, since_id, settings.count - num_found, search_type)
+            for status in statuses:
+                newest_id = max(newest_id or 0, status.id)
+                num_found += 1
+                yield TweetRecord.from_status(status, keyword)
+            if done:
+                break
+        if checkpoints:
+            if on_finished:
+                on_finished(search_keyword, newest_id)
+            else:
+                checkpoints.update(search_keyword, search_type, newest_id)
+        logger.info("Done.")
+        logger.debug(f'Finished finding tweets for "{search_keyword}". Found {num_found} tweets.')
+        # with a scheduler the next search is paced by the search budget instead of a fixed sleep
+        if getattr(api, "scheduler", None) is None:
+            _random_sleep(logger, settings.sleep_per_action[0], settings.sleep_per_action[1])
+
+
+def iter_unseen_tweets(logger, tweets, seen_index=None, fingerprints=None, journal=None, matcher=None):
+    """
+    Drops duplicate tweets (the same original tweet found again through a retweet or another keyword) and tweets
+    already in seen_index from an iterable of tweets. With fingerprints, tweets whose text is a near duplicate of a
+    tweet found before, ex: a partner account reposting the same giveaway, are dropped and marked seen too, before any
+    api call or keyword matching is spent on them. Retweets by banned usernames are dropped before they are
+    fingerprinted, and the fingerprints of the tweets yielded are only kept in memory until they are passed to
+    ContestBot.settle_fingerprint() once the tweet was checked. Copies found meanwhile are held back instead of marked
+    seen, so a copy that turns out unusable, ex: deleted, hands its place to the next copy. With a journal, tweets the
+    bot already retweeted or liked, ex: acted on right before a crash that kept them out of seen_index, are dropped and
+    marked seen as well.
+    :param logger: logger instance.
+    :param tweets: iterable of status(tweets) objects, ex: ContestBot.iter_search_results().
+    :param seen_index: optional storage.SeenIndex instance from ContestBot.open_seen_index().
+    :param fingerprints: optional fingerprint.FingerprintIndex instance from ContestBot.open_fingerprint_index().
+    :param journal: optional journal.ActionJournal instance from ContestBot.open_action_journal().
+    :param matcher: optional matcher.KeywordMatcher from ContestBot.build_matcher(), for the banned username check.
+    """
+    found_ids = set()
+    num_dropped = 0
+    num_copies = 0
+    for tweet in tweets:
+        tweet_ids = _get_tweet_ids(logger, tweet)
+        if any(tweet_id in found_ids for tweet_id in tweet_ids) or (
+                seen_index is not None and seen_index.seen(tweet_ids)):
+            num_dropped += 1
+            continue
+        found_ids.update(tweet_ids)
+        if journal is not None and journal.done_actions(tweet_ids[-1]) & {"retweet", "like"}:
+            logger.debug('Tweet %s was already acted on according to the action journal. Dropping tweet.', tweet.id)
+            mark_seen(logger, seen_index, tweet, "acted")
+            num_dropped += 1
+            continue
+        if fingerprints is not None:
+            record = _get_tweet_record(logger, tweet)
+            # a banned reposter must not become the fingerprint that hides every other copy of the contest
+            if "banned_user" in _get_matcher(logger, matcher).classify_username(record.screen_name):
                 logger.info("Banned user word found in username. Skipping tweet.")
-                return False
-        # check if tweet text has any banned words in it (set in config.banned_words)
-        if config.banned_tweet_words:
-            if any(banned_word.lower() in lowercase_tweet_text for banned_word in config.banned_tweet_words):
-                logger.info("Banned word found in tweet. Skipping tweet.")
-                return False
-        # workaround to check if tweet has already been retweeted or liked
-        # placed this code block after banned username/tweet words to save an api call if banned words found first
-        status = api.get_status(tweet.id)
-        # check if tweet has already been liked
-        if status.favorited:
-            logger.info("Tweet already liked. Skipping tweet.")
-            return False
-        # check if tweet has already been retweeted
-        if status.retweeted:
-            logger.info("Tweet already retweeted. Skipping tweet.")
-            return False
-        logger.debug("Found tweet that does not contain banned users, banned words, or already liked/retweeted.")
-        return lowercase_tweet_text
-    except tweepy.TweepError as e:
-        return _tweepy_error_handler(logger, e)
-    except Exception as e:
-        logger.error(f'check_tweet error: {e}')
-        return False
+                mark_skipped(logger, seen_index, tweet, "banned_user")
+                continue
+            fingerprint = simhash(record.text)
+            added = fingerprints.add(fingerprint, save=False, copy=tweet) if fingerprint is not None else True
+            if added is None:
+                logger.debug('Tweet %s is a copy of a contest that is still being checked. Holding tweet back.',
+                             tweet.id)
+                num_copies += 1
+                continue
+            if not added:
+                logger.debug('Tweet %s is a copy of a contest already found. Dropping tweet.', tweet.id)
+                mark_seen(logger, seen_index, tweet, "copy")
+                num_copies += 1
+                continue
+        yield tweet
+    logger.info(f'Dropped {num_dropped} duplicate or already seen tweets and {num_copies} copies of other contests.')
 
 
-def find_actions(logger, tweet_text):
+def settle_fingerprint(logger, fingerprints, tweet, keep, seen_index=None):
+    """
+    Saves or forgets the fingerprint iter_unseen_tweets() kept in memory for a tweet, along with the copies of the tweet
+    it held back.
+    :param logger: logger instance.
+    :param fingerprints: fingerprint.FingerprintIndex instance or None.
+    :param tweet: tweet yielded by iter_unseen_tweets().
+    :param keep: True once the tweet was checked or rejected for something every copy shares, ex: a banned word, False
+    when it was rejected for something specific to this copy, ex: it was deleted or could not be checked.
+    :param seen_index: optional storage.SeenIndex instance, the held back copies are marked seen once the tweet is kept.
+    :return: list of held back copies that take the place of a tweet that was not kept, at most one per contest. They
+    were not checked yet, pass them through the same checks and settle them too.
+    """
+    if fingerprints is None:
+        return []
+    fingerprint = simhash(_get_tweet_record(logger, tweet).text)
+    if fingerprint is None:
+        return []
+    if keep:
+        for copy in fingerprints.save(fingerprint):
+            mark_seen(logger, seen_index, copy, "copy")
+        return []
+    released = []
+    for copy in fingerprints.discard(fingerprint):
+        # the first copy takes the tweet's place, the copies of it are held back again
+        added = fingerprints.add(simhash(_get_tweet_record(logger, copy).text), save=False, copy=copy)
+        if added:
+            released.append(copy)
+        elif added is False:
+            mark_seen(logger, seen_index, copy, "copy")
+    if released:
+        logger.debug('Tweet %s was not kept, %d held back copies take its place.', tweet.id, len(released))
+    return released
+
+
+def check_statuses(logger, api, tweets):
+    """
+    Refreshes the liked/retweeted flags of all tweets with one statuses/lookup api call per 100 tweets, so
+    ContestBot.check_tweet() does not need an api call for each tweet. Call this on the return of get_tweets().
+    :param logger: logger instance.
+    :param api: tweepy api instance.
+    :param tweets: list of status(tweets) objects.
+    :return: list of tweets that are still available with their flags refreshed. If the lookup fails the tweets are
+    returned unchanged and check_tweet() falls back to checking each tweet.
+    """
+    checked_tweets = list(iter_checked_statuses(logger, api, tweets))
+    logger.info(f'Checked {len(tweets)} tweets. {len(tweets) - len(checked_tweets)} tweets no longer available.')
+    return checked_tweets
+
+
+def iter_checked_statuses(logger, api, tweets, on_unavailable=None):
+    """
+    Generator version of ContestBot.check_statuses(). Looks tweets up in batches of 100 as they arrive.
+    :param logger: logger instance.
+    :param api: tweepy api instance.
+    :param tweets: iterable of status(tweets) objects.
+    :param on_unavailable: optional callback run with each tweet dropped because it is no longer available.
+    """
+    batch = []
+    for tweet in tweets:
+        batch.append(tweet)
+        if len(batch) == STATUS_LOOKUP_BATCH_SIZE:
+            yield from _check_status_batch(logger, api, batch, on_unavailable=on_unavailable)
+            batch = []
+    if batch:
+        yield from _check_status_batch(logger, api, batch, on_unavailable=on_unavailable)
+
+
+def check_tweet(logger, api, tweet, matcher=None):
+    return _check_tweet(logger, api, tweet, matcher)[0]
+
+
+def find_actions(logger, tweet_text, matcher=None):
     try:
-        actions = {"retweet": False, "like": False, "follow": False, "comment": False, "tag": False, "dm": False}
         lowercase_tweet_text = tweet_text
-        split_text = lowercase_tweet_text.split()
-        logger.debug(f'lowercase_tweet_text: {lowercase_tweet_text}')
+        logger.debug('lowercase_tweet_text: %s', lowercase_tweet_text)
         logger.debug("Searching tweet for action keywords...")
-
-        # check if tweet contains any retweet keywords, special case for "rt" since it was returning false positives
-        if config.retweet:
-            for retweet_keyword in config.retweet_keywords:
-                lowercase_retweet_keyword = retweet_keyword.lower()
-                if lowercase_retweet_keyword == "rt":
-                    logger.debug(f'Searching split text for keyword "rt".')
-                    for word in split_text:
-                        if word == "rt":
-                            logger.debug(f'Found "rt" in split text.')
-                            actions["retweet"] = True
-                else:
-                    if lowercase_retweet_keyword in lowercase_tweet_text:
-                        actions["retweet"] = True
-            if actions.get("retweet"):
-                logger.debug("Retweet keyword found in tweet.")
-        # check if tweet contains any like keywords
-        if any(like_keyword.lower() in lowercase_tweet_text for like_keyword in config.like_keywords) and config.like:
-            logger.debug("Like keyword found in tweet.")
-            actions["like"] = True
-        # check if tweet contains any follow keywords
-        if any(follow_keyword.lower() in lowercase_tweet_text for follow_keyword in
-               config.follow_keywords) and config.follow:
-            logger.debug("Follow keyword found in tweet.")
-            actions["follow"] = True
-        # check if tweet contains any comment keywords
-        if any(comment_keyword.lower() in lowercase_tweet_text for comment_keyword in
-               config.comment_keywords) and config.comment:
-            logger.debug("Comment keyword found in tweet.")
-            actions["comment"] = True
-        # check if tweet contains any tag keywords
-        if any(tag_keyword.lower() in lowercase_tweet_text for tag_keyword in config.tag_keywords) and config.comment:
-            logger.debug("Tag keyword found in tweet.")
-            actions["tag"] = True
-        # check if tweet contains any dm keywords
-        if any(dm_keyword.lower() in lowercase_tweet_text for dm_keyword in config.dm_keywords) and config.dm:
-            logger.debug("Dm keyword found in tweet.")
-            actions["dm"] = True
+        with metrics.STAGE_SECONDS.time(stage="classify"):
+            found = _get_matcher(logger, matcher).classify(lowercase_tweet_text)
+        actions = {action: action in found for action in ACTIONS}
+        if logger.isEnabledFor(logging.DEBUG):
+            for action in ACTIONS:
+                if actions[action]:
+                    logger.debug('%s keyword found in tweet.', action.capitalize())
         # if any actions detected
         if any(value for value in actions.values()):
             # if only follow action detected
@@ -327,57 +836,130 @@ def find_actions(logger, tweet_text):
         return False
 
 
-def perform_actions(logger, api, tweet, actions):
+def find_actions_batch(logger, tweet_texts, matcher=None, classifier=None):
+    """
+    find_actions() for a batch of tweets. With a classifier the whole batch is scored in one pass first and tweets it
+    scores below its threshold are skipped without checking the action keywords.
+    :param logger: logger instance.
+    :param tweet_texts: list of lowercase tweet texts from check_tweet().
+    :param classifier: optional classifier.ContestClassifier, ex: settings.classifier.
+    :return: list of actions dicts or False, same order as tweet_texts.
+    """
+    if classifier is None:
+        return [find_actions(logger, tweet_text, matcher) for tweet_text in tweet_texts]
+    try:
+        with metrics.STAGE_SECONDS.time(stage="score"):
+            is_contest = classifier.is_contest(tweet_texts)
+    except Exception as e:
+        logger.error(f'find_actions_batch error: {e}')
+        return [find_actions(logger, tweet_text, matcher) for tweet_text in tweet_texts]
+    logger.debug('Classifier scored %d of %d tweets as contests.', sum(is_contest), len(tweet_texts))
+    return [find_actions(logger, tweet_text, matcher) if contest else False
+            for tweet_text, contest in zip(tweet_texts, is_contest)]
+
+
+def perform_actions(logger, api, tweet, actions, seen_index=None, following_cache=None, settings=None, run_state=None,
+                    journal=None):
+    settings = _get_settings(settings)
     actions_ran = {"retweet": False, "like": False, "follow": False, "comment": False, "tag": False,
                    "dm": False}
+    # actions are journaled under the contest's original tweet id, the same id a retweet of it is deduped by
+    contest_id = _get_tweet_ids(logger, tweet)[-1]
     try:
         if actions.get("follow"):
-            following = _get_following(logger, api)
-            max_following = _get_random_max_following(logger)
+            following = _get_following(logger, api, following_cache, settings)
+            max_following = _get_random_max_following(logger, settings)
             if len(following) > max_following:
-                total_unfollowed = _unfollow_mode(logger, api, following)
+                total_unfollowed = _unfollow_mode(logger, api, following, following_cache, settings, run_state,
+                                                  journal)
                 return total_unfollowed
-            follow = _follow(logger, api, tweet)
+            follow = _journaled(logger, journal, "follow", contest_id,
+                                lambda: _follow(logger, api, tweet, following_cache, settings))
             actions_ran["follow"] = follow
+            metrics.ACTIONS.inc(action="follow", result="ok" if follow else "failed")
             if not follow:
                 logger.warning("Problem following.")
+                # ex: already following the user, reload the following list from the api next time it is needed
+                if following_cache is not None:
+                    following_cache.invalidate()
         if actions.get("retweet"):
-            retweet = _retweet(logger, api, tweet)
+            retweet = _journaled(logger, journal, "retweet", contest_id, lambda: _retweet(logger, api, tweet, settings))
             actions_ran["retweet"] = retweet
+            metrics.ACTIONS.inc(action="retweet", result="ok" if retweet else "failed")
             if not retweet:
                 logger.warning("Problem retweeting. Skipping tweet.")
                 return False
         if actions.get("like"):
-            like = _like(logger, api, tweet)
+            like = _journaled(logger, journal, "like", contest_id, lambda: _like(logger, api, tweet, settings))
             actions_ran["like"] = like
+            metrics.ACTIONS.inc(action="like", result="ok" if like else "failed")
             if not like:
                 logger.warning("Problem liking. Skipping tweet.")
                 return False
         if actions.get("comment") and not actions.get("tag"):
-            comment = _comment(logger, api, tweet)
+            comment = _journaled(logger, journal, "comment", contest_id,
+                                 lambda: _comment(logger, api, tweet, settings=settings))
             actions_ran["comment"] = comment
+            metrics.ACTIONS.inc(action="comment", result="ok" if comment else "failed")
             if not comment:
                 logger.warning("Problem commenting. Skipping tweet.")
                 return False
         if actions.get("tag"):
-            tag = _comment(logger, api, tweet, tag=True)
+            tag = _journaled(logger, journal, "tag", contest_id,
+                             lambda: _comment(logger, api, tweet, tag=True, settings=settings))
             actions_ran["tag"] = tag
+            metrics.ACTIONS.inc(action="tag", result="ok" if tag else "failed")
             if not tag:
                 logger.warning("Problem tagging. Skipping tweet.")
                 return False
         if actions.get("dm"):
-            dm = _dm(logger, api, tweet)
+            dm = _journaled(logger, journal, "dm", contest_id, lambda: _dm(logger, api, tweet, settings))
             actions_ran["dm"] = dm
+            metrics.ACTIONS.inc(action="dm", result="ok" if dm else "failed")
             if not dm:
                 logger.warning("Problem dming. Skipping tweet.")
                 return False
         logger.info("All detected actions were performed on tweet.")
-        _random_sleep(logger, config.sleep_per_tweet[0], config.sleep_per_tweet[1])
+        mark_seen(logger, seen_index, tweet, "acted")
+        _pace(logger, api, settings.sleep_per_tweet[0], settings.sleep_per_tweet[1])
         return actions_ran
     except tweepy.TweepError as e:
         return _tweepy_error_handler(logger, e)
 
 
+def lookup_users(logger, api, user_ids):
+    """
+    Resolves user ids to screen names with one users/lookup api call per 100 ids that are not cached yet.
+    :param logger: logger instance.
+    :param api: tweepy api instance.
+    :param user_ids: list of user ids.
+    :return: dict of user id -> screen name for the ids that still exist. Suspended, deactivated and invalid users are
+    left out. False if the lookup failed.
+    """
+    try:
+        screen_names = {}
+        missing = []
+        for user_id in user_ids:
+            screen_name = _screen_names.get(user_id)
+            if screen_name is None:
+                missing.append(user_id)
+            else:
+                screen_names[user_id] = screen_name
+        for start in range(0, len(missing), USER_LOOKUP_BATCH_SIZE):
+            _wait_for_rate_limit(logger, api, "users/lookup")
+            for user in api.lookup_users(user_ids=missing[start:start + USER_LOOKUP_BATCH_SIZE]):
+                _screen_names.put(user.id, user.screen_name)
+                screen_names[user.id] = user.screen_name
+        logger.debug('Looked up %d users, %d of them no longer exist.', len(user_ids),
+                     len(user_ids) - len(screen_names))
+        return screen_names
+    except tweepy.TweepError as e:
+        return _tweepy_error_handler(logger, e)
+    except Exception as e:
+        logger.error(f'lookup_users error: {e}')
+        return False
+
+
 def get_next_search_type(logger, current_search_type):
     if current_search_type == "mixed":
         new_search_type = "recent"
@@ -393,89 +975,252 @@ def get_next_search_type(logger, current_search_type):
     return new_search_type
 
 
-def multiply_sleeps(logger):
-    config.sleep_per_tweet = [sleep_time * config.sleep_multiplier for sleep_time in config.sleep_per_tweet]
-    config.sleep_per_action = [sleep_time * config.sleep_multiplier for sleep_time in config.sleep_per_action]
-    config.sleep_per_unfollow = [sleep_time * config.sleep_multiplier for sleep_time in config.sleep_per_unfollow]
-    config.sleep_unfollow_mode = [sleep_time * config.sleep_multiplier for sleep_time in config.sleep_unfollow_mode]
-    logger.debug(f'Sleeps successfully multiplied.')
+def _get_matcher(logger, matcher):
+    # fall back to a matcher built once from config.py when the caller did not pass one in
+    global _default_matcher
+    if matcher is not None:
+        return matcher
+    if _default_matcher is None:
+        _default_matcher = build_matcher(logger)
+    return _default_matcher
+
+
+def _get_settings(settings):
+    # functions read the config module directly when the caller did not pass a settings.Settings object in
+    return config if settings is None else settings
 
 
-def _get_random_max_following(logger):
-    random_max_following = random.randint(config.max_following[0], config.max_following[1])
+def _get_random_max_following(logger, settings=None):
+    settings = _get_settings(settings)
+    random_max_following = random.randint(settings.max_following[0], settings.max_following[1])
     logger.debug(f'Random max following: {random_max_following}')
     return random_max_following
 
 
+def _get_tweet_record(logger, tweet):
+    # tweets from the search are already records, tweepy status objects from elsewhere are extracted on the fly
+    if isinstance(tweet, TweetRecord):
+        return tweet
+    return TweetRecord.from_status(tweet)
+
+
 def _get_tweet_text(logger, tweet):
-    # status is a retweet
+    record = _get_tweet_record(logger, tweet)
+    logger.debug('Tweet text extracted successfully. Tweet is %s.',
+                 "a retweet" if record.is_retweet else "not a retweet")
+    return record.text
+
+
+def _build_search_query(logger, keyword, settings=None):
+    settings = _get_settings(settings)
+    search_keyword = keyword.lower()
+    if not settings.include_retweets and not settings.include_replies:
+        logger.debug("Not including retweets or replies.")
+        search_keyword = f'{search_keyword} -filter:retweets AND -filter:replies'
+    elif not settings.include_retweets and settings.include_replies:
+        logger.debug("Not including retweets.")
+        search_keyword = f'{search_keyword} -filter:retweets'
+    elif not settings.include_replies and settings.include_retweets:
+        logger.debug("Not including replies.")
+        search_keyword = f'{search_keyword} -filter:replies'
+    else:
+        logger.debug("No retweet or reply filters added to search keyword.")
+    return search_keyword
+
+
+def _search_pages(logger, api, search_keyword, search_type, since_id):
+    # full pages instead of the default 15 tweets, so every search request and its response overhead returns up to 100
+    # tweets. search/tweets has no trim_user, entities are kept since TweetRecord reads hashtags and mentions from them
+    return tweepy.Cursor(api.search, lang="en", result_type=search_type, tweet_mode="extended", q=search_keyword,
+                         since_id=since_id, count=SEARCH_PAGE_SIZE, include_entities=True).pages()
+
+
+def _new_statuses(page, since_id, limit, search_type="recent"):
+    """
+    :return: (statuses from page that are newer than since_id up to limit, True if the search should stop)
+    """
+    new_statuses = []
+    for status in page:
+        if len(new_statuses) == limit:
+            return new_statuses, True
+        if since_id and status.id <= since_id:
+            # only recent results are newest first, so only they can stop as soon as the cursor reaches tweets found by
+            # a previous search. mixed and popular results are ranked, an old tweet can come before new ones
+            if search_type == "recent":
+                return new_statuses, True
+            continue
+        new_statuses.append(status)
+    return new_statuses, False
+
+
+def _check_tweet(logger, api, tweet, matcher=None):
+    # returns (lowercase tweet text or False, reason it was rejected: "banned_user", "banned_word", "already_acted",
+    # "error", or None)
     try:
-        text = tweet.retweeted_status.full_text
-        logger.debug("Tweet text extracted successfully. Tweet is a retweet.")
-    # status is not a retweet
-    except AttributeError:
-        text = tweet.full_text
-        logger.debug("Tweet text extracted successfully. Tweet is not a retweet.")
-    return text.lower()
+        record = _get_tweet_record(logger, tweet)
+        lowercase_tweet_text = record.text
+        with metrics.STAGE_SECONDS.time(stage="filter"):
+            found = _get_matcher(logger, matcher).classify(lowercase_tweet_text, record.screen_name)
+        # check if username has any banned user words in it (set in config.banned_user_words)
+        if "banned_user" in found:
+            logger.info("Banned user word found in username. Skipping tweet.")
+            return False, "banned_user"
+        # check if tweet text has any banned words in it (set in config.banned_words)
+        if "banned_word" in found:
+            logger.info("Banned word found in tweet. Skipping tweet.")
+            return False, "banned_word"
+        # flags were already refreshed in bulk by check_statuses()
+        if getattr(tweet, "status_checked", False):
+            status = tweet
+        # workaround to check if tweet has already been retweeted or liked
+        # placed this code block after banned username/tweet words to save an api call if banned words found first
+        else:
+            _wait_for_rate_limit(logger, api, "statuses/show")
+            with metrics.STAGE_SECONDS.time(stage="status_check"):
+                status = api.get_status(tweet.id)
+        # check if tweet has already been liked
+        if status.favorited:
+            logger.info("Tweet already liked. Skipping tweet.")
+            return False, "already_acted"
+        # check if tweet has already been retweeted
+        if status.retweeted:
+            logger.info("Tweet already retweeted. Skipping tweet.")
+            return False, "already_acted"
+        logger.debug("Found tweet that does not contain banned users, banned words, or already liked/retweeted.")
+        return lowercase_tweet_text, None
+    except tweepy.TweepError as e:
+        return _tweepy_error_handler(logger, e), "error"
+    except Exception as e:
+        logger.error(f'check_tweet error: {e}')
+        return False, "error"
 
 
-def _get_tweet_author(logger, tweet):
-    # status is a retweet
+def _check_status_batch(logger, api, batch, wait=True, on_unavailable=None):
     try:
-        author = tweet.retweeted_status.user.screen_name
-        logger.debug(f'Tweet is a retweet. Original author is @{author}.')
+        if wait:
+            _wait_for_rate_limit(logger, api, "statuses/lookup")
+        with metrics.STAGE_SECONDS.time(stage="status_check"):
+            statuses = {status.id: status for status in
+                        api.statuses_lookup([tweet.id for tweet in batch], include_entities=False, trim_user=True)}
+    except tweepy.TweepError as e:
+        _tweepy_error_handler(logger, e)
+        return batch
+    except Exception as e:
+        logger.error(f'_check_status_batch error: {e}')
+        return batch
+    checked_tweets = []
+    for tweet in batch:
+        status = statuses.get(tweet.id)
+        # deleted tweets and tweets from suspended or protected users are left out of the lookup response
+        if status is None:
+            logger.debug('Tweet %s is no longer available. Dropping tweet.', tweet.id)
+            if on_unavailable:
+                on_unavailable(tweet)
+            continue
+        tweet.favorited = status.favorited
+        tweet.retweeted = status.retweeted
+        tweet.status_checked = True
+        checked_tweets.append(tweet)
+    return checked_tweets
+
+
+def _get_tweet_ids(logger, tweet):
+    record = _get_tweet_record(logger, tweet)
+    # status is a retweet, the original tweet id identifies the contest
+    if record.is_retweet:
+        return record.id, record.original_id
     # status is not a retweet
-    except:
-        author = tweet.user.screen_name
-        logger.debug(f'Tweet is not a retweet. Author is @{author}.')
+    return record.id,
+
+
+def _get_tweet_author(logger, tweet):
+    record = _get_tweet_record(logger, tweet)
+    author = record.author
+    if record.is_retweet:
+        logger.debug('Tweet is a retweet. Original author is @%s.', author)
+    else:
+        logger.debug('Tweet is not a retweet. Author is @%s.', author)
     return author
 
 
 def _get_tweet_hashtags(logger, tweet):
-    hashtags = set()
-    lowercase_tweet_text = _get_tweet_text(logger, tweet)
-    for word in lowercase_tweet_text.split():
-        if word.startswith("#"):
-            hashtags.add(word)
+    hashtags = _get_tweet_record(logger, tweet).hashtags
     if hashtags:
         hashtags_string = ' '.join(hashtags)
-        logger.debug(f'Hashtags found in tweet: {hashtags_string}')
+        logger.debug('Hashtags found in tweet: %s', hashtags_string)
         return hashtags_string
     else:
         logger.debug("No hashtags found in tweet.")
         return False
 
 
-def _unfollow_mode(logger, api, following):
+def _unfollow_mode(logger, api, following, following_cache=None, settings=None, run_state=None, journal=None):
+    settings = _get_settings(settings)
     try:
-        num_invalid_following = 0  # invalid user will keep returning from following api call, so manually remove them
-        total_unfollowed = 0
-        total_to_unfollow = random.randint(config.unfollow_range[0], config.unfollow_range[1])
-        target_following = len(following) - total_to_unfollow
+        if run_state is not None and run_state.unfollow:
+            # resume the unfollow mode an earlier run was in the middle of
+            following = run_state.unfollow["following"]
+            total_unfollowed = run_state.unfollow["unfollowed"]
+            total_to_unfollow = run_state.unfollow["total"]
+            started = run_state.unfollow.get("started", 0)
+        else:
+            following = list(following)
+            total_unfollowed = 0
+            total_to_unfollow = random.randint(settings.unfollow_range[0], settings.unfollow_range[1])
+            started = time.time()
+        if run_state is not None:
+            run_state.unfollow = {"following": following, "total": total_to_unfollow, "unfollowed": total_unfollowed,
+                                  "started": started}
+            run_state.save(force=True)
         logger.info("--------------------------------------------------")
         logger.info("Starting unfollow mode...")
         logger.info(f'Unfollowing {total_to_unfollow} users.')
         logger.info("--------------------------------------------------")
-        _random_sleep(logger, config.sleep_unfollow_mode[0], config.sleep_unfollow_mode[1])
-        while len(following) > target_following:
+        _pace(logger, api, settings.sleep_unfollow_mode[0], settings.sleep_unfollow_mode[1])
+        # unfollow oldest follows first, working through the local list instead of reloading it after every unfollow
+        screen_names = {}
+        looked_up = set()
+        while total_unfollowed < total_to_unfollow and following:
             logger.info("\n")
-            unfollow = _unfollow(logger, api, following.pop())
+            if following[-1] not in looked_up:
+                # resolve the next oldest follows in one request, suspended or invalid users are skipped up front
+                batch = following[-USER_LOOKUP_BATCH_SIZE:]
+                looked_up.update(batch)
+                found = lookup_users(logger, api, batch)
+                screen_names.update(dict.fromkeys(batch) if found is False else found)
+            user_id = following.pop()
+            if journal is not None and journal.done("unfollow", user_id, started):
+                # unfollowed right before a crash, only the local state is behind
+                logger.info(f'User {user_id} was already unfollowed according to the action journal.')
+                total_unfollowed += 1
+                if following_cache is not None:
+                    following_cache.remove(user_id)
+                continue
+            if user_id not in screen_names:
+                logger.info(f'User {user_id} is suspended or no longer exists. Skipping user.')
+                if following_cache is not None:
+                    following_cache.remove(user_id)
+                continue
+            unfollow = _journaled(logger, journal, "unfollow", user_id,
+                                  lambda: _unfollow(logger, api, user_id, settings, screen_names[user_id]))
             if not unfollow:
                 logger.warning("Problem unfollowing. Skipping user.")
-                num_invalid_following += 1
+                # the user may already be gone, reload the following list from the api next time it is needed
+                if following_cache is not None:
+                    following_cache.invalidate()
             else:
                 total_unfollowed += 1
-            following = _get_following(logger, api)
-            # workaround for getting stuck in infinite loop when trying to unfollow suspended/invalid user from api
-            # if invalid users in following api return, manually pop them to ignore for remainder of this unfollow mode
-            if num_invalid_following:
-                for _ in range(num_invalid_following):
-                    user_id = following.pop()
-                    logger.debug(f'Manually popped problematic user id ({user_id}) from following list.')
-            unfollow_remaining = len(following) - target_following
-            logger.info(f'{unfollow_remaining} user(s) remaining to unfollow.')
+                if following_cache is not None:
+                    following_cache.remove(user_id)
+            if run_state is not None:
+                run_state.unfollow["unfollowed"] = total_unfollowed
+                run_state.save(force=True)
+            logger.info(f'{total_to_unfollow - total_unfollowed} user(s) remaining to unfollow.')
         logger.info("Unfollow mode completed.")
-        _random_sleep(logger, config.sleep_unfollow_mode[0], config.sleep_unfollow_mode[1])
+        if run_state is not None:
+            run_state.unfollow = None
+            run_state.save(force=True)
+        _pace(logger, api, settings.sleep_unfollow_mode[0], settings.sleep_unfollow_mode[1])
         return total_unfollowed
     except tweepy.TweepError as e:
         return _tweepy_error_handler(logger, e)
@@ -485,11 +1230,27 @@ def _unfollow_mode(logger, api, following):
         return False
 
 
-def _retweet(logger, api, tweet):
+def _journaled(logger, journal, action, target, perform):
+    # wraps an action in journal intent/outcome lines, an action the journal shows as done is not performed again
+    if journal is None:
+        return perform()
+    if journal.done(action, target):
+        logger.info(f'{action.capitalize()} was already done according to the action journal.')
+        return REPLAYED
+    journal.intend(action, target)
+    result = perform()
+    journal.complete(action, target, bool(result))
+    return result
+
+
+def _retweet(logger, api, tweet, settings=None):
+    settings = _get_settings(settings)
     try:
-        api.retweet(tweet.id)
+        _wait_for_turn(logger, api)
+        with metrics.ACTION_SECONDS.time(action="retweet"):
+            api.retweet(tweet.id)
         logger.info("Tweet retweeted.")
-        _random_sleep(logger, config.sleep_per_action[0], config.sleep_per_action[1])
+        _pace(logger, api, settings.sleep_per_action[0], settings.sleep_per_action[1])
         return True
     except tweepy.TweepError as e:
         return _tweepy_error_handler(logger, e)
@@ -498,11 +1259,14 @@ def _retweet(logger, api, tweet):
         return False
 
 
-def _like(logger, api, tweet):
+def _like(logger, api, tweet, settings=None):
+    settings = _get_settings(settings)
     try:
-        api.create_favorite(tweet.id)
+        _wait_for_turn(logger, api)
+        with metrics.ACTION_SECONDS.time(action="like"):
+            api.create_favorite(tweet.id)
         logger.info("Tweet liked.")
-        _random_sleep(logger, config.sleep_per_action[0], config.sleep_per_action[1])
+        _pace(logger, api, settings.sleep_per_action[0], settings.sleep_per_action[1])
         return True
     except tweepy.TweepError as e:
         return _tweepy_error_handler(logger, e)
@@ -511,12 +1275,17 @@ def _like(logger, api, tweet):
         return False
 
 
-def _follow(logger, api, tweet):
+def _follow(logger, api, tweet, following_cache=None, settings=None):
+    settings = _get_settings(settings)
     try:
         username = _get_tweet_author(logger, tweet)
-        api.create_friendship(username)
+        _wait_for_turn(logger, api)
+        with metrics.ACTION_SECONDS.time(action="follow"):
+            user = api.create_friendship(username)
+        if following_cache is not None:
+            following_cache.add(user.id)
         logger.info(f'Followed: @{username}')
-        _random_sleep(logger, config.sleep_per_action[0], config.sleep_per_action[1])
+        _pace(logger, api, settings.sleep_per_action[0], settings.sleep_per_action[1])
         return True
     except tweepy.TweepError as e:
         return _tweepy_error_handler(logger, e)
@@ -525,21 +1294,27 @@ def _follow(logger, api, tweet):
         return False
 
 
-def _comment(logger, api, tweet, tag=False):
+def _comment(logger, api, tweet, tag=False, settings=None):
+    settings = _get_settings(settings)
     try:
         # generate and build comment based off config.py settings
-        comment = _generate_text(logger)
-        if config.include_hashtags:
+        comment = _generate_text(logger, settings)
+        if settings.include_hashtags:
             hashtags = _get_tweet_hashtags(logger, tweet)
             if hashtags:
                 comment = f'{comment} {hashtags}'
         if tag:
-            tag_username = random.choice(config.tag_friends)
+            # friends the tweet already mentions are notified anyway, tag someone new when possible
+            mentions = _get_tweet_record(logger, tweet).mentions
+            tag_friends = [friend for friend in settings.tag_friends if friend.lower() not in mentions]
+            tag_username = random.choice(tag_friends or settings.tag_friends)
             comment = f'@{tag_username} {comment}'
 
-        api.update_status(status=comment, in_reply_to_status_id=tweet.id, auto_populate_reply_metadata=True)
+        _wait_for_turn(logger, api)
+        with metrics.ACTION_SECONDS.time(action="tag" if tag else "comment"):
+            api.update_status(status=comment, in_reply_to_status_id=tweet.id, auto_populate_reply_metadata=True)
         logger.info(f'Commented: {comment}')
-        _random_sleep(logger, config.sleep_per_action[0], config.sleep_per_action[1])
+        _pace(logger, api, settings.sleep_per_action[0], settings.sleep_per_action[1])
         return True
     except tweepy.TweepError as e:
         return _tweepy_error_handler(logger, e)
@@ -548,13 +1323,16 @@ def _comment(logger, api, tweet, tag=False):
         return False
 
 
-def _dm(logger, api, tweet):
+def _dm(logger, api, tweet, settings=None):
+    settings = _get_settings(settings)
     try:
         username = _get_tweet_author(logger, tweet)
-        message = _generate_text(logger)
-        api.send_direct_message(username, message)
+        message = _generate_text(logger, settings)
+        _wait_for_turn(logger, api)
+        with metrics.ACTION_SECONDS.time(action="dm"):
+            api.send_direct_message(username, message)
         logger.info(f'Direct messaged @{username}')
-        _random_sleep(logger, config.sleep_per_action[0], config.sleep_per_action[1])
+        _pace(logger, api, settings.sleep_per_action[0], settings.sleep_per_action[1])
         return True
     except tweepy.TweepError as e:
         return _tweepy_error_handler(logger, e)
@@ -563,11 +1341,23 @@ def _dm(logger, api, tweet):
         return False
 
 
-def _get_following(logger, api):
+def _get_following(logger, api, following_cache=None, settings=None):
+    settings = _get_settings(settings)
     try:
+        if following_cache is not None and not following_cache.is_stale():
+            # the cache itself is returned, its ids are only copied if _unfollow_mode() starts
+            logger.info(f'Current following: {len(following_cache)}')
+            return following_cache
         follower_ids = []
-        for user in tweepy.Cursor(api.friends_ids, screen_name=config.username, count=5000).items():
-            follower_ids.append(user)
+        pages = tweepy.Cursor(api.friends_ids, screen_name=settings.username, count=5000).pages()
+        while True:
+            _wait_for_rate_limit(logger, api, "friends/ids")
+            page = next(pages, None)
+            if page is None:
+                break
+            follower_ids.extend(page)
+        if following_cache is not None:
+            following_cache.replace(follower_ids)
         logger.info(f'Current following: {len(follower_ids)}')
         return follower_ids
     except tweepy.TweepError as e:
@@ -577,12 +1367,14 @@ def _get_following(logger, api):
         return False
 
 
-def _unfollow(logger, api, user_id):
+def _unfollow(logger, api, user_id, settings=None, screen_name=None):
+    settings = _get_settings(settings)
     try:
-        username = api.get_user(user_id).screen_name
-        api.destroy_friendship(username)
-        logger.info(f'Unfollowed: @{username}')
-        _random_sleep(logger, config.sleep_per_unfollow[0], config.sleep_per_unfollow[1])
+        _wait_for_turn(logger, api)
+        with metrics.ACTION_SECONDS.time(action="unfollow"):
+            api.destroy_friendship(user_id=user_id)
+        logger.info(f'Unfollowed: @{screen_name}' if screen_name else f'Unfollowed user id: {user_id}')
+        _pace(logger, api, settings.sleep_per_unfollow[0], settings.sleep_per_unfollow[1])
         return True
     except tweepy.TweepError as e:
         return _tweepy_error_handler(logger, e)
@@ -591,33 +1383,78 @@ def _unfollow(logger, api, user_id):
         return False
 
 
+def _wait_for_rate_limit(logger, api, endpoint):
+    # api instances without a rate limiter (ex: created outside of authenticate()) are left to wait_on_rate_limit
+    rate_limiter = getattr(api, "rate_limiter", None)
+    if rate_limiter is None:
+        return
+    delay = rate_limiter.reserve(endpoint)
+    if delay > 0:
+        logger.info(f'Waiting {delay:.1f}s for {endpoint} rate limit.')
+        with metrics.STAGE_SECONDS.time(stage="rate_limit_wait"):
+            time.sleep(delay)
+
+
+def _pace(logger, api, minimum, maximum):
+    # schedule the next write a random time from now instead of sleeping, see ratelimit.Scheduler
+    scheduler = getattr(api, "scheduler", None)
+    if scheduler is None:
+        return _random_sleep(logger, minimum, maximum)
+    delay = scheduler.pace("write", minimum, maximum)
+    logger.info(f'Next action in at least {delay}s.')
+    return True
+
+
+def _wait_for_turn(logger, api):
+    scheduler = getattr(api, "scheduler", None)
+    if scheduler is None:
+        return
+    delay = scheduler.wait_time("write")
+    if delay > 0:
+        logger.info(f'Sleeping for {delay}s.')
+        with metrics.STAGE_SECONDS.time(stage="sleep"):
+            time.sleep(delay)
+
+
 def _random_sleep(logger, minimum, maximum):
     try:
         random_time = random.uniform(minimum, maximum)
         logger.info(f'Sleeping for {random_time}s.')
-        time.sleep(random_time)
+        with metrics.STAGE_SECONDS.time(stage="sleep"):
+            time.sleep(random_time)
         return True
     except Exception as e:
         logger.error(f'_random_sleep error: {e}')
         return False
 
 
-def _generate_text(logger):
+def _generate_text(logger, settings=None):
+    settings = _get_settings(settings)
     try:
-        reply = random.choice(config.comments) + random.choice(config.comment_punctuation)
+        reply = random.choice(settings.comments) + random.choice(settings.comment_punctuation)
         capitalization = random.choice(["original", "upper", "lower"])
 
         if capitalization == "upper":
             reply = reply.upper()
         elif capitalization == "lower":
             reply = reply.lower()
-        logger.debug(f'Text generated: {reply}')
+        logger.debug('Text generated: %s', reply)
         return reply
     except Exception as e:
         logger.error(f'_generate_text error: {e}')
         return False
 
 
+def _gzip_log_name(name):
+    return f'{name}.gz'
+
+
+def _gzip_log(source, dest):
+    with open(source, "rb") as source_file, gzip.open(dest, "wb") as dest_file:
+        shutil.copyfileobj(source_file, dest_file)
+    os.remove(source)
+
+
 def _tweepy_error_handler(logger, tweep_error):
     """
     :param logger: logger instance
@@ -0,0 +1,315 @@
+"""
+Append-only columnar archive of every tweet the bot processed and what it did with it, see config.archive_dir. Each
+fixed width column is its own file of packed numbers and each text column is a heap of utf-8 strings plus a file of end
+offsets, so a reader memory maps only the columns it needs and scans them without parsing or loading whole rows.
+
+    python archive.py archive                 # summary of the archive
+    python archive.py archive --grep "ps5"    # archived tweets with "ps5" in their text
+"""
+import argparse
+import bisect
+import calendar
+import mmap
+import os
+import time
+from array import array
+from collections import Counter
+
+# bit order of the detected and performed action columns, same as ContestBot.ACTIONS
+ACTIONS = ("retweet", "like", "follow", "comment", "tag", "dm")
+SEARCH_TYPES = ("mixed", "recent", "popular")
+# column name -> array typecode, numbers are stored in the machine's native byte order
+FIXED_COLUMNS = {"id": "Q", "original_id": "Q", "created_at": "d", "archived_at": "d", "search_type": "B",
+                 "detected": "B", "performed": "B"}
+STRING_COLUMNS = ("author", "text", "hashtags", "search_keyword")
+FLUSH_ROWS = 100  # rows buffered in memory before they are appended to the column files
+
+
+def encode_actions(actions):
+    """
+    :param actions: actions dict, ex: from ContestBot.find_actions() or perform_actions(), or False.
+    :return: bit mask of the actions that are True.
+    """
+    if not isinstance(actions, dict):
+        return 0
+    return sum(1 << bit for bit, action in enumerate(ACTIONS) if actions.get(action))
+
+
+def decode_actions(mask):
+    """
+    :return: tuple of action names in a bit mask from encode_actions().
+    """
+    return tuple(action for bit, action in enumerate(ACTIONS) if mask >> bit & 1)
+
+
+class ArchiveWriter:
+    """
+    Appends rows to the archive in path. A crash can leave the columns at different lengths, opening the archive
+    truncates every column back to the last complete row.
+    """
+
+    def __init__(self, path, flush_rows=FLUSH_ROWS):
+        self.path = path
+        self.flush_rows = flush_rows
+        os.makedirs(path, exist_ok=True)
+        self.rows = _repair(path)
+        self._heap_sizes = {name: os.path.getsize(_heap_path(path, name)) for name in STRING_COLUMNS}
+        self._files = {}
+        for name in FIXED_COLUMNS:
+            self._files[name] = open(_column_path(path, name), "ab")
+        for name in STRING_COLUMNS:
+            self._files[f'{name}.ends'] = open(_ends_path(path, name), "ab")
+            self._files[f'{name}.heap'] = open(_heap_path(path, name), "ab")
+        self._new_buffers()
+
+    def __len__(self):
+        return self.rows + self._buffered
+
+    def append(self, tweet, search_type, detected=False, performed=False, archived_at=None):
+        """
+        :param tweet: records.TweetRecord.
+        :param search_type: search type the tweet was found with.
+        :param detected: actions dict from ContestBot.find_actions(), or False.
+        :param performed: actions dict from ContestBot.perform_actions(), or False.
+        :param archived_at: optional unix time, defaults to now.
+        """
+        # created_at is a naive utc datetime from tweepy, timestamp() would read it as local time
+        created_at = float(calendar.timegm(tweet.created_at.utctimetuple())) if tweet.created_at else 0.0
+        values = {"id": tweet.id, "original_id": tweet.original_id, "created_at": created_at,
+                  "archived_at": archived_at or time.time(),
+                  "search_type": SEARCH_TYPES.index(search_type) if search_type in SEARCH_TYPES else 255,
+                  "detected": encode_actions(detected), "performed": encode_actions(performed)}
+        for name, value in values.items():
+            self._buffers[name].append(value)
+        strings = {"author": tweet.author, "text": tweet.text, "hashtags": ' '.join(tweet.hashtags),
+                   "search_keyword": getattr(tweet, "search_keyword", "")}
+        for name, value in strings.items():
+            encoded = value.encode("utf-8")
+            self._heaps[name] += encoded
+            self._heap_sizes[name] += len(encoded)
+            self._buffers[f'{name}.ends'].append(self._heap_sizes[name])
+        self._buffered += 1
+        if self._buffered >= self.flush_rows:
+            self.flush()
+
+    def flush(self):
+        if not self._buffered:
+            return
+        # the fixed columns are written first, then each text column's heap before its end offsets, so an end offset on
+        # disk never points past its heap and a crash part way through only leaves some columns longer than others,
+        # which _repair() trims back to the last complete row
+        for name in FIXED_COLUMNS:
+            self._buffers[name].tofile(self._files[name])
+        for name in STRING_COLUMNS:
+            self._files[f'{name}.heap'].write(self._heaps[name])
+            self._buffers[f'{name}.ends'].tofile(self._files[f'{name}.ends'])
+        for file in self._files.values():
+            file.flush()
+        self.rows += self._buffered
+        self._new_buffers()
+
+    def close(self):
+        self.flush()
+        for file in self._files.values():
+            file.close()
+        self._files = {}
+
+    def _new_buffers(self):
+        self._buffers = {name: array(typecode) for name, typecode in FIXED_COLUMNS.items()}
+        self._buffers.update({f'{name}.ends': array("Q") for name in STRING_COLUMNS})
+        self._heaps = {name: bytearray() for name in STRING_COLUMNS}
+        self._buffered = 0
+
+
+class ArchiveReader:
+    """
+    Read only view of an archive. Columns are memory mapped when first used and numbers are read straight from the
+    mapped pages, ex: sum(reader.column("performed")) never creates a row.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = _row_count(path)
+        self._maps = {}
+        self._views = {}
+
+    def __len__(self):
+        return self.rows
+
+    def __iter__(self):
+        for index in range(self.rows):
+            yield self.row(index)
+
+    def column(self, name):
+        """
+        :param name: name in FIXED_COLUMNS.
+        :return: memoryview of the column's numbers, one per row.
+        """
+        return self._view(_column_path(self.path, name), FIXED_COLUMNS[name])
+
+    def string(self, name, index):
+        """
+        :param name: name in STRING_COLUMNS.
+        :return: the string of row index.
+        """
+        ends = self._view(_ends_path(self.path, name), "Q")
+        heap = self._view(_heap_path(self.path, name), "B")
+        return bytes(heap[ends[index - 1] if index else 0:ends[index]]).decode("utf-8")
+
+    def strings(self, name):
+        """
+        :return: generator of the strings in a column, one per row.
+        """
+        ends = self._view(_ends_path(self.path, name), "Q")
+        heap = self._view(_heap_path(self.path, name), "B")
+        start = 0
+        for end in ends:
+            yield bytes(heap[start:end]).decode("utf-8")
+            start = end
+
+    def find(self, name, substring):
+        """
+        Searches a string column with one scan of its heap instead of decoding every row.
+        :param name: name in STRING_COLUMNS.
+        :param substring: text to find, ex: a lowercase word for the text column.
+        :return: sorted list of row indexes whose string contains substring.
+        """
+        ends = self._view(_ends_path(self.path, name), "Q")
+        heap_map = self._map(_heap_path(self.path, name))
+        needle = substring.encode("utf-8")
+        rows = []
+        position = heap_map.find(needle) if heap_map is not None and needle else -1
+        while position != -1:
+            # the row whose end offset is the first one past the match start, skip matches spanning two rows
+            index = bisect.bisect_right(ends, position)
+            if index < self.rows and position + len(needle) <= ends[index]:
+                rows.append(index)
+                position = heap_map.find(needle, ends[index])
+            else:
+                position = heap_map.find(needle, position + 1)
+        return rows
+
+    def row(self, index):
+        """
+        :return: dict of every column of a row, action columns as tuples of action names.
+        """
+        row = {name: self.column(name)[index] for name in FIXED_COLUMNS}
+        row.update({name: self.string(name, index) for name in STRING_COLUMNS})
+        row["search_type"] = SEARCH_TYPES[row["search_type"]] if row["search_type"] < len(SEARCH_TYPES) else ""
+        row["detected"] = decode_actions(row["detected"])
+        row["performed"] = decode_actions(row["performed"])
+        row["hashtags"] = tuple(row["hashtags"].split())
+        return row
+
+    def close(self):
+        for view in self._views.values():
+            view.release()
+        for archive_map in self._maps.values():
+            if archive_map is not None:
+                archive_map.close()
+        self._views = {}
+        self._maps = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _map(self, file_path):
+        if file_path not in self._maps:
+            archive_map = None
+            if os.path.exists(file_path) and os.path.getsize(file_path):
+                with open(file_path, "rb") as file:
+                    archive_map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[file_path] = archive_map
+        return self._maps[file_path]
+
+    def _view(self, file_path, typecode):
+        if file_path not in self._views:
+            archive_map = self._map(file_path)
+            itemsize = array(typecode).itemsize
+            if archive_map is None:
+                view = memoryview(b"").cast(typecode)
+            elif typecode == "B":
+                view = memoryview(archive_map)
+            else:
+                # rows appended after the reader was opened are left out
+                view = memoryview(archive_map)[:self.rows * itemsize].cast(typecode)
+            self._views[file_path] = view
+        return self._views[file_path]
+
+
+def _column_path(path, name):
+    return os.path.join(path, f'{name}.col')
+
+
+def _ends_path(path, name):
+    return os.path.join(path, f'{name}.ends')
+
+
+def _heap_path(path, name):
+    return os.path.join(path, f'{name}.heap')
+
+
+def _row_count(path):
+    # complete rows are the ones written to every column
+    counts = []
+    for name, typecode in FIXED_COLUMNS.items():
+        counts.append(_size(_column_path(path, name)) // array(typecode).itemsize)
+    for name in STRING_COLUMNS:
+        counts.append(_size(_ends_path(path, name)) // array("Q").itemsize)
+    return min(counts)
+
+
+def _repair(path):
+    rows = _row_count(path)
+    for name, typecode in FIXED_COLUMNS.items():
+        _truncate(_column_path(path, name), rows * array(typecode).itemsize)
+    for name in STRING_COLUMNS:
+        ends_path = _ends_path(path, name)
+        _truncate(ends_path, rows * array("Q").itemsize)
+        heap_size = 0
+        if rows:
+            last_end = array("Q")
+            with open(ends_path, "rb") as file:
+                file.seek((rows - 1) * last_end.itemsize)
+                last_end.fromfile(file, 1)
+            heap_size = last_end[0]
+        _truncate(_heap_path(path, name), heap_size)
+    return rows
+
+
+def _truncate(file_path, size):
+    with open(file_path, "ab") as file:
+        # only ever shrink, a column shorter than size would be padded with zeros
+        if file.tell() > size:
+            file.truncate(size)
+
+
+def _size(file_path):
+    try:
+        return os.path.getsize(file_path)
+    except OSError:
+        return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Summarize or search a ContestBot tweet archive.")
+    parser.add_argument("path", help="archive folder, ex: archive")
+    parser.add_argument("--grep", help="print archived tweets whose text contains this")
+    args = parser.parse_args()
+    started = time.perf_counter()
+    with ArchiveReader(args.path) as reader:
+        if args.grep:
+            for index in reader.find("text", args.grep.lower()):
+                row = reader.row(index)
+                print(f'{row["id"]} @{row["author"]} performed={",".join(row["performed"]) or "-"}: {row["text"]}')
+        else:
+            performed = reader.column("performed")
+            acted = len(performed) - bytes(performed).count(0)
+            keywords = Counter(reader.strings("search_keyword"))
+            print(f'{len(reader)} tweets archived, {acted} acted on.')
+            for keyword, count in keywords.most_common():
+                print(f'{count:>10}  {keyword or "-"}')
+    print(f'Scanned in {time.perf_counter() - started:.2f}s.')
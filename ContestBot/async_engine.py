@@ -0,0 +1,162 @@
+import asyncio
+import inspect
+import queue
+import threading
+from collections import namedtuple
+
+import ContestBot as bot
+import config
+import metrics
+from records import TweetRecord
+
+_POLL_SECONDS = 0.5
+_END = object()
+# marks the end of a keyword's statuses in iter_search_results(), its search checkpoint is moved when it is reached
+_Checkpoint = namedtuple("_Checkpoint", ("search_keyword", "newest_id"))
+
+
+async def search(logger, api, search_type=config.search_type, checkpoints=None, on_status=None, settings=None,
+                 on_finished=None):
+    """
+    Searches all config.search_keywords at the same time. tweepy only has a blocking http client, so each page request
+    runs in a worker thread while the event loop schedules the others. Every request first waits on the api's shared
+    ratelimit.RateLimiter so all searches together stay inside the search endpoint's 15 minute window.
+    :param logger: logger instance.
+    :param api: tweepy api instance from ContestBot.authenticate().
+    :param search_type: Valid: "mixed", "recent", "popular".
+    :param checkpoints: optional storage.SearchCheckpoints instance from ContestBot.open_search_checkpoints().
+    :param on_status: optional callback run with each records.TweetRecord as soon as its page arrives. It may be a
+    coroutine function, it returns False once the statuses are no longer wanted and the keyword's search stops without
+    moving its checkpoint.
+    :param settings: optional settings.Settings object from ContestBot.check_config(), defaults to config.py.
+    :param on_finished: optional coroutine function run with (search keyword, newest id) after a keyword's last status
+    was handed to on_status, in place of updating checkpoints.
+    :return: list of records.TweetRecord for all status(tweets) found, empty when on_status is given so nothing is
+    held in memory.
+    """
+    settings = bot._get_settings(settings)
+    logger.info("Searching for tweets...")
+    logger.info(f'Search type: {search_type}')
+    results = await asyncio.gather(*(_search_keyword(logger, api, keyword, search_type, checkpoints, on_status,
+                                                     settings, on_finished) for keyword in settings.search_keywords))
+    return [status for statuses in results for status in statuses]
+
+
+def iter_search_results(logger, api, search_type=config.search_type, checkpoints=None, settings=None,
+                        on_finished=None, queue_size=100):
+    """
+    Drop in replacement for ContestBot.iter_search_results() that searches all keywords at the same time on an event
+    loop in a background thread. Statuses are yielded in the order their pages arrive. A keyword's checkpoint is only
+    moved once all of its statuses were taken from the generator, and closing the generator cancels the searches still
+    running, so no rate limit is spent on pages that would be thrown away and no unused tweet is skipped by a later
+    search.
+    :param on_finished: optional callback run with (search keyword, newest id) after a keyword's last status was
+    taken, in place of updating checkpoints, ex: pipeline.TweetPipeline moves it once the statuses were processed.
+    :param queue_size: max statuses found but not taken yet.
+    """
+    results = queue.Queue(queue_size)
+    stopped = threading.Event()
+    loop = asyncio.new_event_loop()
+
+    def put(item):
+        # waits for room in the queue, False once the consumer stopped
+        while not stopped.is_set():
+            try:
+                results.put(item, timeout=_POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    async def on_status(record):
+        # a full queue blocks a worker thread instead of the event loop, the other keywords keep searching
+        return await loop.run_in_executor(None, put, record)
+
+    async def on_keyword_finished(search_keyword, newest_id):
+        await loop.run_in_executor(None, put, _Checkpoint(search_keyword, newest_id))
+
+    task = loop.create_task(search(logger, api, search_type, checkpoints, on_status, settings, on_keyword_finished))
+
+    def run():
+        try:
+            loop.run_until_complete(task)
+        except BaseException as e:
+            put(e)
+        finally:
+            loop.close()
+        put(_END)
+
+    threading.Thread(target=run, daemon=True, name="async-search").start()
+    try:
+        while True:
+            item = results.get()
+            if item is _END:
+                return
+            if isinstance(item, _Checkpoint):
+                if on_finished:
+                    on_finished(item.search_keyword, item.newest_id)
+                else:
+                    checkpoints.update(item.search_keyword, search_type, item.newest_id)
+                continue
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stopped.set()
+        try:
+            loop.call_soon_threadsafe(task.cancel)
+        except RuntimeError:
+            # the search already finished and closed its loop
+            pass
+
+
+async def _search_keyword(logger, api, keyword, search_type, checkpoints, on_status, settings, on_finished=None):
+    loop = asyncio.get_running_loop()
+    search_keyword = bot._build_search_query(logger, keyword, settings)
+    since_id = checkpoints.get(search_keyword, search_type) if checkpoints else None
+    newest_id = since_id
+    found = []
+    num_found = 0
+    logger.info(f'Gathering {settings.count} tweets with "{search_keyword}" keyword.')
+    pages = bot._search_pages(logger, api, search_keyword, search_type, since_id)
+    while num_found < settings.count:
+        await _wait_for_rate_limit(logger, api, "search/tweets")
+        with metrics.STAGE_SECONDS.time(stage="search_page"):
+            page = await loop.run_in_executor(None, next, pages, None)
+        if not page:
+            break
+        statuses, done = bot._new_statuses(page, since_id, settings.count - num_found, search_type)
+        for status in statuses:
+            newest_id = max(newest_id or 0, status.id)
+            num_found += 1
+            record = TweetRecord.from_status(status, keyword)
+            if on_status:
+                delivered = on_status(record)
+                if inspect.isawaitable(delivered):
+                    delivered = await delivered
+                if delivered is False:
+                    # nobody takes the statuses anymore, keep the checkpoint so a later search finds them again
+                    logger.debug(f'Stopped finding tweets for "{search_keyword}".')
+                    return found
+            else:
+                found.append(record)
+        if done:
+            break
+    if checkpoints:
+        if on_finished:
+            await on_finished(search_keyword, newest_id)
+        else:
+            checkpoints.update(search_keyword, search_type, newest_id)
+    logger.debug(f'Finished finding tweets for "{search_keyword}". Found {num_found} tweets.')
+    return found
+
+
+async def _wait_for_rate_limit(logger, api, endpoint):
+    rate_limiter = getattr(api, "rate_limiter", None)
+    if rate_limiter is None:
+        return
+    delay = rate_limiter.reserve(endpoint)
+    if delay > 0:
+        logger.info(f'Waiting {delay:.1f}s for {endpoint} rate limit.')
+        with metrics.STAGE_SECONDS.time(stage="rate_limit_wait"):
+            await asyncio.sleep(delay)
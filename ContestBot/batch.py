@@ -0,0 +1,109 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import ContestBot as bot
+from records import TweetRecord
+
+CHUNK_SIZE = 500  # tweets sent to a worker process at a time, large enough that pickling overhead stays small
+MIN_POOL_TWEETS = 2000  # smaller batches are classified in this process, starting workers would cost more than it saves
+
+_worker_logger = None
+_worker_matcher = None
+
+
+class BatchClassifier:
+    """
+    Classifies a large set of tweets across a pool of worker processes. Each tweet goes through the same code as the
+    serial path, ContestBot.check_tweet() then ContestBot.find_actions(), so the results are identical. Only the pure
+    CPU work runs in the workers: text, author and hashtag extraction, banned word filtering and action keywords.
+
+    The liked/retweeted check uses the flags the tweets already have instead of an api call per tweet, call
+    ContestBot.check_statuses() first to refresh them.
+
+    Use it as a context manager or call close() so the worker processes are shut down.
+    """
+
+    def __init__(self, logger, matcher=None, workers=None, chunk_size=CHUNK_SIZE, min_pool_tweets=MIN_POOL_TWEETS):
+        """
+        :param logger: logger instance, used for batches classified in this process.
+        :param matcher: optional matcher.KeywordMatcher from ContestBot.build_matcher(), sent to every worker.
+        :param workers: number of worker processes, defaults to the number of cpus.
+        """
+        self.logger = logger
+        self.matcher = bot._get_matcher(logger, matcher)
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.min_pool_tweets = min_pool_tweets
+        self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def classify(self, tweets):
+        """
+        :param tweets: list of records.TweetRecord or tweepy status objects, ex: from ContestBot.get_tweets().
+        :return: list with the actions dict from ContestBot.find_actions() for each tweet in input order, False for
+        tweets that were filtered out or have no actions.
+        """
+        rows = [_to_row(bot._get_tweet_record(self.logger, tweet)) for tweet in tweets]
+        if self.workers == 1 or len(rows) < self.min_pool_tweets:
+            return _classify_rows(self.logger, self.matcher, rows)
+        chunks = [rows[start:start + self.chunk_size] for start in range(0, len(rows), self.chunk_size)]
+        results = []
+        # map() returns chunks in submission order no matter which worker finishes first
+        for chunk_results in self._get_executor().map(_classify_chunk, chunks):
+            results.extend(chunk_results)
+        self.logger.info(f'Classified {len(results)} tweets with {self.workers} worker processes.')
+        return results
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.workers, initializer=_init_worker,
+                                                 initargs=(self.matcher, self.logger.level))
+        return self._executor
+
+
+def classify_tweet(logger, tweet, matcher=None):
+    """
+    Serial path of BatchClassifier for one tweet. The tweet's liked/retweeted flags must already be checked, ex: by
+    ContestBot.check_statuses(), since no api is available to check them.
+    :return: actions dict from ContestBot.find_actions(), or False.
+    """
+    tweet_text = bot.check_tweet(logger, None, tweet, matcher)
+    if not tweet_text:
+        return False
+    return bot.find_actions(logger, tweet_text, matcher)
+
+
+def _to_row(record):
+    # plain tuples pickle smaller and faster than records, the flags are used as checked since there is no api here
+    return (record.id, record.original_id, record.text, record.screen_name, record.author, record.hashtags,
+            record.favorited, record.retweeted, record.created_at, True, record.followers_count, record.retweet_count,
+            record.favorite_count)
+
+
+def _classify_rows(logger, matcher, rows):
+    return [classify_tweet(logger, TweetRecord(*row), matcher) for row in rows]
+
+
+def _init_worker(matcher, level):
+    global _worker_logger, _worker_matcher
+    # workers log warnings and errors only, skip messages for each tweet would interleave across processes
+    _worker_logger = logging.getLogger("ContestBot.batch")
+    _worker_logger.setLevel(max(level, logging.WARNING))
+    if not _worker_logger.handlers:
+        _worker_logger.addHandler(logging.StreamHandler())
+    _worker_matcher = matcher
+
+
+def _classify_chunk(rows):
+    return _classify_rows(_worker_logger, _worker_matcher, rows)
@@ -0,0 +1,170 @@
+"""
+Benchmarks the per tweet hot path over a synthetic corpus with the network stubbed out by fake_api.FakeTwitterAPI.
+
+    python benchmark.py                  # compare against benchmark_baselines.json, exits 1 on a regression
+    python benchmark.py --save           # store the results as the new baselines
+    python benchmark.py -n 20000 -t 0.1  # larger corpus, flag anything 10% worse than the baseline
+"""
+import argparse
+import logging
+import time
+import tracemalloc
+
+from tweepy.models import Status
+
+import ContestBot as bot
+from fake_api import FakeTwitterAPI, generate_statuses
+from records import TweetRecord
+from storage import load_json, write_json_atomic
+
+BASELINES_FILE = "benchmark_baselines.json"
+CORPUS_SIZE = 5000
+ALLOCATION_SAMPLE = 1000  # tweets traced with tracemalloc, tracing slows every call down so it runs as a separate pass
+THRESHOLD = 0.2  # fraction a result may be worse than its baseline before it is flagged as a regression
+PERCENTILES = (50, 90, 99)
+
+# name -> function(logger, api, tweet, matcher) run once per tweet
+BENCHMARKS = {
+    "_get_tweet_text": lambda logger, api, tweet, matcher: bot._get_tweet_text(logger, tweet),
+    "_get_tweet_hashtags": lambda logger, api, tweet, matcher: bot._get_tweet_hashtags(logger, tweet),
+    "check_tweet": lambda logger, api, tweet, matcher: bot.check_tweet(logger, api, tweet, matcher),
+    "find_actions": lambda logger, api, tweet, matcher: bot.find_actions(logger, tweet.text, matcher),
+    "_generate_text": lambda logger, api, tweet, matcher: bot._generate_text(logger),
+}
+
+
+def build_corpus(count=CORPUS_SIZE, seed=0):
+    """
+    :return: (FakeTwitterAPI without latency or rate limits, list of records.TweetRecord) from
+    fake_api.generate_statuses(), extracted the same way as the search does. Records are marked as checked like
+    ContestBot.check_statuses() does, so check_tweet() never calls the api.
+    """
+    api = FakeTwitterAPI(generate_statuses(count, seed), rate_limits={})
+    tweets = []
+    for status_json in api.statuses.values():
+        tweet = TweetRecord.from_status(Status.parse(api, status_json))
+        tweet.status_checked = True
+        tweets.append(tweet)
+    return api, tweets
+
+
+def run(logger=None, count=CORPUS_SIZE, names=None, seed=0):
+    """
+    Runs each benchmark over the same corpus.
+    :param logger: logger passed to the benchmarked functions. Defaults to a warning level logger so console output is
+    not part of the measurement.
+    :param names: benchmark names to run, defaults to all of BENCHMARKS.
+    :return: dict of benchmark name -> result dict with tweets_per_second, latency percentiles in microseconds and
+    allocated bytes per tweet.
+    """
+    logger = logger or _quiet_logger()
+    api, tweets = build_corpus(count, seed)
+    matcher = bot.build_matcher(logger)
+    # every tweet would be a classification cache hit after the warm up, measure the keyword scan itself
+    matcher.cache = None
+    results = {}
+    for name in names or BENCHMARKS:
+        benchmark = BENCHMARKS[name]
+        # warm up caches and lazily compiled regexes
+        for tweet in tweets[:100]:
+            benchmark(logger, api, tweet, matcher)
+        results[name] = _measure(logger, api, tweets, matcher, benchmark)
+    return results
+
+
+def compare(results, baselines, threshold=THRESHOLD):
+    """
+    :param results: dict from run().
+    :param baselines: dict from a previous run(), ex: load_baselines().
+    :return: list of regression messages, empty when every result is within threshold of its baseline.
+    """
+    regressions = []
+    for name, result in results.items():
+        baseline = baselines.get(name)
+        if not baseline:
+            continue
+        if result["tweets_per_second"] < baseline["tweets_per_second"] * (1 - threshold):
+            regressions.append(f'{name}: {result["tweets_per_second"]:.0f} tweets/s, baseline '
+                               f'{baseline["tweets_per_second"]:.0f} tweets/s')
+        for metric in ("p99_us", "bytes_per_tweet"):
+            # ignore tiny absolute values where timer and allocator noise is larger than the threshold
+            if result[metric] > baseline[metric] * (1 + threshold) and result[metric] - baseline[metric] > 1:
+                regressions.append(f'{name}: {metric} {result[metric]:.1f}, baseline {baseline[metric]:.1f}')
+    return regressions
+
+
+def load_baselines(path=BASELINES_FILE):
+    return load_json(path, {})
+
+
+def save_baselines(results, path=BASELINES_FILE):
+    write_json_atomic(path, results)
+
+
+def _measure(logger, api, tweets, matcher, benchmark):
+    latencies = []
+    timer = time.perf_counter_ns
+    started = timer()
+    for tweet in tweets:
+        call_started = timer()
+        benchmark(logger, api, tweet, matcher)
+        latencies.append(timer() - call_started)
+    elapsed = (timer() - started) / 1e9
+    latencies.sort()
+    result = {"tweets": len(tweets), "tweets_per_second": len(tweets) / elapsed if elapsed else 0}
+    for percentile in PERCENTILES:
+        index = min(len(latencies) - 1, len(latencies) * percentile // 100)
+        result[f'p{percentile}_us'] = latencies[index] / 1000
+    result["max_us"] = latencies[-1] / 1000
+    result["bytes_per_tweet"] = _allocated_bytes(logger, api, tweets[:ALLOCATION_SAMPLE], matcher, benchmark)
+    return result
+
+
+def _allocated_bytes(logger, api, tweets, matcher, benchmark):
+    # peak traced memory of each call, clear_traces() resets the peak so every call is measured on its own
+    total = 0
+    tracemalloc.start()
+    try:
+        for tweet in tweets:
+            tracemalloc.clear_traces()
+            benchmark(logger, api, tweet, matcher)
+            total += tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return total / len(tweets) if tweets else 0
+
+
+def _quiet_logger():
+    logger = logging.getLogger("ContestBot.benchmark")
+    logger.setLevel(logging.WARNING)
+    logger.propagate = False
+    if not logger.handlers:
+        logger.addHandler(logging.NullHandler())
+    return logger
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the ContestBot tweet processing hot path.")
+    parser.add_argument("-n", "--count", type=int, default=CORPUS_SIZE, help="synthetic tweets in the corpus")
+    parser.add_argument("-b", "--baselines", default=BASELINES_FILE, help="baselines json file")
+    parser.add_argument("-t", "--threshold", type=float, default=THRESHOLD, help="allowed fraction worse than baseline")
+    parser.add_argument("--save", action="store_true", help="save the results as the new baselines")
+    parser.add_argument("names", nargs="*", help=f'benchmarks to run, default all: {", ".join(BENCHMARKS)}')
+    args = parser.parse_args()
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f'unknown benchmark(s): {", ".join(unknown)}')
+    results = run(count=args.count, names=args.names)
+    print(f'{"benchmark":<22}{"tweets/s":>12}{"p50 us":>10}{"p90 us":>10}{"p99 us":>10}{"max us":>10}{"bytes":>10}')
+    for name, result in results.items():
+        print(f'{name:<22}{result["tweets_per_second"]:>12.0f}{result["p50_us"]:>10.1f}{result["p90_us"]:>10.1f}'
+              f'{result["p99_us"]:>10.1f}{result["max_us"]:>10.1f}{result["bytes_per_tweet"]:>10.0f}')
+    if args.save:
+        save_baselines(results, args.baselines)
+        print(f'Saved baselines to {args.baselines}.')
+    else:
+        regressions = compare(results, load_baselines(args.baselines), args.threshold)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            raise SystemExit(1)
@@ -0,0 +1,71 @@
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+
+class LRUCache:
+    """
+    Bounded dict that forgets the least recently used key once it holds maxsize keys, and with a ttl also forgets keys
+    older than ttl seconds. Counts hits and misses, in metrics.CACHE_LOOKUPS too when it has a name. Safe to share
+    between the pipeline threads. A pickled copy, ex: sent to a batch.BatchClassifier worker, starts out empty.
+    """
+
+    def __init__(self, maxsize, ttl=None, name=None):
+        """
+        :param maxsize: max keys kept.
+        :param ttl: optional seconds a key is kept after it was stored.
+        :param name: optional cache label for metrics.CACHE_LOOKUPS, ex: "classification".
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()  # key -> (value, monotonic time it expires or None)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        item = self._items.get(key)
+        return item is not None and not self._expired(item)
+
+    def __reduce__(self):
+        return self.__class__, (self.maxsize, self.ttl, self.name)
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and self._expired(item):
+                del self._items[key]
+                item = None
+            if item is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._items.move_to_end(key)
+        if self.name:
+            metrics.CACHE_LOOKUPS.inc(cache=self.name, result="miss" if item is None else "hit")
+        return default if item is None else item[0]
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = (value, time.monotonic() + self.ttl if self.ttl else None)
+            self._items.move_to_end(key)
+            if len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    @staticmethod
+    def _expired(item):
+        return item[1] is not None and time.monotonic() >= item[1]
@@ -0,0 +1,162 @@
+"""
+Optional contest/spam classifier scored before the action keywords, see config.classifier_model. Tweets are turned into
+hashed word and word pair features and scored by a logistic regression model trained offline from labelled tweets:
+
+    python classifier.py train labelled.jsonl contest_model.npz   # one {"text": "...", "contest": true} per line
+    python classifier.py score contest_model.npz "RT and follow to win a $100 gift card"
+
+Needs numpy, without it the bot only uses the keyword rules.
+"""
+import argparse
+import json
+import re
+import zlib
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+N_FEATURES = 2 ** 18  # hashed feature slots, collisions are rare enough at a few thousand distinct words
+SLOT_CACHE_SIZE = 2 ** 20  # n-grams whose feature slot is remembered, contest tweets reuse the same few words
+_TOKEN_PATTERN = re.compile(r"[#@$]?\w+")
+
+
+class ContestClassifier:
+    """
+    Linear model over hashed n-gram features. score() turns a whole batch of tweets into one flat array of feature
+    indices and sums each tweet's weights with a single np.bincount, so the per tweet cost is tokenizing and hashing.
+    """
+
+    def __init__(self, weights, bias=0.0, threshold=0.5, ngrams=2):
+        """
+        :param weights: numpy float array of N_FEATURES weights.
+        :param bias: model intercept.
+        :param threshold: min contest probability for is_contest() to be True.
+        :param ngrams: longest word n-gram used as a feature, 2 for single words and word pairs.
+        """
+        if np is None:
+            raise ImportError("The classifier needs numpy, install it with: pip install numpy")
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.bias = float(bias)
+        self.threshold = threshold
+        self.ngrams = ngrams
+        self._slots = {}
+
+    @classmethod
+    def load(cls, path, threshold=0.5):
+        """
+        :param path: .npz file saved by save().
+        """
+        if np is None:
+            raise ImportError("The classifier needs numpy, install it with: pip install numpy")
+        with np.load(path) as model:
+            return cls(model["weights"], float(model["bias"]), threshold, int(model["ngrams"]))
+
+    def save(self, path):
+        np.savez_compressed(path, weights=self.weights, bias=self.bias, ngrams=self.ngrams)
+
+    @classmethod
+    def train(cls, texts, labels, ngrams=2, epochs=200, learning_rate=0.5, l2=1e-6):
+        """
+        Fits a logistic regression model with full batch gradient descent.
+        :param texts: list of lowercase tweet texts.
+        :param labels: list of True for contests and False for everything else, same order as texts.
+        :return: trained ContestClassifier.
+        """
+        if np is None:
+            raise ImportError("The classifier needs numpy, install it with: pip install numpy")
+        rows, indices = features(texts, ngrams)
+        targets = np.asarray(labels, dtype=np.float64)
+        weights = np.zeros(N_FEATURES)
+        bias = 0.0
+        for _ in range(epochs):
+            errors = _sigmoid(np.bincount(rows, weights[indices], len(texts)) + bias) - targets
+            weights -= learning_rate * (np.bincount(indices, errors[rows], N_FEATURES) / len(texts) + l2 * weights)
+            bias -= learning_rate * errors.mean()
+        return cls(weights, bias, ngrams=ngrams)
+
+    def score(self, texts):
+        """
+        :param texts: list of lowercase tweet texts.
+        :return: numpy array of contest probabilities, same order as texts.
+        """
+        if len(self._slots) > SLOT_CACHE_SIZE:
+            self._slots.clear()
+        rows, indices = features(texts, self.ngrams, self._slots)
+        return _sigmoid(np.bincount(rows, self.weights[indices], len(texts)) + self.bias)
+
+    def is_contest(self, texts):
+        """
+        :return: list of True/False, True when a tweet's contest probability is at least the threshold.
+        """
+        return (self.score(texts) >= self.threshold).tolist()
+
+
+def features(texts, ngrams=2, slots=None):
+    """
+    :param texts: list of lowercase tweet texts.
+    :param slots: optional dict of n-gram -> feature slot filled in as a cache.
+    :return: (row array, feature index array) with one entry per n-gram: the position of its tweet in texts and its
+    hashed feature slot. crc32 is used instead of hash() because hash() is salted per process and a model has to
+    score the same features it was trained on.
+    """
+    slots = {} if slots is None else slots
+    rows = []
+    indices = []
+    for row, text in enumerate(texts):
+        tokens = _TOKEN_PATTERN.findall(text)
+        grams = list(tokens)
+        for n in range(2, ngrams + 1):
+            grams.extend(' '.join(tokens[start:start + n]) for start in range(len(tokens) - n + 1))
+        rows.extend([row] * len(grams))
+        for gram in grams:
+            slot = slots.get(gram)
+            if slot is None:
+                slot = slots[gram] = zlib.crc32(gram.encode("utf-8")) % N_FEATURES
+            indices.append(slot)
+    return np.asarray(rows, dtype=np.intp), np.asarray(indices, dtype=np.intp)
+
+
+def load_labelled(path):
+    """
+    :param path: json lines file with one {"text": "...", "contest": true/false} object per line.
+    :return: (list of lowercase texts, list of labels)
+    """
+    texts = []
+    labels = []
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                tweet = json.loads(line)
+                texts.append(tweet["text"].lower())
+                labels.append(bool(tweet["contest"]))
+    return texts, labels
+
+
+def _sigmoid(values):
+    return 1 / (1 + np.exp(-np.clip(values, -30, 30)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Train or try the ContestBot contest classifier.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    train_parser = commands.add_parser("train", help="train a model from labelled tweets")
+    train_parser.add_argument("labelled", help='json lines file of {"text": "...", "contest": true/false}')
+    train_parser.add_argument("model", help="model file to write, ex: contest_model.npz")
+    train_parser.add_argument("--epochs", type=int, default=200, help="gradient descent passes over the tweets")
+    score_parser = commands.add_parser("score", help="print the contest probability of some text")
+    score_parser.add_argument("model", help="model file from train")
+    score_parser.add_argument("texts", nargs="+", help="tweet texts to score")
+    args = parser.parse_args()
+    if args.command == "train":
+        texts, labels = load_labelled(args.labelled)
+        classifier = ContestClassifier.train(texts, labels, epochs=args.epochs)
+        classifier.save(args.model)
+        predictions = classifier.is_contest(texts)
+        accuracy = sum(predicted == label for predicted, label in zip(predictions, labels)) / len(texts)
+        print(f'Trained on {len(texts)} tweets, {sum(labels)} contests. Training accuracy: {accuracy:.1%}')
+    else:
+        classifier = ContestClassifier.load(args.model)
+        for text, score in zip(args.texts, classifier.score([text.lower() for text in args.texts])):
+            print(f'{score:.3f}  {text}')
@@ -25,10 +25,10 @@ dm_keywords = ["message", "dm"]
 
 # ========================SLEEP SETTINGS========================
 sleep_multiplier = 1   # multiply all sleeps by this amount. Suggested 2 for first week, then 1
-sleep_per_tweet = [180, 240]  # [min, max] random sleeps this time after all actions have been performed on each tweet
-sleep_per_action = [45, 60]  # [min, max] random sleeps this time after each action on a tweet such as rt, like, follow
-sleep_per_unfollow = [200, 300]  # [min, max] random sleeps this time after each unfollow in ContestBot._unfollow()
-sleep_unfollow_mode = [10800, 14400]  # [min, max] random sleeps this time at start and finish of ContestBot._unfollow_mode()
+sleep_per_tweet = [180, 240]  # [min, max] random minimum time between the last action on a tweet and the first action on the next tweet
+sleep_per_action = [45, 60]  # [min, max] random minimum time between actions such as rt, like, follow. Searches are paced by rate limits instead
+sleep_per_unfollow = [200, 300]  # [min, max] random minimum time after each unfollow in ContestBot._unfollow() before the next action
+sleep_unfollow_mode = [10800, 14400]  # [min, max] random minimum time before the first and after the last unfollow of ContestBot._unfollow_mode()
 
 
 # ========================SEARCH SETTINGS========================
@@ -39,11 +39,22 @@ banned_username_words = ["bot", "bts", "stan", "kpop"]
 banned_tweet_words = ["join", "download", "bts", "kpop", "album", "gcash", "subscribe", "answer", "robux", "indonesia", "kyoongcon"]
 include_retweets = True  # include in search results. True sometimes results in some duplicate but usually more quality tweets
 include_replies = False  # include in search results. Replies are often times NOT contests/giveaways
+near_duplicate_distance = 3  # max differing bits (of 64) between the text fingerprints of two tweets for the later one to be dropped as a copy of the same giveaway, 0 to 7, -1 to turn off
+async_search = False  # search all search_keywords at the same time with asyncio instead of one after another, rate limits are shared
+
+
+# ========================CLASSIFIER SETTINGS========================
+classifier_model = ""  # model file from "python classifier.py train" that scores tweets as contest or not before the action keywords are checked, "" to only use the keyword rules. Needs numpy
+classifier_threshold = 0.5  # min contest probability (0 to 1) for a tweet to be checked for actions
+classification_cache_size = 10000  # tweet texts whose keyword matches are remembered so retweets of the same tweet are not scanned again, 0 to turn off
+classification_cache_ttl = 3600  # seconds a tweet text's keyword matches are remembered, changing keyword settings clears them
+classifier_batch_size = 500  # max tweets scored together, tweets already waiting in the pipeline are scored as one batch
 
 
 # ========================FOLLOW/UNFOLLOW SETTINGS========================
 max_following = [1900, 1999]  # [min, max] random choice of max_following before ContestBot._unfollow_mode() is triggered, must be less than 2000
 unfollow_range = [100, 200]  # [min, max] random choice of users to unfollow in total for a run of ContestBot._unfollow_mode()
+following_cache_ttl = 86400  # seconds before the cached following list is reloaded from the api, follows/unfollows update it in between
 
 
 # ========================COMMENT SETTINGS========================
@@ -58,6 +69,46 @@ comments = ["Entering the giveaway", "I really want to win", "Please pick me", "
 comment_punctuation = ["", "!", "!!", "!!!", "!!!!", "!!!!!", "!!!!!!", ".", "..", "...", "....", ".....", "......"]
 
 
+# ========================RANKING SETTINGS========================
+rank_contests = False  # enter each search's contests best score first instead of in search order
+rank_queue_size = 200  # max contests waiting for actions, the lowest scores are dropped beyond it
+rank_max_age_hours = 72  # contests older than this or past a deadline found in the tweet ("ends friday") are dropped
+# score = sum of weight * value: actions = number of actions needed, followers = log10 of author followers,
+# engagement = log10 of retweets + likes, age = hours since posted, deadline = 0 to 1 as a deadline gets within a day
+rank_weights = {"actions": -1.0, "followers": 1.0, "engagement": 0.5, "age": -0.05, "deadline": 2.0}
+
+# ========================STATE SETTINGS========================
+seen_tweets_file = "seen_tweets.txt"  # ids of processed tweets are saved here so they are skipped after restarts, "" to keep in memory only
+search_checkpoints_file = "search_checkpoints.json"  # newest tweet id per search keyword so searches only return new tweets, "" to always search from scratch. Once a keyword finds count tweets its checkpoint moves to the newest one, so older unseen tweets past count are never fetched
+fingerprints_file = "fingerprints.txt"  # text fingerprints of processed tweets so copies of the same giveaway are skipped after restarts, "" to keep in memory only
+following_cache_file = "following.json"  # user ids the bot account follows, "" to keep in memory only
+run_state_file = "run_state.json"  # counters, search type, contests not acted on yet and unfollow progress so a restart resumes where it stopped, "" to keep in memory only
+action_journal_file = "action_journal.txt"  # every action is written here before and after it is performed so a restart does not repeat actions a crash interrupted, "" to keep in memory only
+action_journal_interval = 1.0  # max seconds an action's outcome waits to be written to the action journal, the intent is always written before the action
+archive_dir = "archive"  # folder of the columnar archive of every processed tweet and the actions taken, read it with: python archive.py archive, "" to not archive
+run_state_interval = 30  # min seconds between run_state_file saves while processing tweets, it is always saved before actions and unfollows
+watch_config = False  # apply changes saved to this file between tweets without restarting, settings read at startup (keys, files, logging, metrics) still need a restart
+
+
 # ========================LOGGING SETTINGS========================
 level = 2  # 1 for debug, 2 for info, 3 for warning, 4 for error, 5 for critical
 file_logs = True  # toggle file logs on/off
+log_max_bytes = 5 * 1024 * 1024  # ContestBot.log is rotated when it reaches this size, 0 to never rotate
+log_backup_count = 3  # rotated logs kept as gzip compressed ContestBot.log.1.gz, ContestBot.log.2.gz, ...
+
+
+# ========================PROFILING SETTINGS========================
+profile_cycles = False  # sample every thread during each search cycle and write the stacks to profile_dir for flamegraph.pl or speedscope, sleeps are reported separately. kill -USR1 <pid> toggles it while running
+profile_dir = "profiles"  # folder for the per cycle .folded profile files
+profile_interval = 0.005  # seconds between profile samples
+
+
+# ========================METRICS SETTINGS========================
+metrics_file = ""  # prometheus text file rewritten every metrics_interval seconds, ex: for the node_exporter textfile collector, "" to turn off
+metrics_interval = 15  # seconds between metrics_file writes
+metrics_port = 0  # serve prometheus metrics at http://127.0.0.1:<port>/metrics, 0 to turn off
+
+
+# ========================TESTING SETTINGS========================
+fake_api = ""  # "" for twitter, "synthetic" for generated tweets or a file saved with fake_api.save_statuses() to run offline against a fake api
+fake_api_latency = [0.05, 0.2]  # [min, max] random seconds each fake api request takes
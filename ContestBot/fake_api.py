@@ -0,0 +1,305 @@
+import json
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+import tweepy
+from tweepy.parsers import ModelParser, RawParser
+
+from ratelimit import ENDPOINT_LIMITS, WINDOW_SECONDS, Scheduler
+
+SYNTHETIC = "synthetic"  # config.fake_api value that serves generated tweets instead of a recorded file
+_CREATED_AT_FORMAT = "%a %b %d %H:%M:%S +0000 %Y"
+
+
+class _FakeMethod:
+    """
+    Callable that behaves like the methods tweepy.API binds for each endpoint, so tweepy.Cursor can paginate it and
+    responses are parsed into real tweepy models.
+    """
+
+    def __init__(self, api, endpoint, handler, payload_type, payload_list=False, pagination_mode=None):
+        self.api = api
+        self.endpoint = endpoint
+        self.handler = handler
+        self.payload_type = payload_type
+        self.payload_list = payload_list
+        if pagination_mode:
+            self.pagination_mode = pagination_mode
+
+    def __call__(self, *args, create=False, parser=None, **kwargs):
+        if create:
+            return self
+        return_cursors = "cursor" in kwargs
+        payload = json.dumps(self.api._request(self.endpoint, self.handler, *args, **kwargs))
+        parser = parser or self.api.parser
+        if isinstance(parser, RawParser):
+            return payload
+        return parser.parse(self, payload, return_cursors=return_cursors)
+
+
+class _FakeResponse:
+    def __init__(self, endpoint, status_code, headers):
+        self.url = f'https://api.twitter.com/1.1/{endpoint}.json'
+        self.status_code = status_code
+        self.headers = headers
+
+
+class FakeTwitterAPI:
+    """
+    Offline stand-in for every twitter endpoint the bot uses. It serves recorded or synthetic status json through the
+    same tweepy models and pagination as tweepy.API, sleeps a configurable latency per request, sends x-rate-limit
+    headers and enforces each endpoint's 15 minute window. Writes only change its in-memory state.
+    Use it to benchmark and replay ContestBot without touching a real account, see replay.py.
+    """
+
+    def __init__(self, statuses=(), latency=0, following=(), username="contestbot", window=WINDOW_SECONDS,
+                 rate_limits=None, scheduler=None):
+        """
+        :param statuses: iterable of status json dicts, ex: from generate_statuses() or load_statuses().
+        :param latency: seconds each request takes, or a [min, max] range to pick from at random.
+        :param following: user ids the bot account follows, newest follow first.
+        :param username: screen name of the bot account.
+        :param window: length of each rate limit window in seconds.
+        :param rate_limits: dict of endpoint -> requests allowed per window. Defaults to ratelimit.ENDPOINT_LIMITS.
+        :param scheduler: ratelimit.Scheduler that observes every response, same as ratelimit.ScheduledAPI.
+        """
+        self.parser = ModelParser()
+        self.username = username
+        self.latency = latency
+        self.window = window
+        self.rate_limits = dict(ENDPOINT_LIMITS if rate_limits is None else rate_limits)
+        self.scheduler = scheduler or Scheduler()
+        self.rate_limiter = self.scheduler.rate_limiter
+        self.statuses = {}
+        self.users = {}
+        for status in statuses:
+            self._add_status(status)
+        self._ids_newest_first = sorted(self.statuses, reverse=True)
+        self._screen_names = {user["screen_name"].lower(): user for user in self.users.values()}
+        self.following = list(following)
+        self.favorited = set()
+        self.retweeted = set()
+        self.posted = []
+        self.calls = Counter()
+        self.rate_limited = Counter()
+        self._windows = {}
+        self._lock = threading.Lock()
+        self._last_response = None
+
+        self.search = _FakeMethod(self, "search/tweets", self._search, "search_results", pagination_mode="id")
+        self.statuses_lookup = _FakeMethod(self, "statuses/lookup", self._statuses_lookup, "status", payload_list=True)
+        self.get_status = _FakeMethod(self, "statuses/show", self._get_status, "status")
+        self.friends_ids = _FakeMethod(self, "friends/ids", self._friends_ids, "ids", pagination_mode="cursor")
+        self.get_user = _FakeMethod(self, "users/show", self._get_user, "user")
+        self.lookup_users = _FakeMethod(self, "users/lookup", self._lookup_users, "user", payload_list=True)
+        self.retweet = _FakeMethod(self, "statuses/retweet", self._retweet, "status")
+        self.create_favorite = _FakeMethod(self, "favorites/create", self._create_favorite, "status")
+        self.create_friendship = _FakeMethod(self, "friendships/create", self._create_friendship, "user")
+        self.destroy_friendship = _FakeMethod(self, "friendships/destroy", self._destroy_friendship, "user")
+        self.update_status = _FakeMethod(self, "statuses/update", self._update_status, "status")
+        self.send_direct_message = _FakeMethod(self, "direct_messages/events/new", self._send_direct_message,
+                                               "direct_message")
+
+    @property
+    def last_response(self):
+        return self._last_response
+
+    @last_response.setter
+    def last_response(self, response):
+        self._last_response = response
+        self.scheduler.observe(response)
+
+    def _add_status(self, status):
+        self.statuses[status["id"]] = status
+        self.users[status["user"]["id"]] = status["user"]
+        if "retweeted_status" in status:
+            self._add_status(status["retweeted_status"])
+
+    def _request(self, endpoint, handler, *args, **kwargs):
+        latency = random.uniform(*self.latency) if isinstance(self.latency, (list, tuple)) else self.latency
+        if latency:
+            time.sleep(latency)
+        headers = {}
+        limit = self.rate_limits.get(endpoint)
+        with self._lock:
+            self.calls[endpoint] += 1
+            if limit is not None:
+                now = time.time()
+                remaining, reset = self._windows.get(endpoint, (limit, now + self.window))
+                if now >= reset:
+                    remaining, reset = limit, now + self.window
+                remaining -= 1
+                self._windows[endpoint] = (max(remaining, 0), reset)
+                headers = {"x-rate-limit-limit": str(limit), "x-rate-limit-remaining": str(max(remaining, 0)),
+                           "x-rate-limit-reset": str(int(reset))}
+                if remaining < 0:
+                    self.rate_limited[endpoint] += 1
+        if limit is not None and remaining < 0:
+            self.last_response = _FakeResponse(endpoint, 429, headers)
+            raise tweepy.RateLimitError("Rate limit exceeded", self.last_response, api_code=88)
+        self.last_response = _FakeResponse(endpoint, 200, headers)
+        return handler(*args, **kwargs)
+
+    def _status_json(self, status_id, trim_user=False):
+        status = self.statuses.get(int(status_id))
+        if status is None:
+            raise tweepy.TweepError("No status found with that ID.", api_code=144)
+        status = dict(status, favorited=status["id"] in self.favorited, retweeted=status["id"] in self.retweeted)
+        if trim_user:
+            status["user"] = {"id": status["user"]["id"], "id_str": status["user"]["id_str"]}
+        return status
+
+    def _user_json(self, user):
+        user = str(user)
+        user_json = self.users.get(int(user)) if user.isdigit() else self._screen_names.get(user.lower())
+        if user_json is None:
+            raise tweepy.TweepError("User not found.", api_code=50)
+        return user_json
+
+    def _search(self, q, count=15, since_id=None, max_id=None, **kwargs):
+        keyword, _, filters = q.partition(" ")
+        results = []
+        for status_id in self._ids_newest_first:
+            status = self.statuses[status_id]
+            if (max_id and status_id > int(max_id)) or (since_id and status_id <= int(since_id)):
+                continue
+            if "-filter:retweets" in filters and "retweeted_status" in status:
+                continue
+            if "-filter:replies" in filters and status.get("in_reply_to_status_id"):
+                continue
+            if keyword in status["full_text"].lower():
+                results.append(self._status_json(status_id))
+                if len(results) == int(count):
+                    break
+        return {"statuses": results, "search_metadata": {"count": int(count), "query": q}}
+
+    def _statuses_lookup(self, id_, trim_user=False, **kwargs):
+        ids = id_.split(",") if isinstance(id_, str) else id_
+        return [self._status_json(status_id, trim_user) for status_id in ids if int(status_id) in self.statuses]
+
+    def _get_status(self, id, **kwargs):
+        return self._status_json(id)
+
+    def _friends_ids(self, cursor=-1, count=5000, **kwargs):
+        start = 0 if int(cursor) == -1 else int(cursor)
+        end = start + int(count)
+        next_cursor = end if end < len(self.following) else 0
+        return {"ids": self.following[start:end], "next_cursor": next_cursor, "previous_cursor": -start or 0}
+
+    def _get_user(self, id=None, user_id=None, screen_name=None):
+        return self._user_json(id or user_id or screen_name)
+
+    def _lookup_users(self, user_ids=None, screen_names=None, **kwargs):
+        # like twitter, suspended, deactivated and unknown users are left out of the response
+        users = user_ids if user_ids is not None else screen_names
+        users = users.split(",") if isinstance(users, str) else users
+        return [user for user in (self.users.get(int(user)) if str(user).isdigit() else
+                                  self._screen_names.get(str(user).lower()) for user in users) if user is not None]
+
+    def _retweet(self, id):
+        self.retweeted.add(int(id))
+        return self._status_json(id)
+
+    def _create_favorite(self, id):
+        self.favorited.add(int(id))
+        return self._status_json(id)
+
+    def _create_friendship(self, id=None, user_id=None, screen_name=None, follow=False):
+        user = self._user_json(id or user_id or screen_name)
+        if user["id"] not in self.following:
+            self.following.insert(0, user["id"])
+        return user
+
+    def _destroy_friendship(self, id=None, user_id=None, screen_name=None):
+        user = self._user_json(id or user_id or screen_name)
+        if user["id"] in self.following:
+            self.following.remove(user["id"])
+        return user
+
+    def _update_status(self, status, in_reply_to_status_id=None, **kwargs):
+        self.posted.append(status)
+        status_id = max(self.statuses, default=0) + 1
+        return {"id": status_id, "id_str": str(status_id), "full_text": status, "text": status,
+                "in_reply_to_status_id": in_reply_to_status_id,
+                "user": {"id": 0, "id_str": "0", "screen_name": self.username}}
+
+    def _send_direct_message(self, recipient_id, text, **kwargs):
+        self.posted.append(text)
+        return {"event": {"type": "message_create", "message_create": {"target": {"recipient_id": str(recipient_id)},
+                                                                        "message_data": {"text": text}}}}
+
+
+def load_statuses(path):
+    """
+    :param path: json file with a list of status json dicts, ex: saved by save_statuses().
+    :return: list of status json dicts.
+    """
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def save_statuses(tweets, path):
+    """
+    Records tweepy status objects, ex: the search pages from ContestBot._search_pages(), so they can be replayed with
+    FakeTwitterAPI.
+    """
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump([tweet._json for tweet in tweets], file)
+
+
+def generate_statuses(count, seed=0, retweet_ratio=0.3, long_ratio=0.3, start=datetime(2021, 1, 1)):
+    """
+    Generates a deterministic mix of contest and non contest status json dicts: originals and retweets, short and long
+    text, none to many hashtags, and some authors or text with banned words.
+    :param count: number of statuses to generate, retweets included.
+    :param seed: random seed, the same seed always generates the same statuses.
+    :return: list of status json dicts, oldest first.
+    """
+    rng = random.Random(seed)
+    screen_names = ["giveawayhub", "dealsdaily", "techprizes", "freestuffnow", "winbig", "kpopstan99", "promobot",
+                    "gamerdrops", "beautyboxes", "sneakerwins"]
+    users = [{"id": 1000 + index, "id_str": str(1000 + index), "screen_name": screen_name,
+              "followers_count": rng.randint(10, 500000)} for index, screen_name in enumerate(screen_names)]
+    contest_phrases = ["RT", "retweet", "RT & follow", "like and RT", "follow @{user}", "tag a friend",
+                       "tag 3 friends", "reply with your fav", "comment below", "dm us", "🔁", "❤️"]
+    filler = ["to win", "a brand new", "gift card", "giveaway", "contest", "sweepstake", "ends friday", "good luck",
+              "winner picked at random", "worldwide", "us only", "must be following", "the prize is", "$100",
+              "download the app", "album out now", "join our discord", "start your day", "hello everyone"]
+    hashtags = ["#giveaway", "#contest", "#win", "#sweepstakes", "#free", "#competition", "#prize", "#rt"]
+
+    statuses = []
+    originals = []
+    for index in range(count):
+        status_id = 1350000000000000000 + index * 1000
+        created_at = (start + timedelta(seconds=index * 30)).strftime(_CREATED_AT_FORMAT)
+        user = rng.choice(users)
+        if originals and rng.random() < retweet_ratio:
+            original = rng.choice(originals)
+            text = f'RT @{original["user"]["screen_name"]}: {original["full_text"]}'
+            status = {"id": status_id, "id_str": str(status_id), "created_at": created_at, "full_text": text,
+                      "user": user, "entities": original["entities"], "retweeted_status": original,
+                      "favorited": False, "retweeted": False, "retweet_count": 0, "favorite_count": 0,
+                      "in_reply_to_status_id": None, "lang": "en"}
+        else:
+            num_words = rng.randint(20, 45) if rng.random() < long_ratio else rng.randint(4, 12)
+            words = [rng.choice(filler) for _ in range(num_words)]
+            for _ in range(rng.randint(0, 3)):
+                words.insert(rng.randrange(len(words) + 1),
+                             rng.choice(contest_phrases).format(user=user["screen_name"]))
+            status_hashtags = rng.sample(hashtags, rng.randint(0, 6))
+            text = ' '.join(words + status_hashtags)[:280]
+            entities = {"hashtags": [{"text": hashtag[1:], "indices": [text.find(hashtag), text.find(hashtag) +
+                                                                       len(hashtag)]}
+                                     for hashtag in status_hashtags if hashtag in text],
+                        "user_mentions": [{"screen_name": user["screen_name"], "id": user["id"],
+                                           "id_str": user["id_str"]}] if f'@{user["screen_name"]}' in text else []}
+            status = {"id": status_id, "id_str": str(status_id), "created_at": created_at, "full_text": text,
+                      "user": user, "entities": entities, "favorited": False, "retweeted": False,
+                      "retweet_count": rng.randint(0, 5000), "favorite_count": rng.randint(0, 5000),
+                      "in_reply_to_status_id": None, "lang": "en"}
+            originals.append(status)
+        statuses.append(status)
+    return statuses
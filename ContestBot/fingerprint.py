@@ -0,0 +1,152 @@
+import hashlib
+import re
+import threading
+from functools import lru_cache
+
+from storage import read_lines
+
+FINGERPRINT_BITS = 64
+MIN_WORDS = 6  # shorter texts are too alike to tell copies from different contests, ex: "rt to win"
+_URL_PATTERN = re.compile(r"https?://\S+")
+_WORD_PATTERN = re.compile(r"[#@$]?\w+")
+_LANE_ONES = int("0001" * FINGERPRINT_BITS, 16)  # 1 in each 16 bit lane of a spread hash
+_LANE_DIGITS = str.maketrans("08", "01")
+
+
+def simhash(lowercase_text):
+    """
+    64 bit SimHash of the words and word pairs in a tweet. Copies of a giveaway with a few words changed, a different
+    link or an added "RT @partner:" differ in only a few bits, unrelated tweets in about half of them.
+    :param lowercase_text: lowercase tweet text, ex: from ContestBot._get_tweet_text().
+    :return: fingerprint int, or None when the text has fewer than MIN_WORDS words.
+    """
+    words = _WORD_PATTERN.findall(_URL_PATTERN.sub(" ", lowercase_text))
+    if len(words) < MIN_WORDS:
+        return None
+    features = words + [f'{first} {second}' for first, second in zip(words, words[1:])]
+    # adding the spread hashes counts how many features set each bit in one big int addition per feature, then adding
+    # 0x7fff - half to every lane carries into the lane's top bit exactly when more than half the features set the bit
+    counts = sum(_spread_hash(feature) for feature in features)
+    majority = (counts + _LANE_ONES * (0x7FFF - len(features) // 2)) & _LANE_ONES * 0x8000
+    # the first hex digit of each lane is now "8" or "0"
+    return int(f'{majority:0{FINGERPRINT_BITS * 4}x}'[::4].translate(_LANE_DIGITS), 2)
+
+
+@lru_cache(maxsize=2 ** 16)
+def _spread_hash(feature):
+    # 64 bit hash of feature with every bit moved into its own 16 bit lane, ex: 0b101 -> 0x000100000001
+    # blake2b instead of hash(), which is salted per process, so saved fingerprints match after a restart
+    bits = format(int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big"), "064b")
+    return int(''.join(f'000{bit}' for bit in bits), 16)
+
+
+class FingerprintIndex:
+    """
+    SimHash fingerprints of every tweet text the bot has seen, used to drop near duplicate copies of a giveaway. Each
+    fingerprint is split into max_distance + 1 bands and bucketed by band, two fingerprints that differ in at most
+    max_distance bits share at least one band, so a lookup only compares against the few fingerprints in its buckets.
+    Mirrored to an append-only file like storage.SeenIndex so copies are still dropped after a restart. Pass an empty
+    path to keep it in memory only. A fingerprint added with save=False only drops copies until it is passed to save(),
+    or forgotten with discard() when the tweet it came from turns out unusable, ex: deleted. Copies of an unsaved
+    fingerprint can be held back until then, save() returns them to be dropped and discard() to take its place.
+    """
+
+    def __init__(self, path, max_distance=3):
+        """
+        :param path: file with one hex fingerprint per line.
+        :param max_distance: max bits two fingerprints may differ in to count as copies, 0 to 7.
+        """
+        self.path = path
+        self.max_distance = max_distance
+        self._band_bits = FINGERPRINT_BITS // (max_distance + 1)
+        self._band_mask = (1 << self._band_bits) - 1
+        self._buckets = [{} for _ in range(max_distance + 1)]
+        self._size = 0
+        self._unsaved = {}  # fingerprint added with save=False -> copies held back for it
+        self._file = None
+        self._lock = threading.Lock()
+        if path:
+            for line in read_lines(path):
+                if len(line) == FINGERPRINT_BITS // 4 + 1:
+                    self._add(int(line, 16))
+            self._file = open(path, "a", encoding="utf-8")
+
+    def __len__(self):
+        return self._size
+
+    def find(self, fingerprint):
+        """
+        :return: a stored fingerprint within max_distance bits of fingerprint, or None.
+        """
+        for band, value in enumerate(self._bands(fingerprint)):
+            for other in self._buckets[band].get(value, ()):
+                if bin(fingerprint ^ other).count("1") <= self.max_distance:
+                    return other
+        return None
+
+    def add(self, fingerprint, save=True, copy=None):
+        """
+        :param save: False to keep it in memory only until save() is called.
+        :param copy: optional item, ex: the tweet, held back when its near duplicate is not saved yet. save() or
+        discard() of the near duplicate returns it.
+        :return: True if fingerprint was new, None if copy was held back, False if a near duplicate was already stored.
+        """
+        with self._lock:
+            other = self.find(fingerprint)
+            if other is not None:
+                if copy is not None and other in self._unsaved:
+                    self._unsaved[other].append(copy)
+                    return None
+                return False
+            self._add(fingerprint)
+            if save:
+                self._write(fingerprint)
+            else:
+                self._unsaved[fingerprint] = []
+            return True
+
+    def save(self, fingerprint):
+        """
+        Writes a fingerprint added with save=False to the file.
+        :return: list of copies held back for it, they are near duplicates of a saved fingerprint now.
+        """
+        with self._lock:
+            if fingerprint not in self._unsaved:
+                return []
+            self._write(fingerprint)
+            return self._unsaved.pop(fingerprint)
+
+    def discard(self, fingerprint):
+        """
+        Forgets a fingerprint added with save=False, so later copies of its tweet are no longer dropped.
+        :return: list of copies held back for it, in the order they were added, ex: to add them again.
+        """
+        with self._lock:
+            if fingerprint not in self._unsaved:
+                return []
+            for band, value in enumerate(self._bands(fingerprint)):
+                bucket = self._buckets[band][value]
+                bucket.remove(fingerprint)
+                if not bucket:
+                    del self._buckets[band][value]
+            self._size -= 1
+            return self._unsaved.pop(fingerprint)
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+    def _write(self, fingerprint):
+        if self._file:
+            self._file.write(f'{fingerprint:016x}\n')
+            self._file.flush()
+
+    def _add(self, fingerprint):
+        for band, value in enumerate(self._bands(fingerprint)):
+            self._buckets[band].setdefault(value, []).append(fingerprint)
+        self._size += 1
+
+    def _bands(self, fingerprint):
+        return [fingerprint >> (band * self._band_bits) & self._band_mask for band in range(len(self._buckets))]
@@ -0,0 +1,171 @@
+import os
+import threading
+import time
+
+from storage import read_lines
+
+INTENT = "intent"
+DONE = "done"
+FAILED = "failed"
+COMPACT_MIN_LINES = 10000  # the file is rewritten with one line per action on open once it has this many stale lines
+
+
+class ActionJournal:
+    """
+    Write-ahead journal of the actions the bot performs. An "intent" line is written before each api call and a "done"
+    or "failed" line after it, so after a crash the journal tells which actions of a contest were already performed and
+    which ones were in flight. Each line is "<unix time> <action> <target id> <state>", the target is the original tweet
+    id for tweet actions and the user id for unfollows.
+
+    intend() returns only once its line is fsynced, so an action is never sent to the api without a durable trace of it.
+    Lines are committed in groups: a commit writes every line buffered so far with one fsync, and callers that queue up
+    behind a running commit are covered by the next one together. Outcome lines from complete() do not wait, they are
+    committed with the next intent or by a background thread every commit_interval seconds, so a crash loses at most
+    that much of them and the actions show up as in doubt. Pass an empty path to keep it in memory only.
+
+    The bot acts one action at a time, so this is one fsync per action: a few milliseconds, more on an SD card, against
+    the config.sleep_per_action pause after every api call. Writing a tweet's intents together with one fsync would
+    save those syncs, but a crash would then leave every action of the tweet in doubt instead of only the one in flight.
+    """
+
+    def __init__(self, path, commit_interval=1.0):
+        """
+        :param path: journal file.
+        :param commit_interval: max seconds an outcome line waits to be committed.
+        """
+        self.path = path
+        self.commit_interval = commit_interval
+        self.commits = 0
+        self._states = {}  # (action, target id) -> (state, unix time)
+        self._done = {}  # target id -> set of actions done
+        self._buffer = []
+        self._sequence = 0  # number of lines recorded
+        self._committed = 0  # number of lines fsynced
+        self._lock = threading.Lock()
+        self._commit_lock = threading.Lock()
+        self._file = None
+        self._thread = None
+        self._stopped = threading.Event()
+        if path:
+            lines = 0
+            for line in read_lines(path):
+                lines += 1
+                fields = line.split()
+                if len(fields) == 4 and fields[2].isdigit():
+                    self._set(fields[1], int(fields[2]), fields[3], float(fields[0]))
+            if lines - len(self._states) >= COMPACT_MIN_LINES:
+                self._compact()
+            self._file = open(path, "a", encoding="utf-8")
+            self._thread = threading.Thread(target=self._run, daemon=True, name="journal")
+            self._thread.start()
+
+    def __len__(self):
+        return len(self._states)
+
+    def intend(self, action, target):
+        """
+        Records that an action is about to be performed and waits until the line is on disk.
+        :param action: action name, ex: "retweet" or "unfollow".
+        :param target: original tweet id, or user id for unfollows.
+        """
+        self._commit(self._record(action, target, INTENT))
+
+    def complete(self, action, target, ok):
+        """
+        Records the outcome of an action recorded with intend().
+        :param ok: True if the action was performed.
+        """
+        self._record(action, target, DONE if ok else FAILED)
+
+    def state(self, action, target):
+        """
+        :return: last state recorded for the action: "intent", "done" or "failed", or None.
+        """
+        item = self._states.get((action, target))
+        return item[0] if item else None
+
+    def done(self, action, target, since=0):
+        """
+        :param since: optional unix time, actions done before it are ignored, ex: an unfollow of a user followed again.
+        :return: True if the action was performed.
+        """
+        item = self._states.get((action, target))
+        return item is not None and item[0] == DONE and item[1] >= since
+
+    def done_actions(self, target):
+        """
+        :return: set of action names done for a target id.
+        """
+        return set(self._done.get(target, ()))
+
+    def in_doubt(self):
+        """
+        :return: list of (action, target id) pairs that were started but never finished, ex: the bot crashed while the
+        api call was in flight. They may or may not have been performed.
+        """
+        return [key for key, (state, _) in self._states.items() if state == INTENT]
+
+    def commit(self):
+        """
+        Writes and fsyncs every buffered line.
+        """
+        self._commit()
+
+    def _commit(self, sequence=None):
+        # waits for the commit lock, a commit that ran meanwhile may already have written the caller's line
+        with self._commit_lock:
+            if sequence is not None and self._committed >= sequence:
+                return
+            with self._lock:
+                lines = self._buffer
+                self._buffer = []
+                last = self._sequence
+            if not lines or not self._file:
+                return
+            self._file.write(''.join(lines))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._committed = last
+            self.commits += 1
+
+    def close(self):
+        if self._thread is not None:
+            self._stopped.set()
+            self._thread.join()
+            self._thread = None
+        self.commit()
+        with self._commit_lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+    def _record(self, action, target, state):
+        # returns the line's sequence number, commits up to it make it durable
+        now = time.time()
+        with self._lock:
+            self._set(action, target, state, now)
+            if self.path:
+                self._buffer.append(f'{now:.3f} {action} {target} {state}\n')
+                self._sequence += 1
+            return self._sequence
+
+    def _set(self, action, target, state, recorded_at):
+        self._states[(action, target)] = (state, recorded_at)
+        if state == DONE:
+            self._done.setdefault(target, set()).add(action)
+        elif target in self._done:
+            self._done[target].discard(action)
+
+    def _compact(self):
+        # keep the last line of each action, failed actions tell nothing a missing line does not
+        temp_path = f'{self.path}.tmp'
+        with open(temp_path, "w", encoding="utf-8") as file:
+            file.writelines(f'{recorded_at:.3f} {action} {target} {state}\n'
+                            for (action, target), (state, recorded_at) in self._states.items() if state != FAILED)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.path)
+
+    def _run(self):
+        while not self._stopped.wait(self.commit_interval):
+            self.commit()
@@ -1,23 +1,77 @@
+import itertools
+
 import ContestBot as bot
-import config
+from pipeline import TweetPipeline
+from profiling import CycleProfiler
+from ranking import ContestQueue, iter_ranked
+from settings import SettingsWatcher
 
 
-def main():
+def main(max_cycles=None, api=None):
+    """
+    Runs the bot. Searches forever unless max_cycles is given.
+    :param max_cycles: optional number of search cycles to run before returning, ex: for benchmarks and replays.
+    :param api: optional api instance to use instead of ContestBot.authenticate(), ex: fake_api.FakeTwitterAPI.
+    """
     logger = bot.initialize_logger()
-    bot.check_config(logger)
-    bot.multiply_sleeps(logger)
-    api = bot.authenticate(logger)
-    search_type = config.search_type
-    tweets = bot.get_tweets(logger, api, search_type)
-    tweet_num = 0
-    success_tweet_num = 0
-    total_followed = 0
-    total_unfollowed = 0
-
-    while True:
-        if tweets:
-            for tweet in tweets:
+    settings = bot.check_config(logger)
+    watcher = SettingsWatcher(logger, settings, bot.check_config) if settings.watch_config else None
+    api = api or bot.authenticate(logger)
+    seen_index = bot.open_seen_index(logger)
+    checkpoints = bot.open_search_checkpoints(logger)
+    fingerprints = bot.open_fingerprint_index(logger)
+    following_cache = bot.open_following_cache(logger)
+    run_state = bot.open_run_state(logger)
+    journal = bot.open_action_journal(logger)
+    archive = bot.open_archive(logger)
+    metrics_writer, metrics_server = bot.start_metrics(logger)
+    # time spent sleeping between actions and waiting for rate limits is reported apart from the profiled work
+    profiler = CycleProfiler(logger, settings.profile_dir, settings.profile_interval, settings.profile_cycles,
+                             (bot._random_sleep, bot._wait_for_turn, bot._wait_for_rate_limit))
+    profiler.install_signal()
+    # contests left in the queue when a search is cut short are entered after the next search
+    contest_queue = ContestQueue(settings.rank_queue_size, settings.rank_weights,
+                                 settings.rank_max_age_hours) if settings.rank_contests else None
+    search_type = run_state.search_type or settings.search_type
+    tweet_num = run_state.counters.get("tweet_num", 0)
+    success_tweet_num = run_state.counters.get("success_tweet_num", 0)
+    total_followed = run_state.counters.get("total_followed", 0)
+    total_unfollowed = run_state.counters.get("total_unfollowed", 0)
+    # contests the last run found but did not finish, entered before the first search
+    pending = [(tweet, actions) for tweet, actions in run_state.pending
+               if not seen_index.seen((tweet.id, tweet.original_id))]
+    cycle = 0
+
+    def save_run_state(force=False, current=None):
+        run_state.counters = {"tweet_num": tweet_num, "success_tweet_num": success_tweet_num,
+                              "total_followed": total_followed, "total_unfollowed": total_unfollowed}
+        run_state.search_type = search_type
+        run_state.pending = [current] if current else []
+        run_state.pending.extend(pending)
+        if contest_queue is not None:
+            run_state.pending.extend(contest_queue.items())
+        run_state.save(force)
+
+    try:
+        unfollowed = bot.resume_unfollow_mode(logger, api, run_state, following_cache, settings, journal)
+        if unfollowed:
+            total_unfollowed += unfollowed
+        while max_cycles is None or cycle < max_cycles:
+            cycle += 1
+            profiler.start(cycle)
+            # ranked contests are held back until the whole search is in, save them before a checkpoint skips them
+            tweets = TweetPipeline(logger, api, search_type, settings.matcher, seen_index, checkpoints, settings,
+                                   fingerprints, journal, on_checkpoint=(lambda: save_run_state(force=True))
+                                   if contest_queue is not None else None)
+            results = iter_ranked(logger, tweets, seen_index, contest_queue) if contest_queue is not None else tweets
+            if pending:
+                results = itertools.chain(_iter_pending(pending), results)
+            cut_short = False
+            for tweet, actions in results:
                 tweet_num += 1
+                # swap in an edited config.py between tweets, the running search keeps its settings
+                if watcher:
+                    settings = watcher.poll()
                 logger.info("\n")
                 logger.info("--------------------------------------------------")
                 logger.info(f'Tweet number: {tweet_num}')
@@ -29,25 +83,52 @@ def main():
                 logger.info(f'Total followed users: {total_followed}')
                 logger.info(f'Total unfollowed users: {total_unfollowed}')
                 logger.info("--------------------------------------------------")
-                tweet_text = bot.check_tweet(logger, api, tweet)
-                if tweet_text:
-                    actions = bot.find_actions(logger, tweet_text)
-                    if actions:
-                        completed_actions = bot.perform_actions(logger, api, tweet, actions)
-                        if completed_actions:
-                            # check if perform_actions just finished _unfollow_mode (returns total_unfollowed int)
-                            if isinstance(completed_actions, int) and completed_actions > 0:
-                                total_unfollowed = total_unfollowed + completed_actions
-                                tweets.clear()
-                                continue
-                            # perform_actions successfully performed follow action on tweet
-                            elif completed_actions.get("follow"):
-                                total_followed += 1
-                            success_tweet_num += 1
-                tweets.remove(tweet)
-        else:
-            search_type = bot.get_next_search_type(logger, search_type)
-            tweets = bot.get_tweets(logger, api, search_type)
+                completed_actions = False
+                if actions:
+                    current = (bot._get_tweet_record(logger, tweet), actions)
+                    # saved before acting, so a crash mid actions retries the tweet instead of losing it
+                    save_run_state(force=True, current=current)
+                    completed_actions = bot.perform_actions(logger, api, tweet, actions, seen_index, following_cache,
+                                                            settings, run_state, journal)
+                    if completed_actions:
+                        # check if perform_actions just finished _unfollow_mode (returns total_unfollowed int)
+                        if isinstance(completed_actions, int) and completed_actions > 0:
+                            total_unfollowed = total_unfollowed + completed_actions
+                            # the tweet was not acted on yet, it is entered first thing after the fresh search starts.
+                            # The tweets still in the pipeline are found again by the same search, their checkpoints
+                            # only move once they are handled
+                            pending.insert(0, current)
+                            cut_short = True
+                            break
+                        # perform_actions successfully performed follow action on tweet, a follow an earlier run
+                        # already did was counted by that run
+                        elif completed_actions.get("follow") and completed_actions["follow"] != bot.REPLAYED:
+                            total_followed += 1
+                        success_tweet_num += 1
+                if archive is not None:
+                    archive.append(bot._get_tweet_record(logger, tweet), search_type, actions, completed_actions)
+                save_run_state()
+            tweets.close()
+            if not cut_short:
+                search_type = bot.get_next_search_type(logger, search_type)
+            save_run_state(force=True)
+            profiler.stop()
+    finally:
+        profiler.stop()
+        save_run_state(force=True)
+        journal.close()
+        if archive is not None:
+            archive.close()
+        if metrics_writer:
+            metrics_writer.stop()
+        if metrics_server:
+            metrics_server.shutdown()
+
+
+def _iter_pending(pending):
+    # pops each contest as it is handed out so it is no longer saved as pending once it has been processed
+    while pending:
+        yield pending.pop(0)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,143 @@
+import re
+
+from caches import LRUCache
+
+
+def _trie_pattern(keywords):
+    """
+    Builds a prefix-factored regex alternation (a trie) from keywords so the regex engine never re-tests a shared
+    prefix. Longer keywords are always tried before shorter ones, so each match is the longest keyword at that position.
+    """
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if "" in node:
+            pattern = f'(?:{pattern})?'
+        return pattern
+
+    return build(trie)
+
+
+class KeywordMatcher:
+    """
+    Classifies text against categories of keywords in a single regex scan.
+    Build it once at startup (see ContestBot.build_matcher()) and reuse it for every tweet.
+
+    Matching rules are the same as a plain `keyword.lower() in text` check per keyword, except for word keywords which
+    only match when surrounded by whitespace (used for "rt" which otherwise matches inside words like "start").
+    """
+
+    def __init__(self, keywords, word_keywords=None, username_keywords=None, cache_size=0, cache_ttl=None):
+        """
+        :param keywords: dict of category -> list of keywords matched anywhere in the text.
+        :param word_keywords: dict of category -> list of keywords only matched as whole words.
+        :param username_keywords: dict of category -> list of keywords matched anywhere in the username.
+        :param cache_size: texts whose categories are remembered, 0 to scan every text.
+        :param cache_ttl: optional seconds a text's categories are remembered.
+        """
+        self._always, self._substring_categories, substring_pattern = self._compile(keywords)
+        word_always, self._word_categories, word_pattern = self._compile(word_keywords, closure=False)
+        username_always, self._username_categories, username_pattern = self._compile(username_keywords)
+        self._always = frozenset(self._always | word_always)
+        self._username_always = frozenset(username_always)
+        self._text_categories = frozenset(list(keywords or {}) + list(word_keywords or {}))
+        self.categories = self._text_categories | frozenset(username_keywords or {})
+
+        # one combined zero-width pattern so overlapping keywords are all found in one pass over the text
+        alternatives = []
+        if word_pattern:
+            alternatives.append(rf'(?<!\S)(?P<word>{word_pattern})(?!\S)')
+        if substring_pattern:
+            alternatives.append(f'(?P<sub>{substring_pattern})')
+        self._pattern = re.compile(f'(?=(?:{"|".join(alternatives)}))') if alternatives else None
+        self._substring_pattern = re.compile(substring_pattern) if substring_pattern else None
+        self._username_pattern = re.compile(f'(?=({username_pattern}))') if username_pattern else None
+
+        # one slot cache so check_tweet() and find_actions() share a single scan of the same tweet text
+        self._last = (None, None)
+        # text -> categories, so retweets and reposts of the same original tweet are scanned once. It belongs to this
+        # matcher, a matcher built from changed keyword settings starts with an empty cache
+        self.cache = LRUCache(cache_size, cache_ttl, name="classification") if cache_size else None
+
+    @staticmethod
+    def _compile(category_keywords, closure=True):
+        """
+        :return: (categories that always match, dict of keyword -> categories, trie pattern string)
+        """
+        always = set()
+        keyword_categories = {}
+        for category, keywords in (category_keywords or {}).items():
+            for keyword in keywords:
+                lowercase_keyword = keyword.lower()
+                # an empty keyword is "in" every string
+                if not lowercase_keyword:
+                    always.add(category)
+                    continue
+                keyword_categories.setdefault(lowercase_keyword, set()).add(category)
+        if closure:
+            # the regex reports only the longest keyword at each position, so fold in categories of every keyword
+            # that is a prefix of it since those match at the same position too
+            keyword_categories = {
+                keyword: frozenset().union(*(categories for other, categories in keyword_categories.items()
+                                             if keyword.startswith(other)))
+                for keyword in keyword_categories}
+        else:
+            keyword_categories = {keyword: frozenset(categories) for keyword, categories in keyword_categories.items()}
+        return always, keyword_categories, _trie_pattern(keyword_categories)
+
+    def classify(self, lowercase_text, username=None):
+        """
+        :param lowercase_text: lowercase tweet text.
+        :param username: optional screen name to check against the username keywords.
+        :return: frozenset of every category with a keyword found.
+        """
+        last_text, found = self._last
+        if lowercase_text is not last_text:
+            found = self.cache.get(lowercase_text) if self.cache is not None else None
+            if found is None:
+                found = self._scan(lowercase_text)
+                if self.cache is not None:
+                    self.cache.put(lowercase_text, found)
+            self._last = (lowercase_text, found)
+        if username is not None and (self._username_pattern or self._username_always):
+            found = found | self.classify_username(username)
+        return found
+
+    def classify_username(self, username):
+        """
+        :param username: screen name to check against the username keywords.
+        :return: frozenset of every username category with a keyword found, without scanning any tweet text.
+        """
+        username_found = set(self._username_always)
+        if self._username_pattern:
+            for match in self._username_pattern.finditer(username.lower()):
+                username_found |= self._username_categories[match.group(1)]
+        return frozenset(username_found)
+
+    def _scan(self, lowercase_text):
+        found = set(self._always)
+        if self._pattern is None:
+            return frozenset(found)
+        for match in self._pattern.finditer(lowercase_text):
+            word = match.group("word") if self._word_categories else None
+            if word is not None:
+                found |= self._word_categories[word]
+                # the word alternative hides any substring keyword starting at the same position
+                if self._substring_pattern:
+                    substring = self._substring_pattern.match(lowercase_text, match.start())
+                    if substring:
+                        found |= self._substring_categories[substring.group()]
+            else:
+                found |= self._substring_categories[match.group("sub")]
+            if len(found) == len(self._text_categories):
+                break
+        return frozenset(found)
@@ -0,0 +1,219 @@
+import bisect
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+# seconds, from the matcher's microseconds per tweet up to a full 15 minute rate limit wait
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 900)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Registry:
+    """
+    Holds every metric and renders them in the prometheus text exposition format.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def inc(self, value=1, **labels):
+        key = _label_values(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def value(self, **labels):
+        return self._values.get(_label_values(self.labelnames, labels), 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}' for key, value in values]
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # label values -> [count per bucket..., count above the last bucket, sum]
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def observe(self, seconds, **labels):
+        key = _label_values(self.labelnames, labels)
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            values = self._values.get(key)
+            if values is None:
+                values = self._values[key] = [0] * (len(self.buckets) + 2)
+            values[index] += 1
+            values[-1] += seconds
+
+    def time(self, **labels):
+        """
+        :return: context manager that observes the seconds spent inside it, ex: with STAGE_SECONDS.time(stage="sleep"):
+        """
+        return _Timer(self, labels)
+
+    def count(self, **labels):
+        values = self._values.get(_label_values(self.labelnames, labels))
+        return sum(values[:-1]) if values else 0
+
+    def sum(self, **labels):
+        values = self._values.get(_label_values(self.labelnames, labels))
+        return values[-1] if values else 0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, list(values)) for key, values in self._values.items())
+        samples = []
+        for key, values in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), values[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                samples.append(f'{self.name}_bucket{_format_labels(self.labelnames + ("le",), key + (le,))} '
+                               f'{cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            samples.append(f'{self.name}_sum{labels} {_format_value(values[-1])}')
+            samples.append(f'{self.name}_count{labels} {cumulative}')
+        return samples
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+# metrics recorded by the bot
+API_CALLS = Counter("contestbot_api_calls_total", "Twitter api responses by endpoint and http status.",
+                    ("endpoint", "status"))
+STAGE_SECONDS = Histogram("contestbot_stage_seconds", "Seconds spent in each stage: search_page, status_check, filter, "
+                                                      "score, classify, sleep, rate_limit_wait.", ("stage",))
+ACTION_SECONDS = Histogram("contestbot_action_seconds", "Seconds each action's api request takes.", ("action",))
+ACTIONS = Counter("contestbot_actions_total", "Actions performed by action and result.", ("action", "result"))
+TWEETS = Counter("contestbot_tweets_total", "Processed tweets by outcome.", ("outcome",))
+CACHE_LOOKUPS = Counter("contestbot_cache_lookups_total", "Cache lookups by cache and result.", ("cache", "result"))
+
+
+def write_textfile(path, registry=REGISTRY):
+    """
+    Writes all metrics to path for the node_exporter textfile collector. The file is replaced atomically so the
+    collector never reads a half written file.
+    """
+    temp_path = f'{path}.tmp'
+    with open(temp_path, "w", encoding="utf-8") as file:
+        file.write(registry.render())
+    os.replace(temp_path, path)
+
+
+class TextfileWriter(threading.Thread):
+    """
+    Rewrites the metrics file every interval seconds in a background thread.
+    """
+
+    def __init__(self, path, interval, registry=REGISTRY):
+        super().__init__(daemon=True, name="metrics-textfile")
+        self.path = path
+        self.interval = interval
+        self.registry = registry
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            write_textfile(self.path, self.registry)
+
+    def stop(self):
+        self._stopped.set()
+        write_textfile(self.path, self.registry)
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def start_http_server(port, address="127.0.0.1", registry=REGISTRY):
+    """
+    Serves the metrics at http://address:port/metrics from a background thread.
+    :return: the http server, call shutdown() on it to stop serving.
+    """
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # scrapes every few seconds would flood the bot's console
+            pass
+
+    server = _ThreadingHTTPServer((address, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics-http").start()
+    return server
+
+
+def _label_values(labelnames, labels):
+    return tuple(str(labels[name]) for name in labelnames)
+
+
+def _format_labels(labelnames, values):
+    if not labelnames:
+        return ""
+    pairs = (f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values))
+    return '{' + ','.join(pairs) + '}'
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
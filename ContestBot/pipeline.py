@@ -0,0 +1,233 @@
+import queue
+import threading
+from collections import namedtuple
+
+import tweepy
+
+import ContestBot as bot
+import async_engine
+
+QUEUE_SIZE = 100  # max tweets waiting between two stages, keeps memory flat no matter how large config.count is
+_POLL_SECONDS = 0.5  # how often blocked stages check if the pipeline was closed
+_END = object()
+# follows a keyword's last tweet through the stages, its search checkpoint is moved once the consumer gets past it
+_Checkpoint = namedtuple("_Checkpoint", ("search_keyword", "newest_id"))
+
+
+class _StageError:
+    def __init__(self, error):
+        self.error = error
+
+
+class TweetPipeline:
+    """
+    Streams tweets from the twitter search to the actions through bounded queues with one thread per stage:
+    search -> dedupe -> status check -> filter (ContestBot.check_tweet) -> classify (ContestBot.find_actions_batch).
+    Tweets found on the first search pages are filtered and classified while later pages are still loading. The
+    classify stage takes every tweet already waiting for it as one batch, up to config.classifier_batch_size, so the
+    optional classifier model scores them together.
+
+    Iterate it from the main thread to get (tweet, actions) pairs, actions is False for tweets that were filtered out.
+    Call close() to stop the search early, ex: after ContestBot._unfollow_mode() to start a fresh search.
+
+    A keyword's search checkpoint travels behind its last tweet through every stage and is only moved when the next
+    item is asked for after that tweet, so tweets still waiting in the queues when the pipeline is closed or the bot
+    crashes are searched again instead of being skipped by the next search.
+    """
+
+    def __init__(self, logger, api, search_type, matcher=None, seen_index=None, checkpoints=None, settings=None,
+                 fingerprints=None, journal=None, queue_size=QUEUE_SIZE, on_checkpoint=None):
+        """
+        :param on_checkpoint: optional callback run before a keyword's checkpoint is moved, ex: to save the contests
+        a consumer took but holds back, like ranking.iter_ranked().
+        """
+        self.logger = logger
+        self.api = api
+        self.search_type = search_type
+        # settings are fixed for the whole search, a reloaded config.py is picked up by the next pipeline
+        self.settings = bot._get_settings(settings)
+        self.matcher = matcher if matcher is not None else getattr(settings, "matcher", None)
+        self.classifier = getattr(settings, "classifier", None)
+        self.seen_index = seen_index
+        self.checkpoints = checkpoints
+        self.fingerprints = fingerprints
+        self.journal = journal
+        self.on_checkpoint = on_checkpoint
+        self._closed = threading.Event()
+        stages = [self._search, self._dedupe, self._check, self._filter, self._classify]
+        batch_sizes = {self._classify: self.settings.classifier_batch_size}
+        # stages that hold tweets back between items are handed the checkpoints to pass on themselves
+        buffering = {self._check}
+        self._threads = []
+        items = None
+        for stage in stages:
+            output = queue.Queue(queue_size)
+            thread = threading.Thread(target=self._run_stage,
+                                      args=(stage, items, output, batch_sizes.get(stage), stage in buffering),
+                                      daemon=True,
+                                      name=f'pipeline-{stage.__name__.strip("_")}')
+            self._threads.append(thread)
+            items = output
+        self._output = items
+        for thread in self._threads:
+            thread.start()
+
+    def __iter__(self):
+        while True:
+            item = self._get(self._output)
+            if item is _END:
+                return
+            if isinstance(item, _StageError):
+                self.close()
+                raise item.error
+            if isinstance(item, _Checkpoint):
+                # every tweet of the keyword was handled by the consumer
+                if self.on_checkpoint:
+                    self.on_checkpoint()
+                self.checkpoints.update(item.search_keyword, self.search_type, item.newest_id)
+                continue
+            yield item
+
+    def close(self):
+        self._closed.set()
+
+    def _run_stage(self, stage, items, output, batch_size=None, buffering=False):
+        try:
+            source = None
+            if items is not None:
+                # checkpoints skip over a stage that never holds a tweet back, each tweet before one already left it
+                forward = None if buffering else output
+                if batch_size:
+                    source = self._iter_batches(items, batch_size, forward)
+                else:
+                    source = self._iter_queue(items, forward)
+            for item in stage(source):
+                if not self._put(output, item):
+                    return
+        except BaseException as e:
+            self._put(output, _StageError(e))
+            return
+        self._put(output, _END)
+
+    def _iter_queue(self, items, forward=None):
+        while True:
+            item = self._get(items)
+            if item is _END:
+                return
+            if isinstance(item, _StageError):
+                raise item.error
+            if forward is not None and isinstance(item, _Checkpoint):
+                if not self._put(forward, item):
+                    return
+                continue
+            yield item
+
+    def _iter_batches(self, items, batch_size, forward):
+        # blocks for the first item only, then takes whatever else is already waiting so batching never adds latency. A
+        # checkpoint ends the batch and is passed on once the stage is done with it
+        while True:
+            item = self._get(items)
+            batch = []
+            while item is not _END and not isinstance(item, _Checkpoint):
+                if isinstance(item, _StageError):
+                    raise item.error
+                batch.append(item)
+                if len(batch) == batch_size:
+                    break
+                try:
+                    item = items.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                yield batch
+            if isinstance(item, _Checkpoint) and not self._put(forward, item):
+                return
+            if item is _END:
+                return
+
+    def _get(self, items):
+        while not self._closed.is_set():
+            try:
+                return items.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _put(self, output, item):
+        while not self._closed.is_set():
+            try:
+                output.put(item, timeout=_POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _search(self, _):
+        search = async_engine.iter_search_results if self.settings.async_search else bot.iter_search_results
+        finished = []
+        try:
+            for tweet in search(self.logger, self.api, self.search_type, self.checkpoints, self.settings,
+                                lambda *checkpoint: finished.append(_Checkpoint(*checkpoint))):
+                while finished:
+                    yield finished.pop(0)
+                yield tweet
+        except tweepy.TweepError as e:
+            # raises on critical errors, otherwise end this search early like ContestBot.get_tweets()
+            bot._tweepy_error_handler(self.logger, e)
+        while finished:
+            yield finished.pop(0)
+
+    def _dedupe(self, tweets):
+        return bot.iter_unseen_tweets(self.logger, tweets, self.seen_index, self.fingerprints, self.journal,
+                                      self.matcher)
+
+    def _check(self, items):
+        # looked up 100 tweets at a time like ContestBot.iter_checked_statuses(), a checkpoint sends the batch on early
+        # so it is passed on right behind its keyword's tweets
+        batch = []
+        for item in items:
+            if isinstance(item, _Checkpoint):
+                yield from self._check_batch(batch)
+                batch = []
+                yield item
+                continue
+            batch.append(item)
+            if len(batch) == bot.STATUS_LOOKUP_BATCH_SIZE:
+                yield from self._check_batch(batch)
+                batch = []
+        yield from self._check_batch(batch)
+
+    def _check_batch(self, batch):
+        # a deleted copy of a contest must not keep hiding the other copies, the copy taking its place is looked up too
+        checked = []
+        while batch:
+            released = []
+            checked.extend(bot._check_status_batch(self.logger, self.api, batch, on_unavailable=lambda tweet: (
+                released.extend(bot.settle_fingerprint(self.logger, self.fingerprints, tweet, False,
+                                                       self.seen_index)))))
+            batch = released
+        return checked
+
+    def _filter(self, tweets):
+        for tweet in tweets:
+            pending = [tweet]
+            while pending:
+                tweet = pending.pop(0)
+                tweet_text, reason = bot._check_tweet(self.logger, self.api, tweet, self.matcher)
+                if not tweet_text:
+                    bot.mark_skipped(self.logger, self.seen_index, tweet, reason)
+                pending.extend(bot.settle_fingerprint(self.logger, self.fingerprints, tweet,
+                                                      reason not in ("error", "banned_user"), self.seen_index))
+                yield tweet, tweet_text
+
+    def _classify(self, batches):
+        for batch in batches:
+            candidates = [(tweet, tweet_text) for tweet, tweet_text in batch if tweet_text]
+            found = bot.find_actions_batch(self.logger, [tweet_text for _, tweet_text in candidates], self.matcher,
+                                           self.classifier)
+            actions_by_tweet = {id(tweet): actions for (tweet, _), actions in zip(candidates, found)}
+            for tweet, tweet_text in batch:
+                actions = actions_by_tweet.get(id(tweet), False)
+                if tweet_text and not actions:
+                    bot.mark_seen(self.logger, self.seen_index, tweet, "skipped")
+                yield tweet, actions
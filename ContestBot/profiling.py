@@ -0,0 +1,122 @@
+"""
+Sampling profiler for the bot's search cycles, see config.profile_cycles. While a cycle runs a background thread
+samples the stack of every thread every profile_interval seconds. The samples of each cycle are written to
+profile_dir/cycle-<number>-<time>.folded in the collapsed stack format, one "thread;outer;...;inner count" line per
+stack, which flamegraph.pl and https://www.speedscope.app read directly.
+
+Samples inside the sleep functions (ContestBot._random_sleep and the write/rate limit waits) and pipeline threads
+blocked waiting for work are left out of the file, so it only shows time spent working. They are reported separately in
+the log.
+"""
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+
+# leaf functions of threads that are blocked waiting for another thread, ex: pipeline stages waiting on their queue
+_IDLE_FUNCTIONS = {("threading.py", "wait"), ("threading.py", "_wait_for_tstate_lock"), ("queue.py", "get"),
+                   ("queue.py", "put"), ("selectors.py", "select"), ("socketserver.py", "serve_forever")}
+
+
+class CycleProfiler:
+    """
+    Call start() when a search cycle starts and stop() when it ends. Does nothing while disabled, toggle() switches it
+    on or off from the next cycle, ex: from a SIGUSR1 handler installed by install_signal().
+    """
+
+    def __init__(self, logger, directory, interval=0.005, enabled=False, sleep_functions=()):
+        """
+        :param logger: logger instance.
+        :param directory: folder the .folded files are written to, created when needed.
+        :param interval: seconds between samples.
+        :param enabled: profile from the first cycle.
+        :param sleep_functions: functions whose time is reported as sleep instead of work, ex: ContestBot._random_sleep.
+        """
+        self.logger = logger
+        self.directory = directory
+        self.interval = interval
+        self.enabled = enabled
+        self._sleep_codes = {function.__code__: function.__name__ for function in sleep_functions}
+        self._thread = None
+        self._stopped = threading.Event()
+        self._cycle = None
+        self._started = 0
+        self.stacks = Counter()
+        self.sleep_samples = Counter()
+        self.idle_samples = 0
+
+    def install_signal(self):
+        """
+        Toggles profiling on SIGUSR1, ex: kill -USR1 <pid>. Only works from the main thread and on systems with SIGUSR1.
+        """
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, lambda signum, frame: self.toggle())
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        self.logger.info(f'Profiling turned {"on" if self.enabled else "off"}, it applies from the next cycle.')
+
+    def start(self, cycle):
+        if not self.enabled or self._thread is not None:
+            return
+        self._cycle = cycle
+        self._started = time.time()
+        self.stacks = Counter()
+        self.sleep_samples = Counter()
+        self.idle_samples = 0
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="profiler")
+        self._thread.start()
+
+    def stop(self):
+        """
+        :return: path of the written .folded file, or None when the cycle was not profiled.
+        """
+        if self._thread is None:
+            return None
+        self._stopped.set()
+        self._thread.join()
+        self._thread = None
+        return self._write()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own_id:
+                    self._sample(names.get(thread_id, str(thread_id)), frame)
+
+    def _sample(self, thread_name, frame):
+        leaf = frame
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            sleep_function = self._sleep_codes.get(code)
+            if sleep_function:
+                self.sleep_samples[sleep_function] += 1
+                return
+            stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+            frame = frame.f_back
+        if (os.path.basename(leaf.f_code.co_filename), leaf.f_code.co_name) in _IDLE_FUNCTIONS:
+            self.idle_samples += 1
+            return
+        stack.append(thread_name)
+        self.stacks[';'.join(reversed(stack))] += 1
+
+    def _write(self):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory,
+                            f'cycle-{self._cycle:05d}-{time.strftime("%Y%m%d-%H%M%S", time.localtime(self._started))}'
+                            f'.folded')
+        elapsed = time.time() - self._started
+        work_seconds = sum(self.stacks.values()) * self.interval
+        sleeps = ', '.join(f'{name} {samples * self.interval:.1f}s' for name, samples in self.sleep_samples.items())
+        with open(path, "w", encoding="utf-8") as file:
+            file.writelines(f'{stack} {samples}\n' for stack, samples in self.stacks.most_common())
+        # work samples are summed over all threads, so they can add up to more than the cycle took
+        self.logger.info(f'Profiled cycle {self._cycle} to {path}: {elapsed:.1f}s, {work_seconds:.1f}s of work '
+                         f'samples, sleep {sleeps or "0s"} and idle {self.idle_samples * self.interval:.1f}s excluded.')
+        return path
@@ -0,0 +1,201 @@
+import heapq
+import itertools
+import math
+import re
+from datetime import datetime, timedelta
+
+import ContestBot as bot
+import config
+
+_WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+_MONTHS = ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec")
+# "ends friday", "closes 3/14", "winner picked tomorrow", "giveaway ends on march 5th", "48 hours left"
+_DEADLINE_PATTERN = re.compile(
+    r'\b(?:ends?|ending|closes?|closing|deadline|until|winners? (?:picked|chosen|announced|drawn))\b'
+    r'[^.!?\n]{0,20}?\b(?:(?P<relative>today|tonight|tomorrow)|(?P<weekday>' + '|'.join(_WEEKDAYS) + r')'
+    r'|(?P<month>' + '|'.join(_MONTHS) + r')[a-z]*\.? (?P<day>\d{1,2})(?:st|nd|rd|th)?\b'
+    r'|(?P<numeric_month>\d{1,2})/(?P<numeric_day>\d{1,2})\b)'
+    r'|\b(?P<amount>\d{1,3}) ?(?P<unit>hours?|hrs?|days?) (?:left|remaining|to go)\b')
+
+
+class ContestQueue:
+    """
+    Bounded work queue of contests that are ready for actions, best score first. Scores combine how many actions a
+    contest needs, the author's followers, the tweet's engagement and age and how soon a deadline found in the text is,
+    weighted by config.rank_weights. When the queue is full the lowest score is dropped, and contests that are older
+    than config.rank_max_age_hours or past their deadline are dropped when they reach the front.
+
+    Two heaps share the entries: a max heap for pop() and a min heap to find the lowest score to evict. Removed entries
+    are only marked dead and skipped when they reach the top of the other heap.
+    """
+
+    def __init__(self, maxsize=None, weights=None, max_age_hours=None, on_drop=None):
+        """
+        :param maxsize: max contests in the queue, defaults to config.rank_queue_size.
+        :param weights: dict of score weights, defaults to config.rank_weights.
+        :param max_age_hours: contests older than this are dropped, defaults to config.rank_max_age_hours.
+        :param on_drop: optional callback run with (tweet, reason) for every dropped contest, reason is "evicted" or
+        "expired".
+        """
+        self.maxsize = maxsize or config.rank_queue_size
+        self.weights = weights or config.rank_weights
+        self.max_age = timedelta(hours=max_age_hours or config.rank_max_age_hours)
+        self.on_drop = on_drop
+        self._best = []
+        self._worst = []
+        self._counter = itertools.count()
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def score(self, tweet, actions, now=None):
+        """
+        :param tweet: records.TweetRecord.
+        :param actions: actions dict from ContestBot.find_actions().
+        :return: (score, datetime the contest expires)
+        """
+        now = now or datetime.utcnow()
+        expires_at = tweet.created_at + self.max_age if tweet.created_at else now + self.max_age
+        deadline = parse_deadline(tweet.text, tweet.created_at or now)
+        urgency = 0
+        if deadline:
+            expires_at = min(expires_at, deadline)
+            # contests closing within a day are entered first, before they are gone
+            urgency = max(0, 1 - (deadline - now).total_seconds() / 86400)
+        age_hours = (now - tweet.created_at).total_seconds() / 3600 if tweet.created_at else 0
+        score = (self.weights.get("actions", 0) * sum(1 for action in actions.values() if action) +
+                 self.weights.get("followers", 0) * math.log10(1 + tweet.followers_count) +
+                 self.weights.get("engagement", 0) * math.log10(1 + tweet.retweet_count + tweet.favorite_count) +
+                 self.weights.get("age", 0) * age_hours +
+                 self.weights.get("deadline", 0) * urgency)
+        return score, expires_at
+
+    def push(self, tweet, actions, now=None):
+        """
+        Queues a contest, evicting the lowest score if the queue is full.
+        :return: True if the contest was queued, False if it was dropped right away.
+        """
+        now = now or datetime.utcnow()
+        score, expires_at = self.score(tweet, actions, now)
+        if expires_at <= now:
+            self._drop(tweet, "expired")
+            return False
+        entry = [score, next(self._counter), tweet, actions, expires_at, True]
+        if self._size >= self.maxsize:
+            self._prune(self._worst)
+            if self._worst and self._worst[0][0] >= score:
+                self._drop(tweet, "evicted")
+                return False
+            lowest = heapq.heappop(self._worst)
+            lowest[-1] = False
+            self._size -= 1
+            self._drop(lowest[2], "evicted")
+            self._compact()
+        heapq.heappush(self._best, (-score, entry[1], entry))
+        heapq.heappush(self._worst, entry)
+        self._size += 1
+        return True
+
+    def pop(self, now=None):
+        """
+        :return: (tweet, actions) with the highest score that has not expired, or None when the queue is empty.
+        """
+        now = now or datetime.utcnow()
+        while self._best:
+            entry = heapq.heappop(self._best)[2]
+            if not entry[-1]:
+                continue
+            entry[-1] = False
+            self._size -= 1
+            self._compact()
+            if entry[4] <= now:
+                self._drop(entry[2], "expired")
+                continue
+            return entry[2], entry[3]
+        return None
+
+    def items(self):
+        """
+        :return: list of queued (tweet, actions) pairs best score first, without removing them, ex: to save them.
+        """
+        return [(entry[2], entry[3]) for _, _, entry in sorted(self._best) if entry[-1]]
+
+    def _prune(self, heap):
+        while heap and not heap[0][-1]:
+            heapq.heappop(heap)
+
+    def _compact(self):
+        # popped entries sink to the bottom of the min heap and evicted ones to the bottom of the max heap, rebuild a
+        # heap before its dead entries outnumber the live ones
+        if len(self._worst) > 2 * self._size + 16:
+            self._worst = [entry for entry in self._worst if entry[-1]]
+            heapq.heapify(self._worst)
+        if len(self._best) > 2 * self._size + 16:
+            self._best = [item for item in self._best if item[2][-1]]
+            heapq.heapify(self._best)
+
+    def _drop(self, tweet, reason):
+        if self.on_drop:
+            self.on_drop(tweet, reason)
+
+
+def iter_ranked(logger, tweets, seen_index=None, contest_queue=None):
+    """
+    Collects every contest of a search into a ContestQueue and yields them best first. Reuse the same contest_queue
+    across searches so contests left over when the caller stops early are still entered later.
+    :param logger: logger instance.
+    :param tweets: iterable of (tweet, actions) pairs, ex: pipeline.TweetPipeline.
+    :param seen_index: optional storage.SeenIndex, dropped contests are marked seen with the reason as outcome.
+    :param contest_queue: optional ContestQueue, defaults to a new one.
+    """
+    def on_drop(tweet, reason):
+        logger.debug('Dropped %s contest %s.', reason, tweet.id)
+        bot.mark_seen(logger, seen_index, tweet, reason)
+
+    if contest_queue is None:
+        contest_queue = ContestQueue()
+    contest_queue.on_drop = on_drop
+    num_found = 0
+    for tweet, actions in tweets:
+        if actions:
+            num_found += 1
+            contest_queue.push(bot._get_tweet_record(logger, tweet), actions)
+    logger.info(f'Ranked {num_found} contests. {len(contest_queue)} contests queued.')
+    while True:
+        item = contest_queue.pop()
+        if item is None:
+            return
+        yield item
+
+
+def parse_deadline(lowercase_text, created_at):
+    """
+    :param lowercase_text: lowercase tweet text.
+    :param created_at: datetime the tweet was posted, relative deadlines like "ends friday" count from it.
+    :return: datetime at the end of the deadline day found in the text, or None.
+    """
+    match = _DEADLINE_PATTERN.search(lowercase_text)
+    if not match:
+        return None
+    end_of_day = created_at.replace(hour=23, minute=59, second=59, microsecond=0)
+    try:
+        if match.group("relative"):
+            return end_of_day + timedelta(days=1 if match.group("relative") == "tomorrow" else 0)
+        if match.group("weekday"):
+            return end_of_day + timedelta(days=(_WEEKDAYS.index(match.group("weekday")) - created_at.weekday()) % 7)
+        if match.group("amount"):
+            unit_hours = 24 if match.group("unit").startswith("day") else 1
+            return created_at + timedelta(hours=int(match.group("amount")) * unit_hours)
+        if match.group("month"):
+            month, day = _MONTHS.index(match.group("month")) + 1, int(match.group("day"))
+        else:
+            month, day = int(match.group("numeric_month")), int(match.group("numeric_day"))
+        deadline = end_of_day.replace(month=month, day=day)
+        # a date earlier in the year than the tweet is next year's, ex: "ends jan 5" tweeted in december
+        if deadline < created_at - timedelta(days=1):
+            deadline = deadline.replace(year=deadline.year + 1)
+        return deadline
+    except ValueError:
+        # not a real date, ex: "ends 13/45"
+        return None
@@ -0,0 +1,170 @@
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import tweepy
+
+import metrics
+
+WINDOW_SECONDS = 15 * 60  # twitter rate limits are counted per 15 minute window
+# requests allowed per 15 minute window with user authentication for each read endpoint the bot uses
+ENDPOINT_LIMITS = {
+    "search/tweets": 180,
+    "statuses/lookup": 900,
+    "statuses/show": 900,
+    "friends/ids": 15,
+    "users/show": 900,
+    "users/lookup": 900,
+}
+
+
+class TokenBucket:
+    """
+    Refills `capacity` tokens evenly over `window` seconds. Each request takes one token. When the bucket is empty the
+    request is given a reservation in the future instead, so concurrent callers queue up fairly.
+    """
+
+    def __init__(self, capacity, window=WINDOW_SECONDS):
+        self.capacity = capacity
+        self.rate = capacity / window
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.resume_at = 0  # monotonic time the window resets when twitter reported no requests remaining
+
+    def reserve(self):
+        """
+        Takes one token.
+        :return: seconds to wait before the request may be sent.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        delay = 0 if self.tokens >= 0 else -self.tokens / self.rate
+        return max(delay, self.resume_at - now)
+
+    def sync(self, remaining, reset_in):
+        """
+        Corrects the bucket with the budget twitter reported in a response's rate limit headers.
+        :param remaining: x-rate-limit-remaining header value.
+        :param reset_in: seconds until x-rate-limit-reset.
+        """
+        self.tokens = min(self.tokens, remaining)
+        if remaining <= 0:
+            self.resume_at = max(self.resume_at, time.monotonic() + reset_in)
+
+
+class RateLimiter:
+    """
+    One token bucket per endpoint, shared by every thread and coroutine that calls the api so together they stay inside
+    each endpoint's 15 minute window. Endpoints without a known limit are never delayed.
+    """
+
+    def __init__(self, limits=None, window=WINDOW_SECONDS):
+        self._buckets = {endpoint: TokenBucket(limit, window)
+                         for endpoint, limit in (limits or ENDPOINT_LIMITS).items()}
+        self._lock = threading.Lock()
+
+    def reserve(self, endpoint):
+        """
+        :param endpoint: api endpoint, ex: "search/tweets".
+        :return: seconds to wait before calling the endpoint.
+        """
+        bucket = self._buckets.get(endpoint)
+        if bucket is None:
+            return 0
+        with self._lock:
+            return bucket.reserve()
+
+    def sync(self, endpoint, remaining, reset_in):
+        """
+        Corrects an endpoint's bucket with the budget twitter reported, see TokenBucket.sync().
+        """
+        bucket = self._buckets.get(endpoint)
+        if bucket is None:
+            return
+        with self._lock:
+            bucket.sync(remaining, reset_in)
+
+
+class Scheduler:
+    """
+    Decides when the next request may run. Reads (searches and lookups) only wait for their endpoint's budget in the
+    rate limiter, which is kept in sync with the x-rate-limit headers of every response. Writes (retweets, likes,
+    follows...) wait for the configured sleeps, which are a minimum time between two writes rather than a fixed sleep
+    after each one, so time spent on other work in between counts towards them.
+    """
+
+    def __init__(self, rate_limiter=None):
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self._ready_at = {}
+        self._lock = threading.Lock()
+
+    def pace(self, lane, minimum, maximum):
+        """
+        Schedules the next request on a lane a random time from now.
+        :param lane: name of the lane, ex: "write".
+        :return: seconds until the lane is ready again.
+        """
+        delay = random.uniform(minimum, maximum)
+        with self._lock:
+            self._ready_at[lane] = max(self._ready_at.get(lane, 0), time.monotonic() + delay)
+        return delay
+
+    def wait_time(self, lane):
+        """
+        :return: seconds left before the next request on a lane may run.
+        """
+        with self._lock:
+            return max(0, self._ready_at.get(lane, 0) - time.monotonic())
+
+    def observe(self, response):
+        """
+        Reads the rate limit headers of an api response into the rate limiter and counts the call in metrics.
+        :param response: requests response object.
+        """
+        metrics.API_CALLS.inc(endpoint=endpoint_from_url(response.url), status=response.status_code)
+        remaining = response.headers.get("x-rate-limit-remaining")
+        reset = response.headers.get("x-rate-limit-reset")
+        if remaining is None or reset is None:
+            return
+        self.rate_limiter.sync(endpoint_from_url(response.url), int(remaining), int(reset) - time.time())
+
+
+class ScheduledAPI(tweepy.API):
+    """
+    tweepy api that reports every response to a Scheduler. tweepy sets last_response after each request from whichever
+    thread made it, and the endpoint is read from the response url, so concurrent requests are still counted against the
+    right endpoint.
+    """
+
+    _last_response = None
+
+    def __init__(self, *args, scheduler=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.scheduler = scheduler or Scheduler()
+        self.rate_limiter = self.scheduler.rate_limiter
+
+    @property
+    def last_response(self):
+        return self._last_response
+
+    @last_response.setter
+    def last_response(self, response):
+        self._last_response = response
+        self.scheduler.observe(response)
+
+
+def endpoint_from_url(url):
+    """
+    :return: endpoint name used in ENDPOINT_LIMITS, ex: "https://api.twitter.com/1.1/search/tweets.json?q=a" becomes
+    "search/tweets". Ids in the path are replaced with ":id" like twitter's endpoint names, so every retweet is counted as
+    "statuses/retweet/:id" instead of adding a metrics series per tweet.
+    """
+    path = urlparse(url).path
+    if path.startswith("/1.1/"):
+        path = path[len("/1.1/"):]
+    if path.endswith(".json"):
+        path = path[:-len(".json")]
+    return '/'.join(":id" if part.isdigit() else part for part in path.strip("/").split("/"))
@@ -0,0 +1,106 @@
+from datetime import datetime
+
+_DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+
+class TweetRecord:
+    """
+    The few fields of a status(tweet) the bot uses, extracted once at search time. A tweepy status keeps its user,
+    retweeted_status, entities and raw json for as long as it is referenced, this keeps a handful of slots instead.
+    Hashtags and mentions are taken from the status entities twitter already parsed instead of splitting the text.
+    """
+
+    __slots__ = ("id", "original_id", "text", "screen_name", "author", "hashtags", "favorited", "retweeted",
+                 "created_at", "status_checked", "followers_count", "retweet_count", "favorite_count", "mentions",
+                 "search_keyword")
+
+    def __init__(self, id, original_id, text, screen_name, author, hashtags=(), favorited=False, retweeted=False,
+                 created_at=None, status_checked=False, followers_count=0, retweet_count=0, favorite_count=0,
+                 mentions=(), search_keyword=""):
+        """
+        :param id: status id.
+        :param original_id: id of the retweeted status for retweets, otherwise the same as id.
+        :param text: lowercase full text of the original tweet.
+        :param screen_name: screen name of the user who posted the status.
+        :param author: screen name of the original tweet's author.
+        :param hashtags: tuple of lowercase hashtags in the text, ex: ("#giveaway", "#win").
+        :param created_at: datetime the status was posted.
+        :param status_checked: True once favorited and retweeted were refreshed by ContestBot.check_statuses().
+        :param followers_count: followers of the original tweet's author.
+        :param retweet_count: retweets of the original tweet.
+        :param favorite_count: likes of the original tweet.
+        :param mentions: tuple of lowercase screen names mentioned in the original tweet, ex: ("giveawayhub",).
+        :param search_keyword: config.search_keywords entry the status was found with.
+        """
+        self.id = id
+        self.original_id = original_id
+        self.text = text
+        self.screen_name = screen_name
+        self.author = author
+        self.hashtags = hashtags
+        self.favorited = favorited
+        self.retweeted = retweeted
+        self.created_at = created_at
+        self.status_checked = status_checked
+        self.followers_count = followers_count
+        self.retweet_count = retweet_count
+        self.favorite_count = favorite_count
+        self.mentions = mentions
+        self.search_keyword = search_keyword
+
+    @classmethod
+    def from_status(cls, status, search_keyword=""):
+        """
+        :param status: tweepy status object from a search with tweet_mode="extended".
+        :param search_keyword: search keyword the status was found with.
+        """
+        original = getattr(status, "retweeted_status", status)
+        text = original.full_text.lower()
+        entities = getattr(original, "entities", None)
+        if entities is None:
+            hashtags, mentions = _hashtags(text), ()
+        else:
+            hashtags = tuple(dict.fromkeys(f'#{hashtag["text"].lower()}' for hashtag in entities.get("hashtags", ())))
+            mentions = tuple(dict.fromkeys(mention["screen_name"].lower()
+                                           for mention in entities.get("user_mentions", ())))
+        return cls(status.id, original.id, text, status.user.screen_name, original.user.screen_name,
+                   hashtags, status.favorited, status.retweeted, status.created_at,
+                   followers_count=getattr(original.user, "followers_count", 0),
+                   retweet_count=getattr(original, "retweet_count", 0),
+                   favorite_count=getattr(original, "favorite_count", 0), mentions=mentions,
+                   search_keyword=search_keyword)
+
+    @classmethod
+    def from_dict(cls, values):
+        """
+        :param values: dict from to_dict().
+        """
+        values = dict(values)
+        values["hashtags"] = tuple(values.get("hashtags", ()))
+        values["mentions"] = tuple(values.get("mentions", ()))
+        if values.get("created_at"):
+            values["created_at"] = datetime.strptime(values["created_at"], _DATETIME_FORMAT)
+        return cls(**values)
+
+    def to_dict(self):
+        """
+        :return: json serializable dict of all fields.
+        """
+        values = {name: getattr(self, name) for name in self.__slots__}
+        values["hashtags"] = list(self.hashtags)
+        values["mentions"] = list(self.mentions)
+        if self.created_at:
+            values["created_at"] = self.created_at.strftime(_DATETIME_FORMAT)
+        return values
+
+    @property
+    def is_retweet(self):
+        return self.original_id != self.id
+
+    def __repr__(self):
+        return f'TweetRecord(id={self.id}, author=@{self.author})'
+
+
+def _hashtags(lowercase_text):
+    # words starting with "#" in order of first appearance, for statuses without entities
+    return tuple(dict.fromkeys(word for word in lowercase_text.split() if word.startswith("#")))
@@ -0,0 +1,52 @@
+"""
+Replays the full main.main() loop offline against fake_api.FakeTwitterAPI and reports where the time went.
+
+    python replay.py                       # 2000 synthetic tweets, 1 search cycle
+    python replay.py statuses.json -c 3    # tweets recorded with fake_api.save_statuses(), 3 search cycles
+"""
+import argparse
+import time
+
+import config
+import fake_api
+import main
+
+
+def replay(statuses=None, cycles=1, latency=(0, 0), count=200):
+    """
+    Runs main.main() against a fake api with all sleeps and state files turned off so runs are repeatable.
+    :param statuses: list of status json dicts, defaults to fake_api.generate_statuses(2000).
+    :param cycles: number of search cycles to run.
+    :param latency: [min, max] seconds each fake api request takes.
+    :param count: config.count to search for each keyword.
+    :return: (seconds taken, fake_api.FakeTwitterAPI instance with call counts and state).
+    """
+    config.sleep_multiplier = 0
+    config.sleep_per_tweet = config.sleep_per_action = config.sleep_per_unfollow = config.sleep_unfollow_mode = [0, 0]
+    config.seen_tweets_file = config.search_checkpoints_file = config.following_cache_file = config.run_state_file = ""
+    config.fingerprints_file = config.archive_dir = config.action_journal_file = ""
+    config.count = count
+    config.file_logs = False
+    config.fake_api = config.fake_api or fake_api.SYNTHETIC
+    config.username = config.username or "contestbot"
+    api = fake_api.FakeTwitterAPI(fake_api.generate_statuses(2000) if statuses is None else statuses, latency,
+                                  username=config.username)
+    started = time.perf_counter()
+    main.main(max_cycles=cycles, api=api)
+    return time.perf_counter() - started, api
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay ContestBot offline against a fake twitter api.")
+    parser.add_argument("statuses", nargs="?", help="json file saved with fake_api.save_statuses()")
+    parser.add_argument("-c", "--cycles", type=int, default=1, help="search cycles to run")
+    parser.add_argument("-l", "--latency", type=float, nargs=2, default=[0, 0], help="[min, max] seconds per request")
+    parser.add_argument("-n", "--count", type=int, default=200, help="tweets to search for each keyword")
+    args = parser.parse_args()
+    config.level = 3
+    seconds, api = replay(fake_api.load_statuses(args.statuses) if args.statuses else None, args.cycles,
+                          args.latency, args.count)
+    print(f'Replayed {args.cycles} search cycle(s) in {seconds:.2f}s.')
+    print(f'Retweeted {len(api.retweeted)}, liked {len(api.favorited)}, following {len(api.following)}.')
+    for endpoint, calls in sorted(api.calls.items()):
+        print(f'{endpoint}: {calls} calls, {api.rate_limited[endpoint]} rate limited')
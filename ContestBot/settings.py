@@ -0,0 +1,119 @@
+import importlib.util
+import os
+import types
+
+import config
+
+SLEEP_SETTINGS = ("sleep_per_tweet", "sleep_per_action", "sleep_per_unfollow", "sleep_unfollow_mode")
+# keyword lists are matched against lowercase text, so they are lowercased once here instead of per tweet
+KEYWORD_SETTINGS = ("retweet_keywords", "like_keywords", "follow_keywords", "comment_keywords", "tag_keywords",
+                    "dm_keywords", "banned_username_words", "banned_tweet_words")
+
+
+class Settings:
+    """
+    Read only snapshot of a validated config.py, created by ContestBot.check_config(). It has the same setting names as
+    config.py, so it can be passed anywhere the config module is read. Unlike the module it is never changed in place:
+    sleeps are already multiplied by sleep_multiplier, keyword lists are lowercase frozensets, other lists are tuples
+    and the keyword matcher and optional classifier are loaded once. A changed config.py produces a new Settings object,
+    see SettingsWatcher.
+    """
+
+    def __init__(self, values, matcher=None, classifier=None):
+        """
+        :param values: dict of setting name -> value, ex: from a config module's globals.
+        :param matcher: matcher.KeywordMatcher compiled from the same settings.
+        :param classifier: classifier.ContestClassifier loaded from classifier_model, or None to only use the keywords.
+        """
+        for name, value in values.items():
+            object.__setattr__(self, name, _freeze(value))
+        object.__setattr__(self, "matcher", matcher)
+        object.__setattr__(self, "classifier", classifier)
+
+    @classmethod
+    def from_module(cls, module, matcher=None, classifier=None):
+        """
+        :param module: config module, ex: config or a freshly loaded copy of config.py.
+        """
+        values = {name: value for name, value in vars(module).items() if
+                  not name.startswith("_") and not isinstance(value, (types.ModuleType, types.FunctionType))}
+        multiplier = values.get("sleep_multiplier", 1)
+        for name in SLEEP_SETTINGS:
+            if name in values:
+                values[name] = [sleep_time * multiplier for sleep_time in values[name]]
+        for name in KEYWORD_SETTINGS:
+            if name in values:
+                values[name] = frozenset(keyword.lower() for keyword in values[name])
+        if "search_keywords" in values:
+            values["search_keywords"] = [keyword.lower() for keyword in values["search_keywords"]]
+        return cls(values, matcher, classifier)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Settings are read only. Edit config.py instead.")
+
+    def __delattr__(self, name):
+        raise AttributeError("Settings are read only. Edit config.py instead.")
+
+
+class SettingsWatcher:
+    """
+    Watches config.py for changes. Call poll() between tweets: when the file changed it is loaded into a new module,
+    validated and compiled, and the returned Settings object is swapped in one assignment. An invalid file is logged and
+    the previous settings are kept.
+    Settings only read at startup (credentials, state files, logging and metrics) still need a restart.
+    """
+
+    def __init__(self, logger, settings, load, path=config.__file__):
+        """
+        :param logger: logger instance.
+        :param settings: current Settings object.
+        :param load: function(logger, module) that validates a config module and returns Settings, ex:
+        ContestBot.check_config.
+        :param path: config.py file to watch.
+        """
+        self.logger = logger
+        self.settings = settings
+        self.load = load
+        self.path = path
+        self._mtime = self._get_mtime()
+
+    def poll(self):
+        """
+        :return: the current Settings object, reloaded if config.py changed since the last call.
+        """
+        mtime = self._get_mtime()
+        if mtime == self._mtime:
+            return self.settings
+        self._mtime = mtime
+        try:
+            settings = self.load(self.logger, load_module(self.path))
+        except Exception as e:
+            self.logger.error(f'Reloading {self.path} failed, keeping previous settings: {e}')
+            return self.settings
+        self.settings = settings
+        self.logger.info(f'Reloaded settings from {self.path}.')
+        return settings
+
+    def _get_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+
+def load_module(path):
+    """
+    :return: a new module object with the contents of a config.py file, the imported config module is left untouched.
+    """
+    spec = importlib.util.spec_from_file_location("config_reload", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _freeze(value):
+    if isinstance(value, list):
+        return tuple(value)
+    if isinstance(value, dict):
+        return types.MappingProxyType(dict(value))
+    return value
@@ -0,0 +1,216 @@
+import json
+import os
+import threading
+import time
+
+from records import TweetRecord
+
+
+class SeenIndex:
+    """
+    Append-only index of tweet ids the bot has already processed, kept in an in-memory set and mirrored to a file so it
+    survives restarts. Each line of the file is "<tweet id> <outcome>". Pass an empty path to keep it in memory only.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._ids = set()
+        self._file = None
+        self._lock = threading.Lock()
+        if path:
+            for line in read_lines(path):
+                tweet_id = line.split(" ", 1)[0]
+                if tweet_id.isdigit():
+                    self._ids.add(int(tweet_id))
+            self._file = open(path, "a", encoding="utf-8")
+
+    def __len__(self):
+        return len(self._ids)
+
+    def seen(self, tweet_ids):
+        """
+        :param tweet_ids: iterable of ids for one tweet (its own id and the original tweet id if it is a retweet).
+        :return: True if any of the ids are already in the index.
+        """
+        return any(tweet_id in self._ids for tweet_id in tweet_ids)
+
+    def add(self, tweet_ids, outcome):
+        """
+        :param tweet_ids: iterable of ids for one tweet.
+        :param outcome: short single word describing what happened to the tweet, ex: "acted" or "skipped".
+        """
+        with self._lock:
+            new_ids = [tweet_id for tweet_id in tweet_ids if tweet_id not in self._ids]
+            self._ids.update(new_ids)
+            if self._file and new_ids:
+                self._file.write(''.join(f'{tweet_id} {outcome}\n' for tweet_id in new_ids))
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+
+class SearchCheckpoints:
+    """
+    Newest tweet id found for each (search keyword, search type) pair, saved to a json file so the next search only asks
+    twitter for tweets newer than it (since_id). Pass an empty path to keep them in memory only.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._since_ids = load_json(path, {}) if path else {}
+
+    @staticmethod
+    def _key(search_keyword, search_type):
+        return f'{search_type}:{search_keyword}'
+
+    def get(self, search_keyword, search_type):
+        """
+        :return: newest tweet id found by a previous search or None.
+        """
+        return self._since_ids.get(self._key(search_keyword, search_type))
+
+    def update(self, search_keyword, search_type, newest_id):
+        key = self._key(search_keyword, search_type)
+        if newest_id and newest_id > self._since_ids.get(key, 0):
+            self._since_ids[key] = newest_id
+            if self.path:
+                write_json_atomic(self.path, self._since_ids)
+
+
+class FollowingCache:
+    """
+    User ids the bot account follows, newest follow first like the friends/ids api returns them. Follows and unfollows
+    update it locally and it is saved to a json file, so it only needs to be reloaded from the api once it is older than
+    ttl seconds or after it is invalidated because it drifted from the api. Pass an empty path to keep it in memory
+    only.
+    """
+
+    def __init__(self, path, ttl):
+        self.path = path
+        self.ttl = ttl
+        saved = load_json(path, {}) if path else {}
+        self._ids = saved.get("ids", [])
+        self._id_set = set(self._ids)
+        self.synced_at = saved.get("synced_at", 0)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, user_id):
+        return user_id in self._id_set
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def ids(self):
+        """
+        :return: copy of the user ids, newest follow first.
+        """
+        return list(self._ids)
+
+    def is_stale(self):
+        return time.time() - self.synced_at > self.ttl
+
+    def invalidate(self):
+        self.synced_at = 0
+        self._save()
+
+    def replace(self, user_ids):
+        """
+        Reconciles the cache with the user ids returned by the api.
+        """
+        self._ids = list(user_ids)
+        self._id_set = set(self._ids)
+        self.synced_at = time.time()
+        self._save()
+
+    def add(self, user_id):
+        if user_id not in self._id_set:
+            self._ids.insert(0, user_id)
+            self._id_set.add(user_id)
+            self._save()
+
+    def remove(self, user_id):
+        if user_id in self._id_set:
+            self._ids.remove(user_id)
+            self._id_set.discard(user_id)
+            self._save()
+
+    def _save(self):
+        if self.path:
+            write_json_atomic(self.path, {"ids": self._ids, "synced_at": self.synced_at})
+
+
+class RunState:
+    """
+    Work state of main.main() saved to a json file so a restarted bot picks up where it stopped instead of starting a
+    new search cycle: the counters, current search type, contests found but not acted on yet and the progress of an
+    unfinished unfollow mode. Saves are atomic and at most every interval seconds unless forced. Pass an empty path to
+    keep it in memory only.
+    """
+
+    def __init__(self, path, interval=0):
+        self.path = path
+        self.interval = interval
+        saved = load_json(path, {}) if path else {}
+        self.counters = saved.get("counters", {})
+        self.search_type = saved.get("search_type")
+        # [(records.TweetRecord, actions dict)]
+        self.pending = [(TweetRecord.from_dict(tweet), actions) for tweet, actions in saved.get("pending", [])]
+        # {"following": user ids left to unfollow oldest follow last, "total": users to unfollow, "unfollowed": done,
+        # "started": unix time the unfollow mode started}
+        self.unfollow = saved.get("unfollow")
+        self.saved_at = 0
+
+    def save(self, force=False):
+        """
+        :param force: save even if the last save was less than interval seconds ago.
+        :return: True if the state was written.
+        """
+        if not self.path or (not force and time.monotonic() - self.saved_at < self.interval):
+            return False
+        write_json_atomic(self.path, {"counters": self.counters, "search_type": self.search_type,
+                                      "pending": [[tweet.to_dict(), actions] for tweet, actions in self.pending],
+                                      "unfollow": self.unfollow})
+        self.saved_at = time.monotonic()
+        return True
+
+
+def read_lines(path):
+    """
+    Yields the lines of an append-only state file, nothing if it does not exist. A crash mid-write can leave a partial
+    last line without its newline, it is left out.
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if line.endswith("\n"):
+                yield line
+
+
+def load_json(path, default):
+    """
+    :return: the contents of a json file, or default if it does not exist or is unreadable.
+    """
+    try:
+        with open(path, encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return default
+
+
+def write_json_atomic(path, data):
+    """
+    Writes data to a temp file and renames it over path so a crash never leaves a half written file behind.
+    """
+    temp_path = f'{path}.tmp'
+    with open(temp_path, "w", encoding="utf-8") as file:
+        json.dump(data, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
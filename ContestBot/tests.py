@@ -96,3 +96,720 @@ def test_generate_text(logger):
         permutations.extend([original_reply, upper_reply, lower_reply])
 
     assert generated_reply in permutations
+
+
+def test_build_matcher(logger):
+    matcher = ContestBot.build_matcher(logger)
+    texts = ["rt and like to win! follow @us #giveaway", "start the party", "rt, fav and tag a friend",
+             "download our album", "nothing to see here", "rt", "dm me to enter, retweet ❤️", ""]
+    for text in texts:
+        found = matcher.classify(text, "contest_bot")
+        assert ("banned_user" in found) == any(word.lower() in "contest_bot" for word in config.banned_username_words)
+        assert ("banned_word" in found) == any(word.lower() in text for word in config.banned_tweet_words)
+        expected_retweet = any(word == "rt" for word in text.split()) or any(
+            keyword.lower() in text for keyword in config.retweet_keywords if keyword.lower() != "rt")
+        assert ("retweet" in found) == (expected_retweet and config.retweet)
+        assert ("like" in found) == (any(keyword.lower() in text for keyword in config.like_keywords) and config.like)
+        assert ("follow" in found) == (
+                any(keyword.lower() in text for keyword in config.follow_keywords) and config.follow)
+        assert ("tag" in found) == (any(keyword.lower() in text for keyword in config.tag_keywords) and config.comment)
+        assert ("dm" in found) == (any(keyword.lower() in text for keyword in config.dm_keywords) and config.dm)
+
+
+def test_keyword_matcher_overlapping_keywords():
+    from matcher import KeywordMatcher
+    matcher = KeywordMatcher({"a": ["fav"], "b": ["favorite"], "c": ["rite"]}, {"d": ["rt"]})
+    assert matcher.classify("my favorite rt") == {"a", "b", "c", "d"}
+    assert matcher.classify("start fav") == {"a"}
+
+
+def test_classification_cache(logger, monkeypatch):
+    import pickle
+    import time
+    from caches import LRUCache
+
+    monkeypatch.setattr(config, "classification_cache_size", 2)
+    matcher = ContestBot.build_matcher(logger)
+    text = "rt and like to win a gift card"
+    # a retweet has an equal text in a different string object
+    assert matcher.classify(text) == matcher.classify(''.join(list(text))) and matcher.classify("hello") == set()
+    assert (matcher.cache.hits, matcher.cache.misses) == (1, 2)
+    assert pickle.loads(pickle.dumps(matcher)).cache.maxsize == 2
+    cache = LRUCache(2, ttl=0.05)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    # "b" was the least recently used, "a" expires after the ttl
+    assert "b" not in cache and cache.get("a") == 1
+    time.sleep(0.06)
+    assert cache.get("a") is None and (cache.hits, cache.misses) == (2, 1)
+
+
+def test_seen_index(tmp_path):
+    from storage import SeenIndex
+    path = str(tmp_path / "seen_tweets.txt")
+    seen_index = SeenIndex(path)
+    seen_index.add((1, 2), "acted")
+    assert seen_index.seen((3, 2))
+    assert not seen_index.seen((3,))
+    seen_index.close()
+    # index survives a restart
+    assert SeenIndex(path).seen((1,))
+
+
+def test_mark_skipped(logger, monkeypatch):
+    from records import TweetRecord
+    from storage import SeenIndex
+
+    monkeypatch.setattr(config, "banned_username_words", ["spambot"])
+    seen_index = SeenIndex("")
+    # a banned retweeter only rules out its own retweet, not the contest it retweeted
+    retweet = TweetRecord(1, 100, "rt and like to win", "spambot99", "brand")
+    text, reason = ContestBot._check_tweet(logger, None, retweet, ContestBot.build_matcher(logger))
+    ContestBot.mark_skipped(logger, seen_index, retweet, reason)
+    assert reason == "banned_user" and seen_index.seen((1,)) and not seen_index.seen((2, 100))
+    ContestBot.mark_skipped(logger, seen_index, TweetRecord(3, 200, "win", "fan", "brand"), "error")
+    assert not seen_index.seen((3, 200))
+    ContestBot.mark_skipped(logger, seen_index, TweetRecord(4, 300, "win", "fan", "brand"), "banned_word")
+    assert seen_index.seen((5, 300))
+
+
+def test_check_statuses(logger):
+    from types import SimpleNamespace
+
+    class LookupApi:
+        calls = []
+
+        def statuses_lookup(self, ids, **kwargs):
+            self.calls.append(ids)
+            # tweet 7 has been deleted
+            return [SimpleNamespace(id=tweet_id, favorited=tweet_id == 3, retweeted=False) for tweet_id in ids
+                    if tweet_id != 7]
+
+    api = LookupApi()
+    tweets = [SimpleNamespace(id=tweet_id) for tweet_id in range(250)]
+    checked = ContestBot.check_statuses(logger, api, tweets)
+    assert [len(ids) for ids in api.calls] == [100, 100, 50]
+    assert len(checked) == 249
+    assert checked[3].favorited and checked[3].status_checked
+
+
+def test_search_checkpoints(tmp_path):
+    from types import SimpleNamespace
+    from storage import SearchCheckpoints
+    path = str(tmp_path / "search_checkpoints.json")
+    checkpoints = SearchCheckpoints(path)
+    assert checkpoints.get("giveaway", "mixed") is None
+    checkpoints.update("giveaway", "mixed", 100)
+    checkpoints.update("giveaway", "mixed", 50)
+    assert SearchCheckpoints(path).get("giveaway", "mixed") == 100
+    assert SearchCheckpoints(path).get("giveaway", "recent") is None
+    # recent results are newest first and stop at the checkpoint, ranked mixed results only skip the old tweets
+    page = [SimpleNamespace(id=tweet_id) for tweet_id in (120, 90, 110)]
+    assert [status.id for status in ContestBot._new_statuses(page, 100, 10, "recent")[0]] == [120]
+    assert [status.id for status in ContestBot._new_statuses(page, 100, 10, "mixed")[0]] == [120, 110]
+
+
+def test_fingerprint_index(logger, tmp_path, monkeypatch):
+    from fingerprint import FingerprintIndex, simhash
+    from records import TweetRecord
+    from storage import SeenIndex
+
+    monkeypatch.setattr(config, "banned_username_words", ["spambot"])
+
+    texts = ["giveaway! rt and follow @brand to win a $100 gift card, ends friday https://t.co/abc #win",
+             "giveaway! rt and follow @brand to win a $100 gift card, ends friday https://t.co/xyz #win",
+             "new album out now, stream it everywhere and tell all your friends",
+             "giveaway! rt and follow @brand to win a $100 gift card, ends sunday #win"]
+    tweets = [TweetRecord(index, index, text, "brand", "brand") for index, text in enumerate(texts)]
+    # a copy reposted by a banned user is dropped without hiding the other copies
+    tweets.insert(0, TweetRecord(9, 9, texts[0], "spambot1", "spambot1"))
+    tweets.append(TweetRecord(4, 4, texts[1], "fan", "fan"))
+    path = str(tmp_path / "fingerprints.txt")
+    fingerprints = FingerprintIndex(path, max_distance=3)
+    seen_index = SeenIndex("")
+    # the copies with a different link are held back, the same giveaway with another deadline is kept
+    unseen = list(ContestBot.iter_unseen_tweets(logger, tweets, seen_index, fingerprints,
+                                                matcher=ContestBot.build_matcher(logger)))
+    assert [tweet.id for tweet in unseen] == [0, 2, 3] and not seen_index.seen((1,)) and not seen_index.seen((4,))
+    # tweet 0 was deleted, its first copy takes its place and is kept, so the other copy is dropped
+    assert [tweet.id for tweet in ContestBot.settle_fingerprint(logger, fingerprints, unseen[0], False,
+                                                                seen_index)] == [1]
+    assert not ContestBot.settle_fingerprint(logger, fingerprints, tweets[2], True, seen_index)
+    assert seen_index.seen((4,)) and not seen_index.seen((0,))
+    # only checked tweets are saved, ex: tweet 3 was deleted too
+    for tweet in unseen[1:]:
+        ContestBot.settle_fingerprint(logger, fingerprints, tweet, tweet.id != 3, seen_index)
+    assert fingerprints.find(simhash(texts[3])) is None
+    fingerprints.close()
+    fingerprints = FingerprintIndex(path)
+    assert len(fingerprints) == 2 and fingerprints.find(simhash(texts[0])) is not None and simhash("rt to win") is None
+
+
+def test_tweet_pipeline(logger, monkeypatch):
+    from types import SimpleNamespace
+    from fingerprint import FingerprintIndex
+    from pipeline import TweetPipeline
+    from records import TweetRecord
+    from storage import SeenIndex
+
+    def make_tweet(tweet_id, text):
+        return TweetRecord(tweet_id, tweet_id, text.lower(), "brand", "brand")
+
+    search_results = [make_tweet(1, "RT and like to win"), make_tweet(2, "hello"), make_tweet(1, "RT and like to win"),
+                      make_tweet(3, "follow and retweet, download now"), make_tweet(4, "like and follow")]
+    monkeypatch.setattr(ContestBot, "iter_search_results", lambda *args: iter(search_results))
+
+    class LookupApi:
+        deleted = ()
+
+        def statuses_lookup(self, ids, **kwargs):
+            return [SimpleNamespace(id=tweet_id, favorited=False, retweeted=False) for tweet_id in ids
+                    if tweet_id not in self.deleted]
+
+    pipeline = TweetPipeline(logger, LookupApi(), "mixed", queue_size=1)
+    results = [(tweet.id, bool(actions)) for tweet, actions in pipeline]
+    assert results == [(1, True), (2, False), (3, False), (4, config.like)]
+    # three copies of a giveaway and the first one was deleted, the second one takes its place and the third is dropped
+    text = "giveaway! rt and like to win a $100 gift card, ends friday"
+    search_results[:] = [make_tweet(tweet_id, f'{text} https://t.co/{tweet_id}') for tweet_id in (5, 6, 7)]
+    api = LookupApi()
+    api.deleted = (5,)
+    seen_index = SeenIndex("")
+    fingerprints = FingerprintIndex("")
+    pipeline = TweetPipeline(logger, api, "mixed", seen_index=seen_index, fingerprints=fingerprints, queue_size=1)
+    assert [tweet.id for tweet, _ in pipeline] == [6]
+    assert seen_index.seen((7,)) and not seen_index.seen((5,)) and len(fingerprints) == 1
+
+
+def test_search_resumes_after_close(logger, monkeypatch):
+    from fake_api import FakeTwitterAPI, generate_statuses
+    from storage import SearchCheckpoints
+
+    monkeypatch.setattr(config, "search_keywords", ["giveaway", "contest"])
+    monkeypatch.setattr(config, "count", 150)
+    api = FakeTwitterAPI(generate_statuses(1000))
+    checkpoints = SearchCheckpoints("")
+    everything = list(ContestBot.iter_search_results(logger, api, "recent", SearchCheckpoints("")))
+    first_keyword = sum(1 for tweet in everything if tweet.search_keyword == "giveaway")
+    # the search is closed one tweet into the second keyword, the caller only moves the first keyword's checkpoint
+    # once it processed those tweets
+    finished = []
+    results = ContestBot.iter_search_results(logger, api, "recent", checkpoints,
+                                             on_finished=lambda *checkpoint: finished.append(checkpoint))
+    for _ in range(first_keyword + 1):
+        next(results)
+    results.close()
+    assert [search_keyword for search_keyword, _ in finished] == [ContestBot._build_search_query(logger, "giveaway")]
+    assert all(checkpoints.get(ContestBot._build_search_query(logger, keyword), "recent") is None
+               for keyword in config.search_keywords)
+    # nothing was processed yet, so the next search finds every tweet again
+    rest = list(ContestBot.iter_search_results(logger, api, "recent", checkpoints))
+    assert [tweet.id for tweet in rest] == [tweet.id for tweet in everything]
+    # once the first keyword's tweets were processed only the rest of the second keyword is searched again
+    checkpoints = SearchCheckpoints("")
+    checkpoints.update(finished[0][0], "recent", finished[0][1])
+    rest = list(ContestBot.iter_search_results(logger, api, "recent", checkpoints))
+    assert [tweet.id for tweet in rest] == [tweet.id for tweet in everything[first_keyword:]]
+
+
+@pytest.mark.parametrize("async_search", [False, True])
+def test_pipeline_checkpoints(logger, monkeypatch, async_search):
+    from fake_api import FakeTwitterAPI, generate_statuses
+    from pipeline import TweetPipeline
+    from storage import SearchCheckpoints, SeenIndex
+
+    monkeypatch.setattr(config, "search_keywords", ["giveaway", "contest"])
+    monkeypatch.setattr(config, "count", 5)
+    monkeypatch.setattr(config, "async_search", async_search)
+    api = FakeTwitterAPI(generate_statuses(1000))
+    everything = [tweet for tweet, _ in TweetPipeline(logger, api, "recent", checkpoints=SearchCheckpoints(""))]
+    checkpoints = SearchCheckpoints("")
+    seen_index = SeenIndex("")
+    # the whole search waits in the stage queues while the consumer handles the first tweet and stops
+    tweets = TweetPipeline(logger, api, "recent", seen_index=seen_index, checkpoints=checkpoints)
+    tweets._threads[0].join(5)
+    first, _ = next(iter(tweets))
+    tweets.close()
+    for thread in tweets._threads:
+        thread.join(5)
+    ContestBot.mark_seen(logger, seen_index, first, "acted")
+    queries = [ContestBot._build_search_query(logger, keyword) for keyword in config.search_keywords]
+    assert all(checkpoints.get(query, "recent") is None for query in queries)
+    # the next search finds every tweet that was not handled yet, ex: tweets skipped by the filter stage are handled,
+    # and moves the checkpoints once they are
+    unhandled = {tweet.id for tweet in everything if not seen_index.seen(ContestBot._get_tweet_ids(logger, tweet))}
+    rest = [tweet.id for tweet, _ in TweetPipeline(logger, api, "recent", seen_index=seen_index,
+                                                   checkpoints=checkpoints)]
+    assert unhandled and set(rest) == unhandled
+    assert all(checkpoints.get(query, "recent") for query in queries)
+
+
+def test_async_search(logger, monkeypatch):
+    import threading
+    import time
+    import async_engine
+    from fake_api import FakeTwitterAPI, generate_statuses
+    from storage import SearchCheckpoints
+
+    monkeypatch.setattr(config, "search_keywords", ["giveaway", "contest"])
+    monkeypatch.setattr(config, "count", 150)
+    api = FakeTwitterAPI(generate_statuses(1000))
+    checkpoints = SearchCheckpoints("")
+    # the consumer stops after one tweet, the searches are cancelled and no checkpoint moves past unused tweets
+    results = async_engine.iter_search_results(logger, api, "recent", checkpoints, queue_size=1)
+    next(results)
+    results.close()
+    deadline = time.monotonic() + 5
+    while any(thread.name == "async-search" for thread in threading.enumerate()) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert not any(thread.name == "async-search" for thread in threading.enumerate())
+    assert api.calls["search/tweets"] <= 2 and checkpoints.get(ContestBot._build_search_query(
+        logger, "giveaway"), "recent") is None
+    tweets = list(async_engine.iter_search_results(logger, api, "recent", checkpoints, queue_size=1))
+    newest_ids = {keyword: max(tweet.id for tweet in tweets if tweet.search_keyword == keyword)
+                  for keyword in config.search_keywords}
+    assert all(checkpoints.get(ContestBot._build_search_query(logger, keyword), "recent") == newest_ids[keyword]
+               for keyword in config.search_keywords)
+    # with on_finished the checkpoints are handed to the caller instead
+    finished = {}
+    tweets = list(async_engine.iter_search_results(logger, api, "recent", SearchCheckpoints(""),
+                                                   on_finished=finished.__setitem__))
+    assert finished == {ContestBot._build_search_query(logger, keyword): max(
+        tweet.id for tweet in tweets if tweet.search_keyword == keyword) for keyword in config.search_keywords}
+
+
+def test_rate_limiter():
+    from ratelimit import RateLimiter
+    rate_limiter = RateLimiter({"search/tweets": 2}, window=10)
+    assert rate_limiter.reserve("search/tweets") == 0
+    assert rate_limiter.reserve("search/tweets") == 0
+    # third request in the window has to wait about one refill interval
+    assert 4 < rate_limiter.reserve("search/tweets") <= 5
+    assert rate_limiter.reserve("statuses/retweet") == 0
+
+
+def test_scheduler():
+    import time
+    from types import SimpleNamespace
+    from ratelimit import ScheduledAPI, endpoint_from_url
+
+    assert endpoint_from_url("https://api.twitter.com/1.1/search/tweets.json?q=giveaway") == "search/tweets"
+    # one label per endpoint, not per tweet
+    assert (endpoint_from_url("https://api.twitter.com/1.1/statuses/retweet/1350000000000000000.json")
+            == endpoint_from_url("https://api.twitter.com/1.1/statuses/retweet/1350000000000001000.json")
+            == "statuses/retweet/:id")
+    api = ScheduledAPI()
+    scheduler = api.scheduler
+    # twitter reports the search window is used up for another 60 seconds
+    api.last_response = SimpleNamespace(url="https://api.twitter.com/1.1/search/tweets.json", status_code=200,
+                                        headers={"x-rate-limit-remaining": "0",
+                                                 "x-rate-limit-reset": str(int(time.time()) + 60)})
+    assert 55 < api.rate_limiter.reserve("search/tweets") <= 60
+    assert api.rate_limiter.reserve("statuses/lookup") == 0
+    # configured sleeps are a minimum time between writes
+    assert scheduler.wait_time("write") == 0
+    scheduler.pace("write", 30, 30)
+    assert 29 < scheduler.wait_time("write") <= 30
+
+
+def test_following_cache(tmp_path):
+    from storage import FollowingCache
+    path = str(tmp_path / "following.json")
+    following_cache = FollowingCache(path, ttl=60)
+    assert following_cache.is_stale()
+    following_cache.replace([3, 2, 1])
+    following_cache.add(4)
+    following_cache.remove(1)
+    assert not following_cache.is_stale()
+    # survives a restart, newest follow first
+    following_cache = FollowingCache(path, ttl=60)
+    assert following_cache.ids() == [4, 3, 2] and 4 in following_cache
+    following_cache.invalidate()
+    assert following_cache.is_stale()
+
+
+def test_get_following(logger, monkeypatch):
+    from fake_api import FakeTwitterAPI, generate_statuses
+    from storage import FollowingCache
+
+    monkeypatch.setattr(config, "sleep_unfollow_mode", [0, 0])
+    monkeypatch.setattr(config, "sleep_per_unfollow", [0, 0])
+    monkeypatch.setattr(config, "unfollow_range", [2, 2])
+    api = FakeTwitterAPI(generate_statuses(50))
+    user_ids = list(api.users)[:4]
+    api.following = list(user_ids)
+    following_cache = FollowingCache("", ttl=60)
+    assert ContestBot._get_following(logger, api, following_cache) == user_ids
+    # a fresh cache is counted without copying its ids, the list is only built by the unfollow mode
+    monkeypatch.setattr(FollowingCache, "ids", None)
+    following = ContestBot._get_following(logger, api, following_cache)
+    assert following is following_cache and len(following) == 4 and api.calls["friends/ids"] == 1
+    assert ContestBot._unfollow_mode(logger, api, following, following_cache) == 2
+    assert api.following == user_ids[:2] and list(following_cache) == user_ids[:2]
+
+
+def test_run_state(logger, tmp_path, monkeypatch):
+    from fake_api import FakeTwitterAPI, generate_statuses
+    from storage import RunState
+
+    monkeypatch.setattr(config, "sleep_unfollow_mode", [0, 0])
+    monkeypatch.setattr(config, "sleep_per_unfollow", [0, 0])
+    api = FakeTwitterAPI(generate_statuses(50))
+    user_ids = list(api.users)[:6]
+    api.following = list(user_ids)
+    path = str(tmp_path / "run_state.json")
+    run_state = RunState(path)
+    tweet = ContestBot._get_tweet_record(logger, api.search(q="giveaway")[0])
+    run_state.counters = {"tweet_num": 7}
+    run_state.pending = [(tweet, {"retweet": True})]
+    # a crash after unfollowing 2 of 4 users
+    run_state.unfollow = {"following": list(user_ids), "total": 4, "unfollowed": 2}
+    run_state.save()
+
+    run_state = RunState(path)
+    assert run_state.counters == {"tweet_num": 7} and run_state.pending[0][1] == {"retweet": True}
+    saved_tweet = run_state.pending[0][0]
+    assert (saved_tweet.id, saved_tweet.text, saved_tweet.hashtags, saved_tweet.created_at) == \
+           (tweet.id, tweet.text, tweet.hashtags, tweet.created_at)
+    assert ContestBot.resume_unfollow_mode(logger, api, run_state) == 4
+    # only the 2 remaining users were unfollowed, oldest follow first
+    assert api.following == user_ids[:4] and RunState(path).unfollow is None
+
+
+def test_unfollow_mode(logger, monkeypatch):
+    from caches import LRUCache
+    from fake_api import FakeTwitterAPI, generate_statuses
+
+    monkeypatch.setattr(config, "sleep_unfollow_mode", [0, 0])
+    monkeypatch.setattr(config, "sleep_per_unfollow", [0, 0])
+    monkeypatch.setattr(config, "unfollow_range", [2, 2])
+    monkeypatch.setattr(ContestBot, "_screen_names", LRUCache(2))
+    api = FakeTwitterAPI(generate_statuses(50))
+    user_ids = list(api.users)[:3]
+    # the oldest follow is a suspended user, it is skipped without an unfollow request
+    api.following = user_ids + [42]
+    assert ContestBot._unfollow_mode(logger, api, list(api.following)) == 2
+    assert api.following == user_ids[:1] + [42]
+    assert api.calls["users/lookup"] == 1 and api.calls["friendships/destroy"] == 2 and not api.calls["users/show"]
+    # screen names are cached, the least recently used is forgotten
+    assert len(ContestBot._screen_names) == 2 and user_ids[0] not in ContestBot._screen_names
+
+
+def test_action_journal(logger, tmp_path, monkeypatch):
+    from fake_api import FakeTwitterAPI, generate_statuses
+    from journal import ActionJournal
+    from records import TweetRecord
+
+    monkeypatch.setattr(config, "sleep_per_action", [0, 0])
+    monkeypatch.setattr(config, "sleep_per_tweet", [0, 0])
+    path = str(tmp_path / "action_journal.txt")
+    api = FakeTwitterAPI(generate_statuses(50))
+    tweet = TweetRecord.from_status(api.search(q="giveaway")[0])
+    # the last run retweeted the contest and crashed while liking it
+    journal = ActionJournal(path, commit_interval=60)
+    journal.intend("retweet", tweet.original_id)
+    journal.complete("retweet", tweet.original_id, True)
+    journal.intend("like", tweet.original_id)
+    # intents are on disk before the action runs, the retweet's outcome shared the like intent's fsync
+    with open(path, encoding="utf-8") as file:
+        assert file.read().endswith(f' like {tweet.original_id} intent\n')
+    assert journal.commits == 2
+    journal.close()
+    with open(path, "a", encoding="utf-8") as file:
+        file.write("1600000000.000 lik")
+    journal = ActionJournal(path, commit_interval=60)
+    assert journal.in_doubt() == [("like", tweet.original_id)]
+    completed = ContestBot.perform_actions(logger, api, tweet, {"retweet": True, "like": True}, journal=journal)
+    # the retweet is replayed from the journal, only the like is new
+    assert completed["retweet"] == ContestBot.REPLAYED and completed["like"] is True
+    assert not api.calls["statuses/retweet"] and api.calls["favorites/create"] == 1
+    journal.close()
+    journal = ActionJournal(path)
+    assert journal.done_actions(tweet.original_id) == {"retweet", "like"} and not journal.in_doubt()
+    # found again by a search, it is dropped without a status lookup
+    assert list(ContestBot.iter_unseen_tweets(logger, [tweet], journal=journal)) == []
+    journal.close()
+
+
+def test_fake_api(logger):
+    import tweepy
+    from fake_api import FakeTwitterAPI, generate_statuses
+
+    api = FakeTwitterAPI(generate_statuses(300), rate_limits={"search/tweets": 2})
+    pages = list(tweepy.Cursor(api.search, q="giveaway", count=100).pages(2))
+    assert len(pages) == 2 and pages[0][0].id > pages[1][0].id
+    # a third search request in the window is rate limited like twitter would
+    with pytest.raises(tweepy.RateLimitError):
+        api.search(q="giveaway")
+    tweet = pages[0][0]
+    assert ContestBot._follow(logger, api, tweet) and tweet.user.id in api.following
+
+
+def test_tweet_record():
+    from fake_api import generate_statuses
+    from tweepy.models import Status
+    from records import TweetRecord
+
+    statuses = [Status.parse(None, status) for status in generate_statuses(50, retweet_ratio=0.5)]
+    retweet = next(status for status in statuses if hasattr(status, "retweeted_status"))
+    record = TweetRecord.from_status(retweet)
+    assert record.is_retweet and record.original_id == retweet.retweeted_status.id
+    assert record.text == retweet.retweeted_status.full_text.lower()
+    assert record.author == retweet.retweeted_status.user.screen_name
+    assert record.screen_name == retweet.user.screen_name
+    assert record.hashtags == tuple(f'#{hashtag["text"]}' for hashtag in retweet.retweeted_status.entities["hashtags"])
+    mention = next(status for status in statuses if status.entities["user_mentions"])
+    assert TweetRecord.from_status(mention).mentions == (mention.entities["user_mentions"][0]["screen_name"],)
+    assert not hasattr(record, "__dict__")
+
+
+def test_replay(monkeypatch):
+    from replay import replay
+    # replay() overrides config settings, put them back after the test
+    for name in ("sleep_multiplier", "sleep_per_tweet", "sleep_per_action", "sleep_per_unfollow", "sleep_unfollow_mode",
+                 "seen_tweets_file", "search_checkpoints_file", "following_cache_file", "run_state_file",
+                 "fingerprints_file", "archive_dir", "action_journal_file", "count", "file_logs", "fake_api",
+                 "username"):
+        monkeypatch.setattr(config, name, getattr(config, name))
+    seconds, api = replay(cycles=1, count=50)
+    assert api.calls["search/tweets"] > 0 and api.retweeted
+
+
+def test_unfollow_mode_keeps_tweet(monkeypatch, tmp_path):
+    import main
+    from fake_api import FakeTwitterAPI, generate_statuses
+    from storage import RunState
+
+    path = str(tmp_path / "run_state.json")
+    for name, value in (("seen_tweets_file", ""), ("search_checkpoints_file", ""), ("following_cache_file", ""),
+                        ("fingerprints_file", ""), ("archive_dir", ""), ("action_journal_file", ""),
+                        ("run_state_file", path), ("file_logs", False), ("fake_api", "synthetic"),
+                        ("username", "contestbot"), ("count", 50), ("follow", True), ("rank_contests", False),
+                        ("max_following", [1, 1]), ("unfollow_range", [1, 1]), ("watch_config", False)):
+        monkeypatch.setattr(config, name, value)
+    for name in ("sleep_per_tweet", "sleep_per_action", "sleep_per_unfollow", "sleep_unfollow_mode"):
+        monkeypatch.setattr(config, name, [0, 0])
+    statuses = generate_statuses(500)
+    following = list(dict.fromkeys(status["user"]["id"] for status in statuses))[:3]
+    api = FakeTwitterAPI(statuses, following=following, username="contestbot")
+    main.main(max_cycles=1, api=api)
+    # the first follow contest started the unfollow mode, it is saved to be entered before the repeated search
+    run_state = RunState(path)
+    tweet, actions = run_state.pending[0]
+    assert actions["follow"] and tweet.original_id not in api.retweeted and len(api.following) == 2
+    assert run_state.search_type == config.search_type
+
+
+def test_benchmark():
+    import benchmark
+    results = benchmark.run(count=200, names=["_get_tweet_text", "find_actions"])
+    assert set(results) == {"_get_tweet_text", "find_actions"}
+    assert results["find_actions"]["tweets_per_second"] > 0 and results["find_actions"]["bytes_per_tweet"] > 0
+    assert not benchmark.compare(results, results)
+    slower = {name: dict(result, tweets_per_second=result["tweets_per_second"] * 2) for name, result in results.items()}
+    assert len(benchmark.compare(results, slower)) == 2
+
+
+def test_batch_classifier(logger):
+    from batch import BatchClassifier, classify_tweet
+    from benchmark import build_corpus
+
+    _, tweets = build_corpus(600)
+    matcher = ContestBot.build_matcher(logger)
+    serial = [classify_tweet(logger, tweet, matcher) for tweet in tweets]
+    with BatchClassifier(logger, matcher, workers=2, chunk_size=100, min_pool_tweets=0) as classifier:
+        assert classifier.classify(tweets) == serial
+    assert any(serial) and not all(serial)
+
+
+def test_contest_classifier(logger, tmp_path):
+    pytest.importorskip("numpy")
+    from classifier import ContestClassifier
+
+    contests = ["rt and follow to win a $100 gift card", "giveaway! like and retweet to enter #win",
+                "tag 3 friends to win the prize", "follow us and rt for a chance to win"]
+    spam = ["album out now, stream it", "join our discord for free nft mints", "download the app today",
+            "good morning everyone, start your day right"]
+    classifier = ContestClassifier.train(contests + spam, [True] * 4 + [False] * 4)
+    path = str(tmp_path / "contest_model.npz")
+    classifier.save(path)
+    classifier = ContestClassifier.load(path)
+    assert classifier.is_contest(contests + spam + [""]) == [True] * 4 + [False] * 5
+    # spam with contest keywords is no longer sent to find_actions
+    texts = ["rt and follow to win a gift card", "rt our new album out now, download the app"]
+    assert ContestBot.find_actions(logger, texts[1])
+    found = ContestBot.find_actions_batch(logger, texts, classifier=classifier)
+    assert found[0] and found[0]["retweet"] and found[1] is False
+
+
+def test_cycle_profiler(logger, tmp_path, monkeypatch):
+    import time
+    from profiling import CycleProfiler
+
+    def busy_work():
+        started = time.perf_counter()
+        while time.perf_counter() - started < 0.2:
+            pass
+
+    profiler = CycleProfiler(logger, str(tmp_path), interval=0.002, sleep_functions=(ContestBot._random_sleep,))
+    profiler.start(1)
+    assert profiler.stop() is None
+    profiler.toggle()
+    profiler.start(2)
+    busy_work()
+    ContestBot._random_sleep(logger, 0.2, 0.2)
+    path = profiler.stop()
+    with open(path, encoding="utf-8") as file:
+        stacks = file.read()
+    # sleeping is counted apart from the work stacks
+    assert "busy_work" in stacks and "_random_sleep" not in stacks
+    assert profiler.sleep_samples["_random_sleep"] > 10
+
+
+def test_tweet_archive(tmp_path):
+    from datetime import datetime
+    from archive import ArchiveReader, ArchiveWriter, _truncate
+    from records import TweetRecord
+
+    path = str(tmp_path / "archive")
+    archive = ArchiveWriter(path, flush_rows=2)
+    for index, text in enumerate(("rt to win a ps5 🎮", "follow and like to win", "just a tweet")):
+        tweet = TweetRecord(index + 1, 100 + index, text, "brand", "brand", ("#giveaway",),
+                            created_at=datetime(2021, 1, 1), search_keyword="win")
+        archive.append(tweet, "recent", {"retweet": True, "follow": index == 1}, {"retweet": index == 0})
+    # two rows were flushed, the third is still buffered
+    with ArchiveReader(path) as reader:
+        assert len(reader) == 2
+    archive.close()
+    # a crash part way through a flush leaves a partial row behind, reopening drops it
+    with open(tmp_path / "archive" / "text.heap", "ab") as file:
+        file.write(b"partial")
+    with open(tmp_path / "archive" / "id.col", "ab") as file:
+        file.write(b"\x01" * 8)
+    ArchiveWriter(path).close()
+    with ArchiveReader(path) as reader:
+        assert len(reader) == 3
+        assert list(reader.column("original_id")) == [100, 101, 102]
+        assert list(reader.strings("text"))[0] == "rt to win a ps5 🎮"
+        assert reader.find("text", "win") == [0, 1] and reader.find("text", "partial") == []
+        row = reader.row(1)
+        assert row["detected"] == ("retweet", "follow") and row["performed"] == ()
+        assert row["hashtags"] == ("#giveaway",) and row["search_type"] == "recent" and row["search_keyword"] == "win"
+        assert row["created_at"] == 1609459200.0  # 2021-01-01 00:00 utc
+    # repairing never pads a column that is shorter than expected
+    _truncate(str(tmp_path / "short.col"), 8)
+    assert (tmp_path / "short.col").stat().st_size == 0
+
+
+def test_metrics(tmp_path):
+    from urllib.request import urlopen
+    import metrics
+
+    registry = metrics.Registry()
+    calls = metrics.Counter("test_calls_total", "Calls.", ("endpoint",), registry=registry)
+    seconds = metrics.Histogram("test_seconds", "Seconds.", ("stage",), buckets=(0.1, 1), registry=registry)
+    calls.inc(endpoint="search/tweets")
+    calls.inc(2, endpoint="search/tweets")
+    seconds.observe(0.5, stage="search_page")
+    seconds.observe(5, stage="search_page")
+    with seconds.time(stage="classify"):
+        pass
+    assert calls.value(endpoint="search/tweets") == 3 and seconds.count(stage="search_page") == 2
+    text = registry.render()
+    assert 'test_calls_total{endpoint="search/tweets"} 3' in text
+    assert 'test_seconds_bucket{stage="search_page",le="1"} 1' in text
+    assert 'test_seconds_bucket{stage="search_page",le="+Inf"} 2' in text
+    assert 'test_seconds_sum{stage="search_page"} 5.5' in text
+    path = str(tmp_path / "contestbot.prom")
+    metrics.write_textfile(path, registry)
+    assert open(path).read() == text
+    server = metrics.start_http_server(0, registry=registry)
+    try:
+        assert urlopen(f'http://127.0.0.1:{server.server_address[1]}/metrics').read().decode() == text
+    finally:
+        server.shutdown()
+
+
+def test_rotating_log(tmp_path, monkeypatch):
+    import gzip
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(config, "log_max_bytes", 2000)
+    monkeypatch.setattr(config, "log_backup_count", 2)
+    monkeypatch.setattr(config, "level", 2)
+    logger = ContestBot.initialize_logger()
+    try:
+        for number in range(100):
+            logger.info("log line %s", number)
+        logger.debug("not formatted %s", object())
+    finally:
+        ContestBot.stop_logger()
+    assert (tmp_path / "ContestBot.log").stat().st_size <= 2000
+    with gzip.open(str(tmp_path / "ContestBot.log.1.gz"), "rt") as file:
+        assert "log line" in file.read()
+    assert not (tmp_path / "ContestBot.log.3.gz").exists()
+
+
+def test_contest_queue():
+    from datetime import datetime, timedelta
+    from ranking import ContestQueue, parse_deadline
+    from records import TweetRecord
+
+    now = datetime(2021, 3, 10, 12)  # a wednesday
+    assert parse_deadline("rt to win, ends friday!", now) == datetime(2021, 3, 12, 23, 59, 59)
+    assert parse_deadline("giveaway closes on march 14th", now) == datetime(2021, 3, 14, 23, 59, 59)
+    assert parse_deadline("winner picked tomorrow", now) == datetime(2021, 3, 11, 23, 59, 59)
+    assert parse_deadline("only 5 hours left", now) == now + timedelta(hours=5)
+    assert parse_deadline("ends 13/45", now) is None and parse_deadline("rt to win", now) is None
+
+    def make_tweet(tweet_id, followers, text="rt to win", hours_old=1):
+        return TweetRecord(tweet_id, tweet_id, text, "brand", "brand", created_at=now - timedelta(hours=hours_old),
+                           followers_count=followers)
+
+    dropped = []
+    contest_queue = ContestQueue(maxsize=3, weights={"followers": 1.0, "deadline": 10.0}, max_age_hours=24,
+                                 on_drop=lambda tweet, reason: dropped.append((tweet.id, reason)))
+    actions = {"retweet": True}
+    assert contest_queue.push(make_tweet(1, 10), actions, now)
+    assert contest_queue.push(make_tweet(2, 100000), actions, now)
+    assert contest_queue.push(make_tweet(3, 1000, "rt to win, ends today"), actions, now)
+    assert not contest_queue.push(make_tweet(4, 100, hours_old=30), actions, now)
+    # full, the lowest score is evicted
+    assert contest_queue.push(make_tweet(5, 1000), actions, now)
+    assert dropped == [(4, "expired"), (1, "evicted")]
+    assert [contest_queue.pop(now)[0].id for _ in range(3)] == [3, 2, 5]
+    assert contest_queue.pop(now) is None and len(contest_queue) == 0
+
+
+def test_settings(logger, tmp_path, monkeypatch):
+    import os
+    import shutil
+    from settings import Settings, SettingsWatcher, load_module
+
+    path = str(tmp_path / "config.py")
+    shutil.copy(config.__file__, path)
+    module = load_module(path)
+    module.sleep_multiplier = 2
+    module.like_keywords = ["LIKE", "Fav"]
+    settings = Settings.from_module(module)
+    assert settings.sleep_per_action == tuple(2 * sleep_time for sleep_time in config.sleep_per_action)
+    assert settings.like_keywords == frozenset(["like", "fav"])
+    with pytest.raises(AttributeError):
+        settings.retweet = False
+
+    # check_config needs authentication settings, load the edited file without it
+    def load(logger, module):
+        return Settings.from_module(module)
+
+    watcher = SettingsWatcher(logger, settings, load, path)
+    assert watcher.poll() is settings
+    with open(path, "a") as file:
+        file.write('\nsearch_keywords = ["Win"]\n')
+    os.utime(path, ns=(0, 1))
+    reloaded = watcher.poll()
+    assert reloaded is not settings and reloaded.search_keywords == ("win",)
+    with open(path, "a") as file:
+        file.write('\nthis is not python\n')
+    os.utime(path, ns=(0, 2))
+    assert watcher.poll() is reloaded